@@ -0,0 +1,97 @@
+# adaptive_averaging.py
+
+"""
+Description: Sequential frame averaging for focus sweeps. Frames are acquired at a position only
+until the focus scores are known with the required precision.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+
+
+class RunningStats():
+    """
+    Streaming mean and variance (Welford's algorithm) of vectors of scores.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, x):
+        x = np.asarray(x, dtype=float)
+        self.n += 1
+        if self.mean is None:
+            self.mean = x.copy()
+            self.m2 = np.zeros_like(x)
+            return
+        delta = x - self.mean
+        self.mean += delta/self.n
+        self.m2 += delta*(x - self.mean)
+
+    @property
+    def variance(self):
+        if self.n < 2:
+            return np.full_like(self.mean, np.inf)
+        return self.m2/(self.n - 1)
+
+    @property
+    def std_error(self):
+        return np.sqrt(self.variance/self.n)
+
+
+class AdaptiveAveraging():
+    """
+    Decides how many frames to average at each sweep position.
+
+    Each frame is scored on its own and the scores are averaged. After min_frames,
+    acquisition stops once the relative standard error (standard error over mean)
+    of every ROI that is near its peak is below target_se. A ROI is near its peak
+    when its mean score is significantly above the lowest score seen so far and
+    within peak_fraction of the highest one, measured from that lowest score, and
+    the curve has a peak at all: the highest score is at least contrast times the
+    lowest (before that the highest score is a bump of the noise floor). Away from
+    the peaks min_frames are enough. No more than max_frames are taken per position.
+
+    The camera should return single frames (num_frames/n_frames = 1).
+    """
+
+    def __init__(self, min_frames=2, max_frames=20, target_se=0.02, peak_fraction=0.5, contrast=2.0):
+        assert 2 <= min_frames <= max_frames
+        self.min_frames = min_frames
+        self.max_frames = max_frames
+        self.target_se = target_se
+        self.peak_fraction = peak_fraction
+        self.contrast = contrast
+        self.frames_per_step = []
+
+    def is_done(self, stats, low, high):
+        if stats.n >= self.max_frames:
+            return True
+        if stats.n < self.min_frames:
+            return False
+        if low is None:
+            return True
+        above = stats.mean - low
+        highest = np.maximum(high, stats.mean)
+        height = highest - low
+        near_peak = (above > 3*stats.std_error) & (above >= self.peak_fraction*height) & (highest >= self.contrast*low)
+        precise = stats.std_error <= self.target_se*np.abs(stats.mean)
+        return bool(np.all(precise | ~near_peak))
+
+    def measure(self, grab, low=None, high=None):
+        """
+        grab: callable returning the scores of a new frame (one per ROI).
+        low, high: lowest and highest mean scores seen so far for each ROI
+        (None at the first position of a sweep).
+        Returns the mean scores, their standard errors and the number of frames used.
+        """
+        stats = RunningStats()
+        while True:
+            stats.update(grab())
+            if self.is_done(stats, low, high):
+                break
+        self.frames_per_step.append(stats.n)
+        return stats.mean, stats.std_error, stats.n
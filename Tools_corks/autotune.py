@@ -0,0 +1,173 @@
+# autotune.py
+
+"""
+Description: Tuning of the focus metric parameters (blur, ROI sizes, patch offset, peak fitting) over
+archived sweeps, by grid search or Bayesian optimization, with the Pareto front of accuracy against
+compute time per cork.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import os
+import json
+import time
+import itertools
+
+from reanalysis import DEFAULT_PARAMS, ReanalysisEngine, load_stack, params_rois, filtered_frame
+from peak_fit import locate_peaks, interpolate_peak
+from journal import write_json, config_key
+
+
+def depth_accuracy(results):
+    """
+    Accuracy (um) of the depths of the corks: rms error when every archive has its true
+    depth, otherwise the pooled standard deviation of the repeated sweeps of each cork
+    (same cork_id). nan when neither is available.
+    """
+    errors = np.array([result['error'] for result in results])
+    if np.all(np.isfinite(errors)):
+        return float(np.sqrt(np.mean(errors**2)))
+    groups = {}
+    for result in results:
+        groups.setdefault(str(result['cork_id']), []).append(result['depth'])
+    variances = [np.var(depths, ddof = 1) for depths in groups.values() if len(depths) > 1]
+    return float(np.sqrt(np.mean(variances))) if variances else np.nan
+
+
+def compute_time(frames, positions, params, rois, n_frames=5, n_repeats=3):
+    """
+    Compute time (s) of one cork measured with params, as in a live sweep: filtering
+    of the union of the ROIs and scores of every frame (timed on n_frames of frames,
+    best of n_repeats, scaled to all the frames) plus the peak location.
+    """
+    rois = np.asarray(rois)
+    y0, y1, x0, x1 = rois[:, 0].min(), rois[:, 1].max(), rois[:, 2].min(), rois[:, 3].max()
+    sample = [np.ascontiguousarray(frame[y0:y1, x0:x1]) for frame in frames[:n_frames]]
+    local = rois - np.array([y0, y0, x0, x0])
+    best = np.inf
+    for _ in range(n_repeats):
+        t_start = time.perf_counter()
+        for frame in sample:
+            filtered = filtered_frame(frame, params['blur'], params['metric'])
+            for r0, r1, c0, c1 in local:
+                window = filtered[r0:r1, c0:c1]
+                window.var() if params['metric'] == 'laplacian' else window.mean()
+        best = min(best, time.perf_counter() - t_start)
+    scoring = best/len(sample)*len(frames)
+
+    scores = np.random.default_rng(0).random((len(positions), len(rois)))
+    t_start = time.perf_counter()
+    if params['peak_method'] == 'interpolate':
+        interpolate_peak(positions, scores.T, params['window_size'], params['n_points'])
+    elif params['peak_method'] is not None:
+        locate_peaks(positions, scores, method = params['peak_method'])
+    return scoring + time.perf_counter() - t_start
+
+
+class ParameterTuner():
+    """
+    Evaluates parameter sets (see reanalysis.DEFAULT_PARAMS: blur, metric, hole_size,
+    patch_size, patch_offset, peak_method, window_size, n_points) over the archived
+    sweeps in folders, each by:
+    -> accuracy_um: depth_accuracy of the re-analysed corks (true depths, or the
+    repeatability of repeated sweeps of the same corks);
+    -> compute_time: compute_time per cork, timed on the first archive.
+
+    The re-analysis runs on a ReanalysisEngine (n_workers processes, filtered stacks
+    cached in cache_dir). Every evaluation is memoized by its parameters and its
+    corpus (the sorted absolute paths of folders), in memory and in memo_path (json)
+    when given, so grid searches, optimizations and later runs on the same corpus only
+    evaluate new parameter sets; a memo file can be shared by several corpora. pareto
+    gives the sets of the corpus not beaten at the same time in accuracy and in compute
+    time by any other evaluated set.
+    """
+
+    def __init__(self, folders, n_workers=None, cache_dir=None, memo_path=None):
+        self.folders = list(folders)
+        self.corpus = sorted(os.path.abspath(os.path.normpath(folder)) for folder in self.folders)
+        self.engine = ReanalysisEngine(self.folders, n_workers, cache_dir)
+        self.memo_path = memo_path
+        self.memo = {}
+        if memo_path is not None and os.path.exists(memo_path):
+            with open(memo_path) as file:
+                for record in json.load(file):
+                    if 'folders' in record:
+                        self.memo[self._key(record['params'], record['folders'])] = record
+        self._reference = None
+
+    def _key(self, params, folders=None):
+        return config_key({'params': params, 'folders': self.corpus if folders is None else folders})
+
+    def _compute_time(self, params):
+        if self._reference is None:
+            self._reference = load_stack(self.folders[0])
+        frames, positions, meta = self._reference
+        return compute_time(frames, positions, params, params_rois(params, meta, frames.shape[1:]))
+
+    def evaluate(self, params_list):
+        """
+        Records (params, accuracy_um, compute_time, summary) of every parameter set.
+        """
+        params_list = [dict(DEFAULT_PARAMS, **params) for params in params_list]
+        todo = []
+        for params in params_list:
+            if self._key(params) not in self.memo and params not in todo:
+                todo.append(params)
+        if todo:
+            for run in self.engine.run(todo):
+                record = {'params': run['params'],
+                          'folders': self.corpus,
+                          'accuracy_um': depth_accuracy(run['results']),
+                          'compute_time': self._compute_time(run['params']),
+                          'summary': run['summary']}
+                self.memo[self._key(run['params'])] = record
+            if self.memo_path is not None:
+                write_json(self.memo_path, list(self.memo.values()))
+        return [self.memo[self._key(params)] for params in params_list]
+
+    def grid(self, **values):
+        """
+        Evaluates every combination of values, e.g. grid(blur = [3, 5, 7], hole_size = [30, 50]).
+        """
+        keys = list(values)
+        return self.evaluate([dict(zip(keys, combination))
+                              for combination in itertools.product(*[values[key] for key in keys])])
+
+    def bayesian(self, space, n_calls=30, time_weight=0.0, seed=0, **fixed):
+        """
+        Bayesian optimization (Gaussian process, scikit-optimize) of accuracy_um +
+        time_weight*compute_time (um per second of compute). space: name -> list of
+        values (categorical, e.g. the odd blur sizes) or (low, high) integer range.
+        Returns the best record; every evaluation also enters the Pareto front.
+        """
+        from skopt import gp_minimize
+        from skopt.space import Categorical, Integer
+
+        names = list(space)
+        dimensions = [Categorical(space[name], name = name) if isinstance(space[name], list)
+                      else Integer(*space[name], name = name) for name in names]
+
+        def objective(values):
+            params = dict(fixed, **{name: value.item() if isinstance(value, np.generic) else value
+                                    for name, value in zip(names, values)})
+            record = self.evaluate([params])[0]
+            cost = record['accuracy_um'] + time_weight*record['compute_time']
+            return cost if np.isfinite(cost) else 1E6
+
+        optimization = gp_minimize(objective, dimensions, n_calls = n_calls, random_state = seed)
+        params = dict(fixed, **dict(zip(names, optimization.x)))
+        return self.evaluate([params])[0]
+
+    def pareto(self):
+        """
+        Evaluated records of the corpus on the Pareto front of (compute_time, accuracy_um),
+        sorted by compute time.
+        """
+        records = [record for record in self.memo.values()
+                   if record['folders'] == self.corpus and np.isfinite(record['accuracy_um'])]
+        front = []
+        for record in sorted(records, key = lambda record: (record['compute_time'], record['accuracy_um'])):
+            if not front or record['accuracy_um'] < front[-1]['accuracy_um']:
+                front.append(record)
+        return front
@@ -0,0 +1,271 @@
+# batch.py
+
+"""
+Description: Unattended measurement of a tray of corks: ordering of the corks to reduce the stage
+travel, XY moves between corks, checkpointing and throughput report.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import os
+import time
+
+from focus_search import STAGE_SCALE
+from journal import Journal, to_json, write_json
+from tracing import tracer, PhaseSummary
+
+
+def move_times(points, velocities):
+    """
+    Matrix of the times to move between points (n, n_axes), in um, with the axes moving
+    at the same time at velocities (um/s): the slowest axis sets the time.
+    """
+    points = np.asarray(points, dtype=float)
+    return np.max(np.abs(points[:, None, :] - points[None, :, :])/np.asarray(velocities, dtype=float), axis = -1)
+
+
+def path_cost(costs, order):
+    order = list(order)
+    return float(sum(costs[a, b] for a, b in zip(order[:-1], order[1:])))
+
+
+def _two_opt(order, costs):
+    """
+    One pass of 2-opt moves (segment reversals) on order, in place. Returns True if
+    the path was shortened.
+    """
+    n = len(order) - 1
+    improved = False
+    for i in range(1, n):
+        # Reversing order[i:j + 1] replaces the edges (i - 1, i) and (j, j + 1)
+        j = np.arange(i + 1, n + 1)
+        before = costs[order[i - 1], order[i]] + np.append(costs[order[j[:-1]], order[j[:-1] + 1]], 0)
+        after = costs[order[i - 1], order[j]] + np.append(costs[order[i], order[j[:-1] + 1]], 0)
+        gain = before - after
+        best = int(np.argmax(gain))
+        if gain[best] > 1E-9:
+            order[i:j[best] + 1] = order[i:j[best] + 1][::-1]
+            improved = True
+    return improved
+
+
+def _or_opt(order, costs, max_length=3):
+    """
+    One pass of or-opt moves on order: segments of up to max_length points are moved
+    (possibly reversed) to where they shorten the path the most. Returns the new order
+    and True if the path was shortened.
+    """
+    improved = False
+    for length in range(1, max_length + 1):
+        i = 1
+        while i + length <= len(order):
+            segment = order[i:i + length]
+            rest = np.concatenate([order[:i], order[i + length:]])
+            removed = costs[order[i - 1], segment[0]]
+            if i + length < len(order):
+                removed += costs[segment[-1], order[i + length]] - costs[order[i - 1], order[i + length]]
+            # Insertion after rest[k]: between rest[k] and rest[k + 1], or at the end
+            last = np.arange(len(rest)) == len(rest) - 1
+            following = np.append(rest[1:], rest[-1])
+            for inserted in (segment, segment[::-1]):
+                added = costs[rest, inserted[0]] + np.where(last, 0, costs[inserted[-1], following] - costs[rest, following])
+                k = int(np.argmin(added))
+                if removed - added[k] > 1E-9:
+                    order = np.concatenate([rest[:k + 1], inserted, rest[k + 1:]])
+                    improved = True
+                    break
+            i += 1
+    return order, improved
+
+
+def plan_order(points, start=None, velocities=None, max_passes=50):
+    """
+    Order of visit of points (n, n_axes) starting next to start (the current position),
+    found with the nearest neighbour heuristic improved with 2-opt and or-opt moves
+    (open path). Returns the indexes of the points in the order of visit.
+    """
+    points = np.asarray(points, dtype=float)
+    n = len(points)
+    velocities = np.ones(points.shape[1]) if velocities is None else velocities
+    start = points[0] if start is None else np.asarray(start, dtype=float)
+    # Node n is the start position, it stays first
+    costs = move_times(np.vstack([points, start]), velocities)
+
+    order = [n]
+    left = set(range(n))
+    while left:
+        nearest = min(left, key = lambda i: costs[order[-1], i])
+        order.append(nearest)
+        left.remove(nearest)
+    order = np.array(order)
+
+    for _ in range(max_passes):
+        improved = _two_opt(order, costs)
+        order, moved = _or_opt(order, costs)
+        if not (improved or moved):
+            break
+    return order[1:]
+
+
+class BatchScheduler():
+    """
+    Measures a tray of corks with a CorkMeter, moving between corks with the x and y
+    stages (KinesisMotor like objects, positions in um times xy_scale).
+
+    -> positions: (n, 2) x, y of each cork in um, or (n, 3) with the expected z of each
+    cork (um from the meter origin, e.g. from a tilted tray) so that the ordering also
+    reduces the z travel;
+    -> rois: windows of each cork (detected with the meter's detector if None);
+    -> velocities: um/s of each axis, used to weight the axes in the ordering;
+    -> checkpoint_path: json file rewritten (atomically) after each cork with the
+    summary of the results so far;
+    -> journal_path: journal.Journal where the full result of each cork (focus curves
+    included) is appended as soon as it is measured. Running again with the same
+    journal skips the corks already in it, so an interrupted run resumes where it stopped.
+    The z origin of the batch is kept in the journal and restored on resume (the stage
+    is then wherever the interruption left it); a journal with corks but without
+    origin cannot be resumed;
+    -> trace_dir: folder where the trace of each cork (tracing.tracer spans, Chrome trace
+    json) is written as cork_<id>.json; report then includes the time per phase over
+    the batch.
+
+    The corks are measured in the order given by plan_order (in the given order if
+    optimize=False). report gives the throughput and where the time went.
+    """
+
+    def __init__(self, meter, x_stage, y_stage, positions, rois=None, ids=None,
+                 xy_scale=STAGE_SCALE, velocities=None, optimize=True, checkpoint_path=None,
+                 journal_path=None, trace_dir=None):
+        self.meter = meter
+        self.x_stage = x_stage
+        self.y_stage = y_stage
+        self.positions = np.asarray(positions, dtype=float)
+        self.rois = [None]*len(self.positions) if rois is None else rois
+        self.ids = list(range(len(self.positions))) if ids is None else list(ids)
+        self.xy_scale = xy_scale
+        self.velocities = velocities
+        self.checkpoint_path = checkpoint_path
+        self.trace_dir = trace_dir
+        self.phases = PhaseSummary()
+        self.journal = None if journal_path is None else Journal(journal_path, self.config())
+
+        if optimize:
+            self.order = plan_order(self.positions, self.current_position(), velocities)
+        else:
+            self.order = np.arange(len(self.positions))
+        self.records = []
+        self.n_resumed = 0
+        self.xy_motion_time = 0.0
+        self.xy_travel_um = 0.0
+        self.t_start = None
+
+    def config(self):
+        return {'meter': self.meter.config(),
+                'positions': self.positions,
+                'ids': self.ids,
+                'rois': self.rois,
+                'xy_scale': self.xy_scale}
+
+    def current_position(self):
+        xy = [self.x_stage.get_position(scale = False)/self.xy_scale,
+              self.y_stage.get_position(scale = False)/self.xy_scale]
+        if self.positions.shape[1] > 2:
+            xy.append(self.meter.current_z())
+        return np.array(xy)
+
+    def move_xy(self, x_um, y_um):
+        """
+        Moves both axes at the same time and waits for both.
+        """
+        t_start = time.perf_counter()
+        previous = self.current_position()[:2]
+        self.x_stage.move_to(x_um*self.xy_scale, scale = False)
+        self.y_stage.move_to(y_um*self.xy_scale, scale = False)
+        self.x_stage.wait_move()
+        self.y_stage.wait_move()
+        self.xy_travel_um += float(np.abs(np.array([x_um, y_um]) - previous).sum())
+        self.xy_motion_time += time.perf_counter() - t_start
+
+    def measure_cork(self, index):
+        x_um, y_um = self.positions[index, :2]
+        if self.trace_dir is not None:
+            # Spans from before this cork do not belong to its trace
+            tracer.collect()
+        with tracer.span('cork', id = self.ids[index]):
+            with tracer.span('xy_move'):
+                self.move_xy(x_um, y_um)
+            result = self.meter.measure(self.rois[index])
+        if self.trace_dir is not None:
+            events = tracer.write(os.path.join(self.trace_dir, 'cork_' + str(self.ids[index]) + '.json'),
+                                  id = self.ids[index], depth = result['depth'])
+            self.phases.update(events)
+        record = {'id': self.ids[index],
+                  'x_um': x_um,
+                  'y_um': y_um,
+                  'focus_hole': result['focus_hole'],
+                  'focus_patch': result['focus_patch'],
+                  'depth': result['depth'],
+                  'n_frames': result['n_frames'],
+                  'wall_time': result['wall_time'],
+                  'timings': result['timings']}
+        self.records.append(to_json(record))
+        if self.journal is not None:
+            self.journal.append(self.ids[index], result, x_um = x_um, y_um = y_um)
+        return result
+
+    def checkpoint(self):
+        if self.checkpoint_path is None:
+            return
+        write_json(self.checkpoint_path, {'order': self.order,
+                                          'records': self.records,
+                                          'report': self.report()})
+
+    def run(self):
+        """
+        Measures all the corks in order, checkpointing after each one, except the ones
+        already in the journal. Returns the records of the corks measured in this run.
+        """
+        completed = set() if self.journal is None else self.journal.completed()
+        self.n_resumed = len(completed)
+        if self.journal is not None and self.journal.origin is not None:
+            self.meter.reset_batch(self.journal.origin)
+        elif completed:
+            raise ValueError("The journal " + self.journal.path + " has no z origin, its corks "
+                             "cannot be resumed in the same z frame.")
+        else:
+            self.meter.reset_batch()
+            if self.journal is not None:
+                self.journal.set_origin(self.meter.origin)
+        if self.meter.warm_start is not None and self.journal is not None:
+            # The lot estimate continues from the corks measured before the interruption
+            for result in self.journal.results().values():
+                self.meter.warm_start.update(result)
+        self.t_start = time.perf_counter()
+        for index in self.order:
+            if to_json(self.ids[index]) in completed:
+                continue
+            self.measure_cork(index)
+            self.checkpoint()
+        return self.records
+
+    def report(self):
+        """
+        Throughput and time breakdown (s) of the corks measured so far: motion (xy moves and
+        z moves), settle, acquire, compute (focus scores and ROI detection) and other.
+        """
+        n_corks = len(self.records)
+        wall_time = 0.0 if self.t_start is None else time.perf_counter() - self.t_start
+        timings = {key: sum(record['timings'][key] for record in self.records)
+                   for key in ('motion', 'settle', 'acquire', 'compute')}
+        timings['motion'] += self.xy_motion_time
+        timings['other'] = max(wall_time - sum(timings.values()), 0.0)
+        return {'n_corks': n_corks,
+                'n_resumed': self.n_resumed,
+                'wall_time': wall_time,
+                'corks_per_hour': 3600*n_corks/wall_time if wall_time > 0 else 0.0,
+                'xy_travel_um': self.xy_travel_um,
+                'z_travel_um': float(sum(result['travel_um'] for result in self.meter.results)),
+                'timings': timings,
+                'fractions': {key: value/wall_time if wall_time > 0 else 0.0 for key, value in timings.items()},
+                'phases': self.phases.report()}
@@ -0,0 +1,227 @@
+# benchmark.py
+
+"""
+Description: End to end benchmark of the depth measurement on synthetic corks of known depth, with
+the simulated stage and camera timing: depth error, wall time, frames and CPU time per configuration,
+kept in a history file to detect regressions.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import json
+import os
+import time
+import itertools
+
+from focus_search import STAGE_SCALE, square_roi
+from cork_meter import CorkMeter
+from peak_fit import interpolate_peak
+from journal import to_json, config_key
+from simulation import SimulatedStage, SimulatedCamera
+
+
+DEFAULT_CONFIG = {'strategy': 'sweep',
+                  'um_step': 15,
+                  'blur': 5,
+                  'peak_method': None,
+                  'window_size': 5,
+                  'hole_size': 50,
+                  'patch_size': 200,
+                  'patch_offset': 300,
+                  'settle_time': 0.05}
+
+
+def make_cork(rng, shape=(1200, 1600), depth_range=(150, 350), surface_range=(100, 200),
+              hole_radius=60, patch_size=200, patch_offset=300):
+    """
+    Random synthetic cork: surface focus, hole depth and hole center (placed so that
+    the patch window above the hole stays inside the frame).
+    """
+    margin = max(hole_radius, patch_size//2)
+    return {'surface_focus_um': float(rng.uniform(*surface_range)),
+            'hole_depth_um': float(rng.uniform(*depth_range)),
+            'hole_center': (int(rng.integers(margin, shape[1] - margin)),
+                            int(rng.integers(patch_offset + patch_size//2, shape[0] - margin))),
+            'hole_radius': hole_radius,
+            'seed': int(rng.integers(2**31))}
+
+
+def parameter_grid(**values):
+    """
+    Configurations (DEFAULT_CONFIG updated) of every combination of values, e.g.
+    parameter_grid(um_step = [5, 10, 15], blur = [3, 5]).
+    """
+    keys = list(values)
+    return [dict(DEFAULT_CONFIG, **dict(zip(keys, combination)))
+            for combination in itertools.product(*[values[key] for key in keys])]
+
+
+class Benchmark():
+    """
+    Measures n_corks synthetic corks (the same ones for every configuration, drawn
+    with seed) with a CorkMeter on SimulatedStage and SimulatedCamera. The wall time,
+    acquire time and CPU time of a cork are the ones of the measurement pipeline: the
+    time the simulated camera spends synthesizing the frames (all grabbed in the
+    acquire phase) is subtracted and reported apart (simulation_time,
+    simulation_cpu_time).
+
+    A configuration is a dictionary with:
+    -> strategy, um_step (sweep) or precision_um/coarse_step (other strategies);
+    -> blur, settle_time and any other FocusSearch option under focus_options;
+    -> peak_method: a peak_fit method, or 'interpolate' for the notebooks' moving
+    average + interpolation (with window_size) applied to the measured curves;
+    -> hole_size, patch_size, patch_offset: ROI geometry around the true hole center.
+
+    -> camera_options, stage_options: keyword arguments of SimulatedCamera and
+    SimulatedStage (e.g. blur_per_um, noise, exposure, max_velocity, backlash);
+    -> history_path: json lines file where every run appends its summaries. run
+    compares each summary with the last one of the same configuration and the same
+    corks, and reports the regressions: depth rms error up by more than error_tolerance
+    (relative, at least error_floor_um) or time per cork up by more than time_tolerance.
+    """
+
+    def __init__(self, n_corks=5, seed=0, shape=(1200, 1600), depth_um=700, camera_options=None,
+                 stage_options=None, cork_options=None, history_path=None, error_tolerance=0.2,
+                 error_floor_um=0.5, time_tolerance=0.2):
+        self.n_corks = n_corks
+        self.seed = seed
+        self.shape = shape
+        self.depth_um = depth_um
+        self.camera_options = {} if camera_options is None else camera_options
+        self.stage_options = {} if stage_options is None else stage_options
+        self.cork_options = {} if cork_options is None else cork_options
+        self.history_path = history_path
+        self.error_tolerance = error_tolerance
+        self.error_floor_um = error_floor_um
+        self.time_tolerance = time_tolerance
+
+    def setup(self):
+        """
+        Settings shared by all the configurations, part of the history key.
+        """
+        return {'n_corks': self.n_corks,
+                'seed': self.seed,
+                'shape': self.shape,
+                'depth_um': self.depth_um,
+                'camera_options': self.camera_options,
+                'stage_options': self.stage_options,
+                'cork_options': self.cork_options}
+
+    def corks(self, config):
+        rng = np.random.default_rng(self.seed)
+        return [make_cork(rng, self.shape, patch_size = config['patch_size'],
+                          patch_offset = config['patch_offset'], **self.cork_options)
+                for _ in range(self.n_corks)]
+
+    def measure_cork(self, config, cork):
+        stage = SimulatedStage(**self.stage_options)
+        camera = SimulatedCamera(stage, shape = self.shape, hole_center = cork['hole_center'],
+                                 hole_radius = cork['hole_radius'], surface_focus_um = cork['surface_focus_um'],
+                                 hole_depth_um = cork['hole_depth_um'], seed = cork['seed'], **self.camera_options)
+        cx, cy = cork['hole_center']
+        rois = [square_roi(cx, cy, config['hole_size']),
+                square_roi(cx, cy, config['patch_size'], offset = config['patch_offset'])]
+
+        interpolate = config['peak_method'] == 'interpolate'
+        if config['strategy'] == 'sweep':
+            search_options = {'um_step': config['um_step']}
+        else:
+            search_options = {key: config[key] for key in ('precision_um', 'coarse_step') if key in config}
+        meter = CorkMeter(stage, camera, self.depth_um, config['strategy'], search_options,
+                          serpentine = False, scale = STAGE_SCALE, blur = config['blur'],
+                          settle_time = config['settle_time'],
+                          peak_method = None if interpolate else config['peak_method'],
+                          **config.get('focus_options', {}))
+
+        t_start, cpu_start = time.perf_counter(), time.process_time()
+        result = meter.measure(rois)
+        depth = result['depth']
+        if interpolate:
+            focus = interpolate_peak(result['positions'], result['scores'].T, config['window_size'])
+            depth = abs(focus[0] - focus[1])
+        cpu_time = time.process_time() - cpu_start
+        wall_time = time.perf_counter() - t_start
+        timings = dict(result['timings'])
+        timings['acquire'] = max(timings['acquire'] - camera.render_time, 0.0)
+        return {'true_depth': cork['hole_depth_um'],
+                'depth': float(depth),
+                'error': float(depth - cork['hole_depth_um']),
+                'wall_time': wall_time - camera.render_time,
+                'cpu_time': cpu_time - camera.cpu_time,
+                'simulation_time': camera.render_time,
+                'simulation_cpu_time': camera.cpu_time,
+                'n_frames': result['n_frames'],
+                'n_moves': result['n_moves'],
+                'travel_um': result['travel_um'],
+                'timings': timings}
+
+    def run_config(self, config):
+        """
+        Measures all the corks with config. Returns the records of the corks and the summary.
+        """
+        config = dict(DEFAULT_CONFIG, **config)
+        records = [self.measure_cork(config, cork) for cork in self.corks(config)]
+        errors = np.array([record['error'] for record in records])
+        wall_times = np.array([record['wall_time'] for record in records])
+        summary = {'bias_um': float(errors.mean()),
+                   'rms_um': float(np.sqrt(np.mean(errors**2))),
+                   'max_um': float(np.abs(errors).max()),
+                   'time_per_cork': float(wall_times.mean()),
+                   'time_p95': float(np.percentile(wall_times, 95)),
+                   'cpu_per_cork': float(np.mean([record['cpu_time'] for record in records])),
+                   'simulation_time_per_cork': float(np.mean([record['simulation_time'] for record in records])),
+                   'simulation_cpu_per_cork': float(np.mean([record['simulation_cpu_time'] for record in records])),
+                   'frames_per_cork': float(np.mean([record['n_frames'] for record in records])),
+                   'timings': {key: float(np.mean([record['timings'][key] for record in records]))
+                               for key in records[0]['timings']}}
+        return records, summary
+
+    def history(self):
+        """
+        Entries of the history file, oldest first.
+        """
+        if self.history_path is None or not os.path.exists(self.history_path):
+            return []
+        with open(self.history_path) as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    def compare(self, summary, previous):
+        """
+        Regressions of summary with respect to the previous summary of the same configuration.
+        """
+        regressions = []
+        error_limit = max(previous['rms_um']*(1 + self.error_tolerance), previous['rms_um'] + self.error_floor_um)
+        if summary['rms_um'] > error_limit:
+            regressions.append(('rms_um', previous['rms_um'], summary['rms_um']))
+        if summary['time_per_cork'] > previous['time_per_cork']*(1 + self.time_tolerance):
+            regressions.append(('time_per_cork', previous['time_per_cork'], summary['time_per_cork']))
+        return regressions
+
+    def run(self, configs, label=None):
+        """
+        Runs every configuration, appends the summaries to the history and compares them
+        with the previous ones. Returns a list with config, summary, records and
+        regressions (list of (metric, previous, current)) for each configuration.
+        """
+        previous = {}
+        for entry in self.history():
+            previous[entry['key']] = entry['summary']
+
+        results = []
+        for config in configs:
+            config = dict(DEFAULT_CONFIG, **config)
+            key = config_key({'config': config, 'setup': self.setup()})
+            records, summary = self.run_config(config)
+            regressions = self.compare(summary, previous[key]) if key in previous else []
+            for metric, before, now in regressions:
+                print("WARNING: regression of " + metric + " (" + str(round(before, 3)) + " -> "
+                      + str(round(now, 3)) + ") for " + json.dumps(to_json(config)))
+            if self.history_path is not None:
+                entry = {'key': key, 'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'label': label,
+                         'config': config, 'setup': self.setup(), 'summary': summary}
+                with open(self.history_path, 'a') as file:
+                    file.write(json.dumps(to_json(entry)) + '\n')
+            results.append({'config': config, 'summary': summary, 'records': records, 'regressions': regressions})
+        return results
+
@@ -0,0 +1,78 @@
+# binning.py
+
+"""
+Description: Switching between binned (coarse) and full resolution frames during focus searches,
+with on-sensor binning when the camera supports it and a software pyramid otherwise.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import cv2
+
+
+def pyramid_downsample(image, factor):
+    """
+    Reduces image by factor (a power of 2) with successive cv2.pyrDown.
+    """
+    while factor > 1:
+        image = cv2.pyrDown(image)
+        factor //= 2
+    return image
+
+
+def bin_roi(roi, factor):
+    y0, y1, x0, x1 = roi
+    return (y0//factor, y1//factor, x0//factor, x1//factor)
+
+
+class Binning():
+    """
+    Sets the binning factor of the frames used by a focus search.
+
+    The camera is asked for the factor with set_binning (ThorCam binx/biny, XIMEA
+    downsampling_mode); what it cannot do in hardware (cameras without binning, or
+    factors above its maximum) is done in software with pyramid_downsample, so the
+    frames always come out binned by the requested factor.
+
+    The configuration of each factor (hardware and software parts) is cached after
+    the first switch and the camera is only reprogrammed when the hardware factor
+    changes, so switching between the coarse and the fine passes is cheap.
+
+    Hardware support is probed on the camera itself, as in readout.ReadoutWindow
+    (get_binning raises AttributeError for IDS and OBS cameras): without it the
+    binning is done in software.
+    """
+
+    def __init__(self, camera):
+        self.camera = camera
+        self.configs = {1: (1, 1)}
+        self.factor = 1
+        try:
+            self.hardware_factor = camera.get_binning()
+            self.hardware = True
+        except AttributeError:
+            self.hardware_factor = 1
+            self.hardware = False
+
+    def set(self, factor):
+        """
+        Switches to factor (a power of 2). Returns the software factor left to apply.
+        """
+        if factor not in self.configs:
+            hardware_factor = self.camera.set_binning(factor) if self.hardware else 1
+            self.hardware_factor = hardware_factor
+            self.configs[factor] = (hardware_factor, factor//hardware_factor)
+        hardware_factor, software_factor = self.configs[factor]
+        if self.hardware and hardware_factor != self.hardware_factor:
+            self.hardware_factor = self.camera.set_binning(hardware_factor)
+        self.factor = factor
+        return software_factor
+
+    def frame(self, image):
+        """
+        Applies the software part of the current factor to a camera frame.
+        """
+        return pyramid_downsample(image, self.configs[self.factor][1])
+
+    def rois(self, rois):
+        return [bin_roi(roi, self.factor) for roi in rois]
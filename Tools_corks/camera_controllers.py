@@ -12,6 +12,8 @@ import time
 import cv2
 import ctypes
 
+from tracing import tracer
+
 # TODO add the doctrings to all the methods and classes
 # TODO correct all the types in the methods
 # FIXME add the missiing methods on all the camera objects just for clarity
@@ -45,7 +47,8 @@ class CameraController():
         
     #Get a frame or a the average of a number of frames (the number of frames is specified in the properties)
     def get_image(self) -> np.ndarray:
-        return self.camera.get_image()
+        with tracer.span('camera.get_image', camera = type(self.camera).__name__):
+            return self.camera.get_image()
     
     #Set the camera properties. The propesties should be a dictionary
     def set_properties(self, properties):
@@ -58,6 +61,21 @@ class CameraController():
     def get_properties(self,ret=False):
         return self.camera.get_camera_properties(ret=ret)
     
+    #Hardware readout window (x0, y0, width, height) in sensor pixels. Returns the window actually set,
+    #which can be larger than the requested one to respect the sensor increments
+    def set_readout_window(self, x0, y0, width, height):
+        return self.camera.set_readout_window(x0, y0, width, height)
+    
+    def get_readout_window(self):
+        return self.camera.get_readout_window()
+    
+    #On-sensor binning (factor x factor). Returns the factor actually set
+    def set_binning(self, factor):
+        return self.camera.set_binning(factor)
+    
+    def get_binning(self):
+        return self.camera.get_binning()
+    
     #Disarm the camera, but the camera object continues open
     def stop_camera(self):
         self.camera.stop_camera()
@@ -236,6 +254,41 @@ class ThorCam():
                     }
         
         self.set_properties({'ROI':ROI_dic})
+        
+    def get_readout_window(self):
+        roi = self.camera.roi
+        return (roi.upper_left_x_pixels, roi.upper_left_y_pixels,
+                roi.lower_right_x_pixels - roi.upper_left_x_pixels + 1,
+                roi.lower_right_y_pixels - roi.upper_left_y_pixels + 1)
+    
+    def set_readout_window(self, x0, y0, width, height):
+        # The ROI can only be changed with the camera disarmed
+        armed = self.camera_initialized
+        if armed:
+            self.stop_camera()
+        self.set_properties({'ROI':{"upper_left_x_pixels": x0,
+                                    "upper_left_y_pixels": y0,
+                                    "lower_right_x_pixels": x0 + width - 1,
+                                    "lower_right_y_pixels": y0 + height - 1}})
+        if armed:
+            self.get_camera_ready()
+        return self.get_readout_window()
+    
+    def get_binning(self):
+        return self.camera.binx
+    
+    def set_binning(self, factor):
+        factor = min(factor, self.camera.binx_range.max, self.camera.biny_range.max)
+        if factor == self.camera.binx and factor == self.camera.biny:
+            return factor
+        # Binning can only be changed with the camera disarmed
+        armed = self.camera_initialized
+        if armed:
+            self.stop_camera()
+        self.set_properties({'binx':factor, 'biny':factor})
+        if armed:
+            self.get_camera_ready()
+        return self.get_binning()
        
     def get_camera_properties(self, ret=False):
         print("\n")
@@ -466,6 +519,7 @@ class XimeaCam():
         self.cam.enable_recent_frame() #Guarantee that the camera gives the most recent frame
         
         
+        self.acquiring=False
         self.img=xiapi.Image()
         self.img_width_increment=self.cam.get_width_increment()
         self.img_height_increment=self.cam.get_height_increment()
@@ -614,6 +668,58 @@ class XimeaCam():
                     "image_offsetY":0}
         self.set_properties(properties)
         
+    def get_readout_window(self):
+        return (self.current_params["image_offsetX"], self.current_params["image_offsetY"],
+                self.current_params["image_width"], self.current_params["image_height"])
+    
+    def set_readout_window(self, x0, y0, width, height):
+        #Offsets are rounded down to the increments, so the width and height are enlarged
+        #to keep the requested window inside the readout.
+        #set_properties sets offsetY to (offsetY//img_height_increment)*img_width_increment,
+        #so offsetY is rounded with img_width_increment as there and passed in steps of
+        #img_height_increment, which set_properties turns back into the offset computed here
+        offsetX=(x0//self.img_width_increment)*self.img_width_increment
+        n_offsetY=y0//self.img_width_increment
+        offsetY=n_offsetY*self.img_width_increment
+        width=-(-(width + x0 - offsetX)//self.img_width_increment)*self.img_width_increment
+        height=-(-(height + y0 - offsetY)//self.img_height_increment)*self.img_height_increment
+        
+        acquiring=self.acquiring
+        if acquiring:
+            self.stop_camera()
+        self.set_properties({"image_width":width,
+                             "image_height":height,
+                             "image_offsetX":offsetX,
+                             "image_offsetY":n_offsetY*self.img_height_increment})
+        if acquiring:
+            self.get_camera_ready()
+        return self.get_readout_window()
+    
+    def get_binning(self):
+        return int(self.current_params["downsampling_mode"][-1])
+    
+    def set_binning(self, factor):
+        #XI_DWN_1x1, XI_DWN_2x2, XI_DWN_4x4 (not all supported by every model)
+        current=self.get_binning()
+        if factor==current:
+            return factor
+        #The window is given in downsampled pixels, it is converted to keep the same sensor area
+        x0, y0, width, height=[value*current for value in self.get_readout_window()]
+        
+        acquiring=self.acquiring
+        if acquiring:
+            self.stop_camera()
+        self.cam.set_downsampling_type("XI_BINNING" if factor>1 else "XI_SKIPPING")
+        self.set_properties({"downsampling_mode":"XI_DWN_{}x{}".format(factor, factor)})
+        factor=self.get_binning()
+        self.set_properties({"image_width":width//factor,
+                             "image_height":height//factor,
+                             "image_offsetX":x0//factor,
+                             "image_offsetY":y0//factor})
+        if acquiring:
+            self.get_camera_ready()
+        return factor
+        
        
     def get_camera_properties(self, ret=False):
         print("--------------------------------------------------------------------------")
@@ -664,6 +770,7 @@ class XimeaCam():
         
     def get_camera_ready(self):
         self.cam.start_acquisition()
+        self.acquiring=True
         
     def get_image(self):
         n_blanck=0
@@ -713,6 +820,7 @@ class XimeaCam():
     
     def stop_camera(self):
         self.cam.stop_acquisition()
+        self.acquiring=False
         
     def close(self):
         self.cam.close_device()
@@ -837,6 +945,7 @@ class IdsCam():
 
         self.width = self.rectAOI.s32Width
         self.height = self.rectAOI.s32Height
+        self.capturing = False
 
         gamma_value = self.ueye.uint(int(1*100)) # 1.0*100
         nRet = self.ueye.is_Gamma(self.hCam, self.ueye.IS_GAMMA_CMD_SET, gamma_value, self.ueye.sizeof(gamma_value))
@@ -905,6 +1014,7 @@ class IdsCam():
         if nRet != self.ueye.IS_SUCCESS:
             # print("is_CaptureVideo ERROR")
             pass
+        self.capturing = True
 
         # Enables the queue mode for existing image memory sequences
         self.nRet = self.ueye.is_InquireImageMem(self.hCam, self.pcImageMemory, self.MemID, self.width, self.height, self.nBitsPerPixel, self.pitch)
@@ -938,6 +1048,44 @@ class IdsCam():
         counter = 1
         return np.array(frame)/counter/255.0
     
+    def get_readout_window(self):
+        return (self.rectAOI.s32X.value, self.rectAOI.s32Y.value,
+                self.rectAOI.s32Width.value, self.rectAOI.s32Height.value)
+    
+    def set_readout_window(self, x0, y0, width, height):
+        # Position and size must be multiples of the increments of the sensor
+        pos_inc = self.ueye.IS_POINT_2D()
+        size_inc = self.ueye.IS_SIZE_2D()
+        self.ueye.is_AOI(self.hCam, self.ueye.IS_AOI_IMAGE_GET_POS_INC, pos_inc, self.ueye.sizeof(pos_inc))
+        self.ueye.is_AOI(self.hCam, self.ueye.IS_AOI_IMAGE_GET_SIZE_INC, size_inc, self.ueye.sizeof(size_inc))
+        x_inc, y_inc = max(pos_inc.s32X.value, 1), max(pos_inc.s32Y.value, 1)
+        w_inc, h_inc = max(size_inc.s32Width.value, 1), max(size_inc.s32Height.value, 1)
+        x = (x0//x_inc)*x_inc
+        y = (y0//y_inc)*y_inc
+        
+        # The image memory has the size of the AOI, so it is freed and allocated again
+        capturing = self.capturing
+        if capturing:
+            self.ueye.is_StopLiveVideo(self.hCam, self.ueye.IS_WAIT)
+            self.ueye.is_FreeImageMem(self.hCam, self.pcImageMemory, self.MemID)
+            self.capturing = False
+        
+        rect = self.ueye.IS_RECT()
+        rect.s32X = self.ueye.int(x)
+        rect.s32Y = self.ueye.int(y)
+        rect.s32Width = self.ueye.int(-(-(width + x0 - x)//w_inc)*w_inc)
+        rect.s32Height = self.ueye.int(-(-(height + y0 - y)//h_inc)*h_inc)
+        nRet = self.ueye.is_AOI(self.hCam, self.ueye.IS_AOI_IMAGE_SET_AOI, rect, self.ueye.sizeof(rect))
+        if nRet != self.ueye.IS_SUCCESS:
+            print("is_AOI ERROR")
+        
+        self.ueye.is_AOI(self.hCam, self.ueye.IS_AOI_IMAGE_GET_AOI, self.rectAOI, self.ueye.sizeof(self.rectAOI))
+        self.width = self.rectAOI.s32Width
+        self.height = self.rectAOI.s32Height
+        if capturing:
+            self.get_camera_ready()
+        return self.get_readout_window()
+    
     def stop_camera(self):
         if not self.camera_initialized:
             self.camera_initialized = False
@@ -0,0 +1,235 @@
+# continuous_af.py
+
+"""
+Description: Closed loop continuous autofocus: keeps a region of the image in focus with small
+corrective moves of the stage, e.g. while panning across a tray, without full sweeps.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import time
+import threading
+from collections import deque
+
+from focus_search import STAGE_SCALE, calculate_focus_scores
+
+
+class ContinuousAutofocus():
+    """
+    Focus tracking on roi, one iteration per period of the loop (loop_rate iterations
+    per second at most), either with step or in a background thread (start/stop).
+
+    Methods:
+    -> dither: each iteration scores the frames at center, center + dither_um and
+    center - dither_um and moves the center by gain times the offset of the vertex of
+    the parabola through the log scores, or uphill where they are not concave (away
+    from the peak). The corrections are limited to a step adapted as in hill_climb:
+    halved when the correction reverses (down to min_step_um), grown by 1.5 after two
+    in the same direction (up to max_step_um), so the vertex overshoots on the flat
+    tails of the curve do not turn into a limit cycle around the peak;
+    -> hill_climb: each iteration moves by the current step in the current direction
+    and scores one frame; when the score drops the direction reverses and the step is
+    halved (down to min_step_um); after two improvements in a row it grows by 1.5 (up
+    to max_step_um). It hunts around the peak by min_step_um, set lock_um accordingly.
+
+    Positions are in um from the stage position when the controller was created (or
+    reset), positive towards the cork. limits_um = (low, high) keeps the center inside.
+
+    Every iteration records the loop latency (from the first frame of the iteration to
+    the corrective move issued), the center and the correction; report gives the
+    latency and stability metrics over the last history iterations. The focus is locked
+    when the last n_lock corrections are all within lock_um.
+    """
+
+    def __init__(self, stage, camera, roi, method='dither', dither_um=5.0, gain=0.7,
+                 max_step_um=20.0, min_step_um=1.0, loop_rate=20.0, blur=5, settle_time=0.0,
+                 lock_um=1.0, n_lock=5, limits_um=None, history=1000, scale=STAGE_SCALE):
+        assert method in ('dither', 'hill_climb')
+        self.stage = stage
+        self.camera = camera
+        self.roi = roi
+        self.method = method
+        self.dither_um = dither_um
+        self.gain = gain
+        self.max_step_um = max_step_um
+        self.min_step_um = min_step_um
+        self.loop_rate = loop_rate
+        self.blur = blur
+        self.settle_time = settle_time
+        self.lock_um = lock_um
+        self.n_lock = n_lock
+        self.limits_um = (-np.inf, np.inf) if limits_um is None else limits_um
+        self.history = history
+        self.scale = scale
+        self._thread = None
+        self._stop = threading.Event()
+        self.reset()
+
+    def reset(self):
+        """
+        Makes the current stage position the origin and clears the records.
+        """
+        self.origin = self.stage.get_position(scale = False)
+        self.center = 0.0
+        self.z = 0.0
+        self.direction = 1
+        self.step_um = self.max_step_um
+        self.last_score = None
+        self.n_improved = 0
+        self.n_iterations = 0
+        self.n_frames = 0
+        self.travel_um = 0.0
+        self.latencies = deque(maxlen = self.history)
+        self.periods = deque(maxlen = self.history)
+        self.centers = deque(maxlen = self.history)
+        self.corrections = deque(maxlen = self.history)
+        self.scores = deque(maxlen = self.history)
+        self._t_last = None
+
+    def move_to(self, z_um, t_start=None):
+        """
+        Moves to z_um and waits for the stage. The corrective moves give the start of
+        the iteration (t_start), the latency is taken when the move is commanded.
+        """
+        if z_um != self.z:
+            self.stage.move_to(self.origin + z_um*self.scale, scale = False)
+        if t_start is not None:
+            self.latencies.append(time.perf_counter() - t_start)
+        if z_um == self.z:
+            return
+        self.stage.wait_move()
+        if self.settle_time > 0:
+            time.sleep(self.settle_time)
+        self.travel_um += abs(z_um - self.z)
+        self.z = z_um
+
+    def score(self):
+        frame = (self.camera.get_image()*255).astype(np.uint8)
+        self.n_frames += 1
+        return calculate_focus_scores(frame, [self.roi], self.blur)[0]
+
+    def _dither(self):
+        self.move_to(self.center)
+        scores = [self.score()]
+        for z in (self.center + self.dither_um, self.center - self.dither_um):
+            self.move_to(z)
+            scores.append(self.score())
+        l0, l_plus, l_minus = np.log(np.maximum(scores, 1E-12))
+        curvature = l_plus + l_minus - 2*l0
+        if curvature < 0:
+            correction = self.gain*self.dither_um*(l_plus - l_minus)/(-2*curvature)
+        else:
+            correction = np.sign(l_plus - l_minus)*self.max_step_um
+        direction = np.sign(correction)
+        if direction != 0:
+            self._adapt_step(direction != self.direction)
+            self.direction = direction
+        return float(np.clip(correction, -self.step_um, self.step_um)), scores[0]
+
+    def _adapt_step(self, reversal):
+        """
+        Halves the step after a reversal, grows it after two moves in the same direction.
+        """
+        if reversal:
+            self.step_um = max(self.step_um/2, self.min_step_um)
+            self.n_improved = 0
+        else:
+            self.n_improved += 1
+            if self.n_improved > 1:
+                self.step_um = min(self.step_um*1.5, self.max_step_um)
+
+    def _hill_climb(self):
+        score = self.score()
+        if self.last_score is not None:
+            reversal = score < self.last_score
+            if reversal:
+                self.direction = -self.direction
+            self._adapt_step(reversal)
+        self.last_score = score
+        return self.direction*self.step_um, score
+
+    def step(self):
+        """
+        One iteration of the loop. Returns the correction applied (um).
+        """
+        t_start = time.perf_counter()
+        correction, score = self._dither() if self.method == 'dither' else self._hill_climb()
+        self.center = float(np.clip(self.center + correction, *self.limits_um))
+        self.move_to(self.center, t_start)
+
+        if self._t_last is not None:
+            self.periods.append(t_start - self._t_last)
+        self._t_last = t_start
+        self.centers.append(self.center)
+        self.corrections.append(correction)
+        self.scores.append(score)
+        self.n_iterations += 1
+        return correction
+
+    def locked(self):
+        corrections = list(self.corrections)[-self.n_lock:]
+        return len(corrections) == self.n_lock and max(abs(c) for c in corrections) <= self.lock_um
+
+    def _run(self):
+        period = 1/self.loop_rate
+        while not self._stop.is_set():
+            t_start = time.perf_counter()
+            self.step()
+            self._stop.wait(max(period - (time.perf_counter() - t_start), 0.0))
+
+    def start(self):
+        """
+        Runs the loop in a background thread until stop.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def wait_lock(self, timeout=10.0):
+        """
+        Waits (with the loop running) until the focus is locked. Returns False on timeout.
+        """
+        t_start = time.perf_counter()
+        while not self.locked():
+            if time.perf_counter() - t_start > timeout:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def report(self):
+        """
+        Latency (s), loop rate (Hz) and stability (um) over the last iterations: std and
+        peak to peak of the center, mean absolute correction and fraction of corrections
+        that reverse the previous one (hunting), the score relative to the best one.
+        """
+        if self.n_iterations == 0:
+            return {'n_iterations': 0}
+        latencies = np.array(self.latencies)
+        centers = np.array(self.centers)
+        corrections = np.array(self.corrections)
+        scores = np.array(self.scores)
+        signs = np.sign(corrections[corrections != 0])
+        return {'n_iterations': self.n_iterations,
+                'n_frames': self.n_frames,
+                'travel_um': self.travel_um,
+                'center_um': self.center,
+                'locked': self.locked(),
+                'latency_mean': float(latencies.mean()),
+                'latency_p95': float(np.percentile(latencies, 95)),
+                'latency_max': float(latencies.max()),
+                'loop_rate': float(1/np.mean(self.periods)) if self.periods else 0.0,
+                'center_std': float(centers.std()),
+                'center_ptp': float(np.ptp(centers)),
+                'mean_correction': float(np.abs(corrections).mean()),
+                'reversals': float(np.mean(signs[1:] != signs[:-1])) if len(signs) > 1 else 0.0,
+                'relative_score': float(scores[-1]/scores.max())}
@@ -0,0 +1,241 @@
+# cork_meter.py
+
+"""
+Description: Depth measurement workflow for batches of corks (hole focus vs patch focus).
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import time
+
+from focus_search import FocusSearch, STAGE_SCALE
+from adaptive_averaging import RunningStats
+from roi_detection import detect_rois, pick_center
+from tracing import tracer
+
+
+class LotEstimate():
+    """
+    Running estimate of the hole and patch focus positions (and of the hole - patch
+    depth) of the corks of a lot, used to center the next sweep on a window sized
+    from the spread of the previous corks.
+
+    -> n_sigma: half width of the window around each expected peak, in standard deviations;
+    -> margin_um: added on both sides of the window (covers the peak width and a small lot);
+    -> min_corks: number of corks measured over the full range before narrowing.
+    """
+
+    def __init__(self, n_sigma=4.0, margin_um=40.0, min_corks=3):
+        self.n_sigma = n_sigma
+        self.margin_um = margin_um
+        self.min_corks = min_corks
+        self.focus = RunningStats()
+        self.depth = RunningStats()
+
+    def update(self, result):
+        self.focus.update(result['focus'][:2])
+        self.depth.update([result['focus'][0] - result['focus'][1]])
+
+    @property
+    def ready(self):
+        return self.focus.n >= self.min_corks
+
+    def window(self, low, high):
+        """
+        (start_um, end_um) of the next sweep, clipped to [low, high].
+        The full range until min_corks corks were measured.
+        """
+        if not self.ready:
+            return low, high
+        half_width = self.n_sigma*np.sqrt(self.focus.variance) + self.margin_um
+        start = np.min(self.focus.mean - half_width)
+        end = np.max(self.focus.mean + half_width)
+        return max(start, low), min(end, high)
+
+    def summary(self):
+        if self.focus.n == 0:
+            return {'n_corks': 0}
+        return {'n_corks': self.focus.n,
+                'focus_hole': self.focus.mean[0],
+                'focus_patch': self.focus.mean[1],
+                'focus_std': np.sqrt(self.focus.variance),
+                'depth': self.depth.mean[0],
+                'depth_std': float(np.sqrt(self.depth.variance[0]))}
+
+
+class CorkMeter():
+    """
+    Measures the hole depth of consecutive corks with the same stage and camera.
+
+    With serpentine=True the stage does not return to the start after each cork:
+    the next cork is swept from the end where the previous sweep stopped, so
+    consecutive corks alternate the sweep direction and no return trip is paid.
+    All the corks of a batch share the same z origin (the stage position when the
+    batch starts), which assumes the corks are changed without touching z.
+
+    Sweeps made in the negative direction are corrected by backlash_um, the offset
+    measured by calibrate_backlash.
+
+    With warm_start (a LotEstimate) each sweep only covers the window where the
+    previous corks of the lot had their peaks. When a peak (of any of the holes and
+    patches) falls within edge_um of a window edge that is not an edge of the full
+    range, the window is widened on that side by widen_um and the cork is measured
+    again.
+
+    measure can be called without rois: with a detector (roi_detection.HoleDetector)
+    the windows are placed automatically and manual (pick_center by default) is only
+    asked for the center when the detection confidence is low, without one manual is
+    always asked.
+
+    -> depth_um: range swept for each cork;
+    -> strategy, search_options: FocusSearch strategy and its keyword arguments
+    (e.g. um_step for 'sweep', precision_um and coarse_step for the others);
+    -> focus_options: keyword arguments of FocusSearch (blur, settle_time, peak_method, ...).
+    """
+
+    def __init__(self, stage, camera, depth_um=700, strategy='sweep', search_options=None,
+                 serpentine=True, backlash_um=0.0, scale=STAGE_SCALE,
+                 warm_start=None, edge_um=20.0, widen_um=100.0, detector=None,
+                 manual=pick_center, **focus_options):
+        self.stage = stage
+        self.camera = camera
+        self.depth_um = depth_um
+        self.strategy = strategy
+        self.search_options = {'um_step': 15} if search_options is None else search_options
+        self.serpentine = serpentine
+        self.backlash_um = backlash_um
+        self.scale = scale
+        self.warm_start = warm_start
+        self.edge_um = edge_um
+        self.widen_um = widen_um
+        self.detector = detector
+        self.manual = manual
+        self.focus_options = focus_options
+
+        self.reset_batch()
+
+    def reset_batch(self, origin=None):
+        """
+        Starts a new batch: origin (stage internal units), by default the current stage
+        position, becomes the z origin.
+        """
+        self.origin = self.stage.get_position(scale = False) if origin is None else origin
+        self.results = []
+        self.t_batch = time.perf_counter()
+
+    def config(self):
+        """
+        Settings of the measurement, as recorded in the journal of a run.
+        """
+        return {'depth_um': self.depth_um,
+                'strategy': self.strategy,
+                'search_options': self.search_options,
+                'serpentine': self.serpentine,
+                'backlash_um': self.backlash_um,
+                'scale': self.scale,
+                'warm_start': self.warm_start is not None,
+                'focus_options': self.focus_options}
+
+    def focus_search(self, rois, backlash_um=None):
+        backlash_um = self.backlash_um if backlash_um is None else backlash_um
+        return FocusSearch(self.stage, self.camera, rois, scale = self.scale,
+                           backlash_um = backlash_um, **self.focus_options)
+
+    def current_z(self):
+        return (self.stage.get_position(scale = False) - self.origin)/self.scale
+
+    def _sweep(self, search, start_um, end_um):
+        reverse = self.serpentine and abs(self.current_z() - end_um) < abs(self.current_z() - start_um)
+        result = search.search(self.strategy, end_um,
+                               start_um = start_um,
+                               return_to_start = not self.serpentine,
+                               reverse = reverse,
+                               origin = self.origin,
+                               **self.search_options)
+        result['reverse'] = reverse
+        result['window'] = (start_um, end_um)
+        return result
+
+    def measure(self, rois=None):
+        """
+        Measures one cork. rois: hole and patch windows (or masks) of this cork,
+        detected with the detector (or picked with manual) if None.
+        """
+        detection = None
+        if rois is None:
+            with tracer.span('detect_rois'):
+                detection = detect_rois(self.camera, self.detector, self.manual)
+            rois = detection['rois']
+        search = self.focus_search(rois)
+        if self.warm_start is None:
+            start_um, end_um = 0.0, self.depth_um
+        else:
+            start_um, end_um = self.warm_start.window(0.0, self.depth_um)
+
+        n_widenings = 0
+        totals = {'n_moves': 0, 'n_frames': 0, 'travel_um': 0.0, 'wall_time': 0.0}
+        timings = {'motion': 0.0, 'settle': 0.0, 'acquire': 0.0, 'compute': 0.0}
+        if detection is not None:
+            timings['compute'] += detection['time']
+        while True:
+            result = self._sweep(search, start_um, end_um)
+            for key in totals:
+                totals[key] += result[key]
+            for key in timings:
+                timings[key] += result['timings'][key]
+            focus = result['focus']
+            at_start = start_um > 0 and np.any(focus - start_um < self.edge_um)
+            at_end = end_um < self.depth_um and np.any(end_um - focus < self.edge_um)
+            if not (at_start or at_end):
+                break
+            # A peak may lie outside the window, widen the side(s) where it is
+            if at_start:
+                start_um = max(start_um - self.widen_um, 0.0)
+            if at_end:
+                end_um = min(end_um + self.widen_um, self.depth_um)
+            n_widenings += 1
+
+        result.update(totals)
+        result['timings'] = timings
+        result['n_widenings'] = n_widenings
+        result['detection'] = detection
+        if self.warm_start is not None:
+            self.warm_start.update(result)
+        self.results.append(result)
+        return result
+
+    def calibrate_backlash(self, rois, um_step=5):
+        """
+        Sweeps the same cork up and down with fixed steps and sets backlash_um to the
+        mean shift of the focus positions between the two directions. Uses the
+        peak_method of the focus options (if any) to resolve shifts below um_step.
+        """
+        search = self.focus_search(rois, backlash_um = 0.0)
+        start = self.current_z()
+        up = search.sweep(self.depth_um, um_step, return_to_start = False, origin = self.origin)
+        down = search.sweep(self.depth_um, um_step, return_to_start = False, reverse = True, origin = self.origin)
+        self.stage.move_to(self.origin + start*self.scale, scale = False)
+        self.stage.wait_move()
+        self.backlash_um = float(np.mean(down['focus'] - up['focus']))
+        return self.backlash_um
+
+    def batch_report(self):
+        """
+        Totals of the corks measured since the last reset_batch.
+        """
+        n_corks = len(self.results)
+        wall_time = time.perf_counter() - self.t_batch
+        travel_um = float(sum(result['travel_um'] for result in self.results))
+        return {'n_corks': n_corks,
+                'travel_um': travel_um,
+                'travel_per_cork_um': travel_um/max(n_corks, 1),
+                'n_moves': int(sum(result['n_moves'] for result in self.results)),
+                'n_frames': int(sum(result['n_frames'] for result in self.results)),
+                'swept_um': float(sum(result['window'][1] - result['window'][0] for result in self.results)),
+                'n_widenings': int(sum(result['n_widenings'] for result in self.results)),
+                'measure_time': float(sum(result['wall_time'] for result in self.results)),
+                'timings': {key: float(sum(result['timings'][key] for result in self.results))
+                            for key in ('motion', 'settle', 'acquire', 'compute')},
+                'wall_time': wall_time,
+                'time_per_cork': wall_time/max(n_corks, 1)}
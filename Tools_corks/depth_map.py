@@ -0,0 +1,179 @@
+# depth_map.py
+
+"""
+Description: Depth from focus over the whole field of view: height map and all-in-focus image of
+the cork surface built frame by frame during a sweep, without keeping the stack in memory.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import cv2
+
+
+def local_focus(image, blur=5, window=9):
+    """
+    Focus measure of each pixel: squared Laplacian of the median filtered image (as in
+    focus_search.calculate_focus_score) averaged over a window x window neighbourhood.
+    """
+    laplacian = cv2.Laplacian(cv2.medianBlur(image, blur), cv2.CV_32F)
+    return cv2.boxFilter(laplacian*laplacian, -1, (window, window))
+
+
+def parabola_vertex(z0, y0, z1, y1, z2, y2):
+    """
+    Abscissa of the vertex of the parabola through three points (z1 in the middle,
+    the spacing need not be uniform), elementwise.
+    """
+    d0 = (y1 - y0)/(z1 - z0)
+    d1 = (y2 - y1)/(z2 - z1)
+    curvature = (d1 - d0)/(z2 - z0)
+    return (z0 + z1)/2 - d0/(2*curvature)
+
+
+class DepthFromFocus():
+    """
+    Streaming depth from focus. Frames are added one at a time, in the order of a
+    monotonic sweep, and each tile (a pixel if tile=1) keeps only its running state:
+    best focus measure and its z, the focus measures and z of the frames just before
+    and just after the best one (for the sub-step interpolation) and the pixels of the
+    best frame (for the all-in-focus image). The memory is O(H*W) for any sweep length.
+
+    The focus position of each tile is the vertex of the parabola through the logarithm
+    of the three focus measures (a Gaussian focus curve), or the best z when the best
+    frame is the first or the last one.
+
+    -> blur, window: see local_focus;
+    -> tile: the focus measure is averaged over tile x tile blocks, which gives a
+    height map tile times smaller with less noise (the all-in-focus image keeps the
+    resolution of the frames);
+    -> min_contrast: tiles whose best focus measure is below min_contrast times the
+    median one (no texture) get nan in the height map.
+    """
+
+    def __init__(self, blur=5, window=9, tile=1, min_contrast=0.0):
+        self.blur = blur
+        self.window = window
+        self.tile = tile
+        self.min_contrast = min_contrast
+        self.reset()
+
+    def reset(self):
+        self.n_frames = 0
+        self.best = None
+
+    def _measure(self, frame):
+        focus = local_focus(frame, self.blur, self.window)
+        if self.tile > 1:
+            height, width = focus.shape
+            focus = cv2.resize(focus[:height - height % self.tile, :width - width % self.tile],
+                               (width//self.tile, height//self.tile), interpolation = cv2.INTER_AREA)
+        return focus
+
+    def _start(self, focus, frame):
+        shape = focus.shape
+        self.best = np.zeros(shape, np.float32)
+        self.z_best = np.zeros(shape, np.float32)
+        self.best_index = np.full(shape, -1, np.int32)
+        self.before = np.full(shape, np.nan, np.float32)
+        self.z_before = np.full(shape, np.nan, np.float32)
+        self.after = np.full(shape, np.nan, np.float32)
+        self.z_after = np.full(shape, np.nan, np.float32)
+        self.all_in_focus = frame.copy()
+        self.previous = np.full(shape, np.nan, np.float32)
+        self.z_previous = np.nan
+
+    def _expand(self, mask, shape):
+        """
+        Tile mask to the pixels of a frame of shape (the pixels past the last full tile
+        follow the last tile).
+        """
+        if self.tile == 1:
+            return mask
+        mask = np.repeat(np.repeat(mask, self.tile, axis = 0), self.tile, axis = 1)
+        pad = ((0, max(shape[0] - mask.shape[0], 0)), (0, max(shape[1] - mask.shape[1], 0)))
+        return np.pad(mask, pad, mode = 'edge')
+
+    def add(self, frame, z_um):
+        """
+        Updates the state with frame (uint8, as from FocusSearch.acquire_frame) taken at z_um.
+        """
+        focus = self._measure(frame)
+        if self.best is None:
+            self._start(focus, frame)
+        elif focus.shape != self.best.shape:
+            print("WARNING: frame of a different size ignored by the depth from focus.")
+            return
+
+        improved = focus > self.best
+        # Tiles whose best frame is the previous one: this frame is the one just after it
+        following = (self.best_index == self.n_frames - 1) & ~improved
+        self.after[following] = focus[following]
+        self.z_after[following] = z_um
+
+        self.best[improved] = focus[improved]
+        self.z_best[improved] = z_um
+        self.best_index[improved] = self.n_frames
+        self.before[improved] = self.previous[improved]
+        self.z_before[improved] = self.z_previous
+        self.after[improved] = np.nan
+        self.z_after[improved] = np.nan
+        pixels = self._expand(improved, frame.shape)
+        self.all_in_focus[pixels] = frame[pixels]
+
+        self.previous = focus
+        self.z_previous = z_um
+        self.n_frames += 1
+
+    def nbytes(self):
+        """
+        Memory held by the state (bytes).
+        """
+        if self.best is None:
+            return 0
+        return sum(array.nbytes for array in (self.best, self.z_best, self.best_index, self.before,
+                                              self.z_before, self.after, self.z_after,
+                                              self.all_in_focus, self.previous))
+
+    def result(self):
+        """
+        Dictionary with height (focus position of each tile, um, as the positions of the
+        focus searches), all_in_focus (uint8 image), sharpness (best focus measure of each
+        tile) and n_frames.
+        """
+        height = self.z_best.astype(float)
+        inner = np.isfinite(self.before) & np.isfinite(self.after)
+        if np.any(inner):
+            log = lambda values: np.log(np.maximum(values[inner], 1E-12))
+            vertex = parabola_vertex(self.z_before[inner], log(self.before),
+                                     self.z_best[inner], log(self.best),
+                                     self.z_after[inner], log(self.after))
+            low = np.minimum(self.z_before[inner], self.z_after[inner])
+            high = np.maximum(self.z_before[inner], self.z_after[inner])
+            # Flat tiles have no curvature, they keep the best z
+            vertex = np.where(np.isfinite(vertex), vertex, self.z_best[inner])
+            height[inner] = np.clip(vertex, low, high)
+        if self.min_contrast > 0:
+            height[self.best < self.min_contrast*np.median(self.best)] = np.nan
+        return {'height': height,
+                'all_in_focus': self.all_in_focus,
+                'sharpness': self.best,
+                'n_frames': self.n_frames}
+
+
+def depth_map(search, depth_um, um_step, engine=None, **kwargs):
+    """
+    Fixed step sweep of a FocusSearch (search.sweep, same keyword arguments) that also
+    feeds its frames to engine (a DepthFromFocus, the default one if None). Returns the
+    dictionary of the sweep plus the keys of engine.result.
+    """
+    engine = DepthFromFocus() if engine is None else engine
+    engine.reset()
+    frame_sink = search.frame_sink
+    search.frame_sink = engine.add
+    try:
+        result = search.sweep(depth_um, um_step, **kwargs)
+    finally:
+        search.frame_sink = frame_sink
+    result.update(engine.result())
+    return result
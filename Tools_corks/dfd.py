@@ -0,0 +1,174 @@
+# dfd.py
+
+"""
+Description: Depth from defocus: the focus positions of the hole and of the patch estimated from a
+few frames at known z, using the shape of the focus curves calibrated from archived sweeps.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import warnings
+
+
+class DefocusModel():
+    """
+    Focus score as a function of the defocus for each region (ROI), normalized by the
+    score in focus: h(dz) = score(focus + dz)/score(focus), calibrated from sweeps.
+
+    Frames at z_1, ..., z_n give score_k = A*h(z_k - focus): for each candidate focus,
+    A is the least squares amplitude and the estimate is the focus with the smallest
+    relative residual. Frames far from focus, at the noise floor, weigh little. Two
+    frames are enough when they are on the same flank of the curve; three or more
+    frames around the peaks remove the ambiguity between flanks. When a single frame
+    sees a peak, the focus on the other side of that frame fits about as well: the
+    residual of that mirrored focus (flank residual) tells whether the flank is known.
+
+    -> dz: defocus grid (um) of the curves;
+    -> curves: (n_rois, len(dz)) median normalized curves;
+    -> spread: (n_rois, len(dz)) interquartile range of the normalized curves.
+    """
+
+    def __init__(self, dz, curves, spread=None):
+        self.dz = np.asarray(dz, dtype=float)
+        self.curves = np.asarray(curves, dtype=float)
+        self.spread = spread
+
+    @classmethod
+    def calibrate(cls, results, half_range_um=None, step_um=1.0):
+        """
+        Model from archived sweep results (dictionaries with positions, scores and focus,
+        as returned by the focus searches or journal.Journal.results). The curves are
+        aligned on their focus, normalized by their score there and combined with the
+        median; dz covers half_range_um around focus (as far as any sweep goes if None),
+        each point of the curves from the sweeps that reach it.
+        """
+        results = list(results)
+        n_rois = np.shape(results[0]['scores'])[1]
+        if half_range_um is None:
+            half_range_um = max(max(result['focus'][i] - np.min(result['positions']),
+                                    np.max(result['positions']) - result['focus'][i])
+                                for result in results for i in range(n_rois))
+        dz = np.arange(-half_range_um, half_range_um + step_um/2, step_um)
+
+        normalized = np.full((len(results), n_rois, len(dz)), np.nan)
+        for k, result in enumerate(results):
+            positions = np.asarray(result['positions'], dtype=float)
+            scores = np.asarray(result['scores'], dtype=float)
+            for i in range(n_rois):
+                z = result['focus'][i] + dz
+                inside = (z >= positions.min()) & (z <= positions.max())
+                curve = np.interp(z, positions, scores[:, i])
+                normalized[k, i, inside] = curve[inside]/np.interp(result['focus'][i], positions, scores[:, i])
+
+        reached = np.any(np.isfinite(normalized), axis = (0, 1))
+        normalized = normalized[..., reached]
+        with warnings.catch_warnings():
+            # Points of the curve of one region that no sweep reaches
+            warnings.simplefilter('ignore', RuntimeWarning)
+            curves = np.nanmedian(normalized, axis = 0)
+            spread = np.nanpercentile(normalized, 75, axis = 0) - np.nanpercentile(normalized, 25, axis = 0)
+        # Points reached by the sweeps of one region only are extended with the end values
+        for i in range(n_rois):
+            valid = np.isfinite(curves[i])
+            curves[i] = np.interp(dz[reached], dz[reached][valid], curves[i, valid])
+        return cls(dz[reached], curves, spread)
+
+    def estimate(self, z, scores, low=None, high=None, step_um=0.5, flank_tolerance_um=5.0):
+        """
+        Focus of each region from the scores (n_frames, n_rois) of frames at z (n_frames).
+        The focus is searched in [low, high], by default the positions where at least one
+        frame falls inside the calibrated range (the curves are extended with their end
+        values). Returns the focus (n_rois), the residual (norm of the residuals over
+        the norm of the scores, large when the frames do not match the model) and the
+        flank residual, the smallest residual of a focus on the other side of the frame
+        nearest to the focus found and more than flank_tolerance_um from it (inf without
+        candidates there): a focus next to a frame has its mirror image just as close.
+        """
+        z = np.asarray(z, dtype=float)
+        scores = np.asarray(scores, dtype=float)
+        low = z.min() + self.dz[0] if low is None else low
+        high = z.max() + self.dz[-1] if high is None else high
+        candidates = np.arange(low, high + step_um/2, step_um)
+
+        focus = np.empty(len(self.curves))
+        residual = np.empty(len(self.curves))
+        flank_residual = np.empty(len(self.curves))
+        for i, curve in enumerate(self.curves):
+            # (n_candidates, n_frames) expected scores, up to the amplitude A
+            expected = np.interp(z[None, :] - candidates[:, None], self.dz, curve)
+            amplitude = expected @ scores[:, i]/np.sum(expected**2, axis = 1)
+            cost = np.sum((scores[:, i][None, :] - amplitude[:, None]*expected)**2, axis = 1)/np.sum(scores[:, i]**2)
+            best = int(np.argmin(cost))
+            focus[i] = candidates[best]
+            # Parabola through the cost around the minimum to go below step_um
+            if 0 < best < len(candidates) - 1:
+                c0, c1, c2 = cost[best - 1 : best + 2]
+                denominator = c0 - 2*c1 + c2
+                if denominator > 0:
+                    focus[i] += step_um*(c0 - c2)/(2*denominator)
+            residual[i] = np.sqrt(cost[best])
+            nearest = z[np.argmin(np.abs(z - candidates[best]))]
+            mirrored = ((candidates - nearest)*(candidates[best] - nearest) < 0) & \
+                       (np.abs(candidates - focus[i]) > flank_tolerance_um)
+            flank_residual[i] = np.sqrt(cost[mirrored].min()) if np.any(mirrored) else np.inf
+        return focus, residual, flank_residual
+
+
+def is_confident(n_frames, residual, flank_residual, max_residual=0.05, flank_margin=0.005):
+    """
+    True when estimates from n_frames frames can be trusted: at least three frames (two
+    always fit the model exactly), every residual below max_residual and every flank
+    known, the mirrored focus fitting worse by at least flank_margin.
+    """
+    return bool(n_frames >= 3 and np.all(residual <= max_residual)
+                and np.all(flank_residual - residual >= flank_margin))
+
+
+def defocus_depth(search, model, z_um, max_residual=0.05, flank_margin=0.005, return_to_start=True, origin=None):
+    """
+    Measures the frames at z_um (um from the origin, as in the focus searches) with a
+    FocusSearch and estimates the focus positions with model. Returns the dictionary of
+    the focus searches plus the residuals, flank residuals and confident (is_confident),
+    False when the cork should be measured with a sweep.
+    """
+    search.reset(origin)
+    for z in z_um:
+        search.evaluate(z)
+    focus, residual, flank_residual = model.estimate(*search.measured())
+    result = search.finish(focus, return_to_start)
+    result['residual'] = residual
+    result['flank_residual'] = flank_residual
+    result['confident'] = is_confident(len(z_um), residual, flank_residual, max_residual, flank_margin)
+    return result
+
+
+def accuracy_vs_sweeps(results, z_um, half_range_um=None, max_residual=0.05, flank_margin=0.005):
+    """
+    Depth from defocus against the sweeps themselves: for each archived sweep the model is
+    calibrated with the other sweeps (leave one out) and the scores at z_um are
+    interpolated from its curve. Returns the depth errors, whether each estimate would be
+    confident (is_confident) and the statistics (um) of all the errors and of the
+    errors of the confident estimates (max_confident, nan without any).
+    """
+    results = list(results)
+    errors = []
+    residuals = []
+    confident = []
+    for k, result in enumerate(results):
+        model = DefocusModel.calibrate(results[:k] + results[k + 1:], half_range_um)
+        positions = np.asarray(result['positions'], dtype=float)
+        scores = np.stack([np.interp(z_um, positions, column) for column in np.asarray(result['scores']).T], axis = -1)
+        focus, residual, flank_residual = model.estimate(z_um, scores)
+        errors.append(abs(focus[0] - focus[1]) - result['depth'])
+        residuals.append(residual.max())
+        confident.append(is_confident(len(z_um), residual, flank_residual, max_residual, flank_margin))
+    errors = np.array(errors)
+    confident = np.array(confident)
+    return {'errors': errors,
+            'residuals': np.array(residuals),
+            'confident': confident,
+            'bias': float(np.mean(errors)),
+            'rms': float(np.sqrt(np.mean(errors**2))),
+            'max': float(np.max(np.abs(errors))),
+            'max_confident': float(np.max(np.abs(errors[confident]))) if np.any(confident) else np.nan}
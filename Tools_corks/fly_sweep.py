@@ -0,0 +1,157 @@
+# fly_sweep.py
+
+"""
+Description: Continuous-motion (fly-through) focus sweep. The stage moves at constant velocity
+while frames are streamed and each frame position is interpolated from sampled stage positions.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import time
+import threading
+
+from focus_search import STAGE_SCALE, calculate_focus_score, crop, roi_from_mask
+from peak_fit import locate_peaks
+
+
+class PositionSampler(threading.Thread):
+    """
+    Polls stage.get_position() in the background and keeps (timestamp, position) pairs.
+    The timestamp is the middle of the get_position call, read from clock (an object
+    with perf_counter, the time module by default, as for the simulated stage).
+    """
+
+    def __init__(self, stage, period=0.005, clock=time):
+        super().__init__(daemon=True)
+        self.stage = stage
+        self.period = period
+        self.clock = clock
+        self.times = []
+        self.positions = []
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        t0 = self.clock.perf_counter()
+        position = self.stage.get_position(scale = False)
+        t1 = self.clock.perf_counter()
+        self.times.append((t0 + t1)/2)
+        self.positions.append(position)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.sample()
+            self._stop_event.wait(self.period)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.sample()
+        return np.array(self.times), np.array(self.positions, dtype=float)
+
+
+class FlySweep():
+    """
+    Fly-through focus sweep.
+
+    The stage travels depth_um at velocity_um_s in a single move while the camera
+    grabs frames back to back. Only the ROIs are kept from each frame and they are
+    scored after the motion ends, so scoring does not lower the frame rate.
+    The position of each frame is interpolated from the motion profile recorded by
+    a PositionSampler at the middle of the get_image call.
+
+    The camera should average a single frame per get_image (num_frames/n_frames = 1),
+    otherwise each point mixes several positions. The stage travels
+    velocity_um_s*exposure during one exposure, keep it below the depth of field.
+
+    Frames and stage samples are timestamped with clock (perf_counter), which must be the
+    one of the stage and camera: the time module for the hardware, the clock given to
+    SimulatedStage and SimulatedCamera in a simulation.
+    """
+
+    def __init__(self, stage, camera, rois, blur=5, scale=STAGE_SCALE, sample_period=0.005, peak_method=None,
+                 clock=time):
+        self.stage = stage
+        self.camera = camera
+        self.rois = [roi_from_mask(roi) if np.ndim(roi) == 2 else tuple(roi) for roi in rois]
+        self.blur = blur
+        self.scale = scale
+        self.sample_period = sample_period
+        self.peak_method = peak_method
+        self.clock = clock
+
+    def acquire(self, depth_um, velocity_um_s):
+        """
+        Moves the stage by depth_um and streams frames until the motion ends.
+        Returns the frame timestamps, the ROI crops of every frame and the sampled motion profile.
+        """
+        velocity_params = self.stage.get_velocity_parameters(scale = False)
+        self.stage.setup_velocity(max_velocity = velocity_um_s*self.scale, scale = False)
+
+        sampler = PositionSampler(self.stage, self.sample_period, self.clock)
+        sampler.start()
+
+        frame_times = []
+        crops = []
+        t_start = self.clock.perf_counter()
+        # Motion status may take a moment to update after the command, so the
+        # expected duration of the move is also used to decide when to stop
+        t_expected = t_start + abs(depth_um)/velocity_um_s
+        self.stage.move_by(depth_um*self.scale, scale = False)
+        try:
+            while self.stage.is_moving() or self.clock.perf_counter() < t_expected:
+                t0 = self.clock.perf_counter()
+                image = (self.camera.get_image()*255).astype(np.uint8)
+                t1 = self.clock.perf_counter()
+                frame_times.append((t0 + t1)/2)
+                crops.append([crop(image, roi).copy() for roi in self.rois])
+        finally:
+            sample_times, sample_positions = sampler.stop()
+            self.stage.setup_velocity(min_velocity = velocity_params.min_velocity,
+                                      acceleration = velocity_params.acceleration,
+                                      max_velocity = velocity_params.max_velocity,
+                                      scale = False)
+
+        return np.array(frame_times), crops, sample_times, sample_positions
+
+    def run(self, depth_um, velocity_um_s, return_to_start=True):
+        """
+        Fly-through sweep over depth_um micrometers. Returns the same dictionary as the
+        FocusSearch strategies, positions are relative to the start of the sweep.
+        """
+        t_start = self.clock.perf_counter()
+        init_position = self.stage.get_position(scale = False)
+
+        frame_times, crops, sample_times, sample_positions = self.acquire(depth_um, velocity_um_s)
+
+        positions = (np.interp(frame_times, sample_times, sample_positions) - init_position)/self.scale
+        scores = np.array([[calculate_focus_score(image, self.blur) for image in frame] for frame in crops])
+        order = np.argsort(positions, kind = 'stable')
+        positions, scores = positions[order], scores[order]
+
+        n_moves = 1
+        travel_um = abs(depth_um)
+        if return_to_start:
+            self.stage.move_to(init_position, scale = False)
+            self.stage.wait_move()
+            n_moves += 1
+            travel_um += abs(depth_um)
+
+        if self.peak_method is None:
+            focus = positions[np.argmax(scores, axis = 0)]
+            focus_ci = np.stack([focus, focus], axis = -1)
+        else:
+            focus, focus_ci = locate_peaks(positions, scores, method = self.peak_method)
+        return {'focus': focus,
+                'focus_ci': focus_ci,
+                'focus_hole': focus[0],
+                'focus_patch': focus[1],
+                'depth': abs(focus[0] - focus[1]),
+                'depths': np.abs(focus[0:len(focus)//2*2:2] - focus[1:len(focus)//2*2:2]),
+                'positions': positions,
+                'scores': scores,
+                'n_moves': n_moves,
+                'n_frames': len(frame_times),
+                'travel_um': travel_um,
+                'wall_time': self.clock.perf_counter() - t_start,
+                'z_per_frame_um': velocity_um_s*np.mean(np.diff(frame_times)) if len(frame_times) > 1 else 0.0}
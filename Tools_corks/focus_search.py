@@ -0,0 +1,669 @@
+# focus_search.py
+
+"""
+Description: Focus search strategies used to find the hole and patch focus positions of a cork.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import time
+import threading
+import functools
+import itertools
+import cv2
+from scipy.optimize import minimize_scalar
+
+from peak_fit import locate_peaks
+from readout import ReadoutWindow
+from binning import Binning
+from tracing import tracer
+
+
+STAGE_SCALE = 409600E-3 # Converts micrometers to the stage internal units (NRT150).
+
+
+def calculate_focus_score(image, blur):
+    """
+    Relative metric to find if image is focused.
+    Single focus score doesn't give any information of the focus state
+    """
+    image_filtered = cv2.medianBlur(image, blur)
+    laplacian = cv2.Laplacian(image_filtered, cv2.CV_64F)
+    return laplacian.var()
+
+
+@functools.lru_cache(maxsize = 64)
+def _clusters(rois, overhead_px):
+    clusters = [([i], roi, (roi[1] - roi[0])*(roi[3] - roi[2])) for i, roi in enumerate(rois)]
+    merged = True
+    while merged:
+        merged = False
+        for a, b in itertools.combinations(range(len(clusters)), 2):
+            (indexes_a, box_a, area_a), (indexes_b, box_b, area_b) = clusters[a], clusters[b]
+            box = (min(box_a[0], box_b[0]), max(box_a[1], box_b[1]), min(box_a[2], box_b[2]), max(box_a[3], box_b[3]))
+            if (box[1] - box[0])*(box[3] - box[2]) <= area_a + area_b + overhead_px:
+                clusters[a] = (indexes_a + indexes_b, box, area_a + area_b + overhead_px)
+                del clusters[b]
+                merged = True
+                break
+    return tuple(tuple(indexes) for indexes, box, area in clusters)
+
+
+def roi_clusters(rois, overhead_px=10000):
+    """
+    Groups the ROIs (y0, y1, x0, x1) into clusters of nearby ones, returned as tuples of
+    indexes. Filtering costs about a fixed overhead plus a constant per pixel, so two
+    clusters are merged while the bounding box of both is smaller than their areas plus
+    the overhead (in pixels, about 10000 with OpenCV): far apart holes are not filtered
+    together with all the image between them, the ROIs of a hole and its patch are.
+    """
+    return _clusters(tuple(tuple(int(v) for v in roi) for roi in rois), overhead_px)
+
+
+def _window_scores(image, rois, blur):
+    rois = np.asarray(rois, dtype=int)
+    y0, x0 = rois[:, 0].min(), rois[:, 2].min()
+    window = image[y0:rois[:, 1].max(), x0:rois[:, 3].max()]
+    with tracer.span('median_blur'):
+        filtered = cv2.medianBlur(window, blur)
+    with tracer.span('laplacian'):
+        laplacian = cv2.Laplacian(filtered, cv2.CV_64F)
+    with tracer.span('integral'):
+        sums, squares = cv2.integral2(laplacian, sdepth = cv2.CV_64F, sqdepth = cv2.CV_64F)
+
+    top, bottom = rois[:, 0] - y0, rois[:, 1] - y0
+    left, right = rois[:, 2] - x0, rois[:, 3] - x0
+    box = lambda integral: (integral[bottom, right] - integral[top, right]
+                            - integral[bottom, left] + integral[top, left])
+    n = (bottom - top)*(right - left)
+    mean = box(sums)/n
+    return np.maximum(box(squares)/n - mean**2, 0.0)
+
+
+def calculate_focus_scores(image, rois, blur):
+    """
+    Focus score (Laplacian variance) of every ROI of image in one pass per cluster of
+    nearby ROIs (roi_clusters): the median blur and the Laplacian are computed once over
+    the bounding box of the cluster, and the variance of each ROI comes from the integral
+    images of the Laplacian and of its square, so each extra ROI costs four lookups and
+    each extra far away hole the filtering of its own windows. Equal to
+    calculate_focus_score of each crop except at the borders of the ROIs, which here are
+    filtered with their real neighbours.
+    """
+    rois = np.asarray(rois, dtype=int)
+    scores = np.empty(len(rois))
+    for indexes in roi_clusters(rois):
+        indexes = list(indexes)
+        scores[indexes] = _window_scores(image, rois[indexes], blur)
+    return scores
+
+
+def roi_from_mask(mask):
+    """
+    Converts a binary mask (as built by get_masks_focus) into a (y0, y1, x0, x1) window.
+    """
+    ys, xs = np.nonzero(mask)
+    return (int(ys.min()), int(ys.max()) + 1, int(xs.min()), int(xs.max()) + 1)
+
+
+def square_roi(cx, cy, size, offset=0):
+    """
+    Square window of side `size` centered at (cx, cy - offset).
+    Same geometry as the masks of get_masks_focus, offset plays the role of eps.
+    """
+    y = cy - offset
+    return (y - size//2, y + size//2, cx - size//2, cx + size//2)
+
+
+def crop(image, roi):
+    y0, y1, x0, x1 = roi
+    return image[y0:y1, x0:x1]
+
+
+class FocusSearch():
+    """
+    Finds the focus position of the hole and of the patch of a cork.
+
+    Every position is given in micrometers from an origin, by default the position
+    of the stage when a search starts (a search may also start elsewhere, as the
+    alternating-direction sweeps of cork_meter do). Each visited position
+    is scored for all the ROIs at once, so a frame taken while looking for one
+    peak is reused when looking for the other.
+
+    Strategies:
+    -> sweep: fixed step sweep over the whole range (the original find_optimal_focus);
+    -> coarse_to_fine: coarse sweep followed by successively finer sweeps around each peak;
+    -> golden_section: coarse sweep to bracket each peak followed by a golden-section search;
+    -> brent: coarse sweep to bracket each peak followed by Brent's bounded method.
+
+    Every strategy returns a dictionary with the focus positions, the depth and the
+    number of moves, number of frames (calls to camera.get_image) and wall time spent,
+    split in timings: motion (waiting for the stage to arrive), settle, acquire and
+    compute (scoring, summed over the workers when pipelined).
+    """
+
+    def __init__(self, stage, camera, rois, blur=5, settle_time=0.3, scale=STAGE_SCALE,
+                 settle_detector=None, peak_method=None, averaging=None, backlash_um=0.0,
+                 tracker=None, readout_margin=None, coarse_binning=1, pipeline=None,
+                 frame_sink=None):
+        """
+        rois: list with the hole and the patch windows, either as (y0, y1, x0, x1)
+        tuples or as the binary masks returned by get_masks_focus. Several holes are
+        measured in the same search with the windows of each pair one after the other
+        (hole, patch, hole, patch, ... as get_masks_focus appends them): every frame
+        scores all the windows at once and depths has the depth of each pair.
+        settle_detector: settle.SettleDetector used after each move instead of
+        sleeping settle_time seconds.
+        peak_method: peak_fit method ('parabola', 'gaussian', 'lorentzian' or 'savgol')
+        used by sweep to place the peaks between samples, the best sample if None.
+        averaging: adaptive_averaging.AdaptiveAveraging deciding how many frames are
+        scored at each position, a single get_image per position if None.
+        backlash_um: offset of the positions reached moving in the negative direction
+        with respect to the ones reached moving in the positive direction (see
+        cork_meter.CorkMeter.calibrate_backlash), subtracted from the former. It is
+        negative for a carriage lagging the motor, whose position is then tracked through
+        the dead band: a move shorter than the backlash after a reversal only moves the
+        carriage by what is left past the dead band.
+        tracker: roi_tracking.RoiTracker moving the ROIs with the lateral drift of the
+        image, measured on the first frame after each move.
+        readout_margin: with a value, search reads out only the union of the ROIs plus
+        readout_margin pixels (readout.ReadoutWindow) and restores the camera window after.
+        coarse_binning: binning factor (power of 2) of the frames of the coarse pass, see
+        binning.Binning, only built (and the camera only asked for its binning) when
+        above 1. The refinements around each peak use full resolution frames.
+        pipeline: pipeline.ScoringPipeline used for the fixed step passes (sweep and the
+        coarse passes), which then score each frame while the stage moves to the next
+        position. Not used with averaging, which needs the scores before moving.
+        frame_sink: callable(frame, z_um) receiving each measurement frame, in the order
+        of the moves, as soon as it is acquired (e.g. depth_map.DepthFromFocus.add). Not
+        called with averaging, which grabs several frames per position.
+        """
+        self.stage = stage
+        self.camera = camera
+        self.initial_rois = [roi_from_mask(roi) if np.ndim(roi) == 2 else tuple(roi) for roi in rois]
+        self.blur = blur
+        self.settle_time = settle_time
+        self.settle_detector = settle_detector
+        self.scale = scale
+        self.peak_method = peak_method
+        self.averaging = averaging
+        self.backlash_um = backlash_um
+        self.tracker = tracker
+        self.readout_margin = readout_margin
+        self.coarse_binning = coarse_binning
+        self.binning = Binning(camera) if coarse_binning > 1 else None
+        self.pipeline = pipeline
+        self.frame_sink = frame_sink
+        self._timings_lock = threading.Lock()
+        self._readout_offset = (0, 0)
+
+        self.reset()
+
+    def reset(self, origin=None):
+        """
+        Starts a new search. origin is the stage position (internal units) of z = 0,
+        the current position if None.
+        """
+        self.init_position = self.stage.get_position(scale = False)
+        self.origin = self.init_position if origin is None else origin
+        self.z = (self.init_position - self.origin)/self.scale
+        self.z_start = self.z
+        self.bounds = (-np.inf, np.inf)
+        self.last_direction = 0
+        self.z_carriage = self.z
+        self.cache = {}
+        self.coarse = None
+        self.rois = list(self.initial_rois)
+        self._track = self.tracker is not None
+        if self.tracker is not None:
+            self.tracker.reset()
+        self.n_moves = 0
+        self.n_frames = 0
+        self.travel_um = 0.0
+        self.settle_times = []
+        self.timings = {'motion': 0.0, 'settle': 0.0, 'acquire': 0.0, 'compute': 0.0}
+        self._settled_image = None
+        self.t_start = time.perf_counter()
+
+    def _add_time(self, phase, t_start):
+        t_end = time.perf_counter()
+        with self._timings_lock:
+            self.timings[phase] += t_end - t_start
+        tracer.add(phase, t_start, t_end)
+
+    def acquire_frame(self):
+        """
+        Images acquire from camera come in 0-1 range.
+        Function multiplies by 255 and return as int8
+        """
+        t_start = time.perf_counter()
+        if self._settled_image is not None:
+            image, self._settled_image = self._settled_image, None
+        else:
+            with tracer.span('get_image'):
+                image = self.camera.get_image()
+            self.n_frames += 1
+        with tracer.span('convert'):
+            frame = (image*255).astype(np.uint8)
+        if self.binning is not None and self.binning.factor > 1:
+            with tracer.span('bin', factor = self.binning.factor):
+                frame = self.binning.frame(frame)
+            if self._track:
+                # The tracker works in full resolution coordinates
+                self.track(cv2.resize(frame, None, fx = self.binning.factor, fy = self.binning.factor))
+        elif self._track:
+            self.track(frame)
+        self._add_time('acquire', t_start)
+        return frame
+
+    def sink(self, frame, z_um):
+        """
+        Hands frame to the frame_sink (timed as compute).
+        """
+        if self.frame_sink is not None:
+            t_start = time.perf_counter()
+            self.frame_sink(frame, z_um)
+            self._add_time('compute', t_start)
+
+    def track(self, frame):
+        """
+        Moves the ROIs with the drift measured on frame (the first one after a move).
+        """
+        self._track = False
+        with tracer.span('track'):
+            if self.tracker.reference is None:
+                self.rois = self.tracker.start(frame, self.initial_rois)
+            else:
+                self.rois = self.tracker.update(frame)
+
+    def scoring_rois(self):
+        """
+        ROIs in the coordinates of the frames returned by acquire_frame (binned or not).
+        """
+        if self.binning is None or self.binning.factor == 1:
+            return self.rois
+        return self.binning.rois(self.rois)
+
+    def score_frame(self, image, rois=None):
+        t_start = time.perf_counter()
+        rois = self.scoring_rois() if rois is None else rois
+        scores = calculate_focus_scores(image, rois, self.blur)
+        self._add_time('compute', t_start)
+        return scores
+
+    def move_to(self, z_um, settle=True):
+        """
+        Moves the stage to z_um micrometers from the start of the search.
+        Positive displacement value moves towards the cork. Without settle it only
+        waits for the end of the move (intermediate moves).
+        """
+        dz = z_um - self.z
+        if dz == 0:
+            return
+        with tracer.span('move_command', z_um = z_um):
+            self.stage.move_by(dz*self.scale, scale = False)
+        self.last_direction = 1 if dz > 0 else -1
+        if self.backlash_um <= 0:
+            # Dead band: the carriage stays between z_um (reached moving up) and z_um - backlash_um
+            self.z_carriage = min(max(self.z_carriage, z_um), z_um - self.backlash_um)
+        else:
+            self.z_carriage = z_um - self.backlash_um if dz < 0 else z_um
+        self.n_moves += 1
+        self.travel_um += abs(dz)
+        self.z = z_um
+        self._track = self.tracker is not None
+        if settle:
+            self.settle()
+        else:
+            t_start = time.perf_counter()
+            self.stage.wait_move()
+            self._add_time('motion', t_start)
+
+    def _settle_geometry(self):
+        """
+        Tells the settle detector the readout window and hardware binning of the frames.
+        """
+        if self.settle_detector is not None:
+            binning = 1 if self.binning is None else self.binning.hardware_factor
+            self.settle_detector.set_geometry(self._readout_offset, binning)
+
+    def settle(self):
+        """
+        Waits for the stage to arrive and then to settle. With a settle detector the last
+        frame it grabbed is stable and is reused as the measurement frame.
+        """
+        t_start = time.perf_counter()
+        self.stage.wait_move()
+        self._add_time('motion', t_start)
+
+        t_start = time.perf_counter()
+        if self.settle_detector is None:
+            time.sleep(self.settle_time)
+            self.settle_times.append(self.settle_time)
+        else:
+            n_frames = self.settle_detector.n_frames
+            self._settled_image = self.settle_detector.wait(self.stage)
+            self.n_frames += self.settle_detector.n_frames - n_frames
+            self.settle_times.append(self.settle_detector.settle_times[-1])
+        self._add_time('settle', t_start)
+
+    def z_reached(self, z_um):
+        """
+        Position actually reached at z_um (the current position), corrected for the
+        backlash of the moves.
+        """
+        return self.z_carriage + z_um - self.z
+
+    def evaluate(self, z_um):
+        """
+        Focus scores of all the ROIs at z_um. Positions that fall on the
+        same stage step are only measured once.
+        """
+        key = int(round(z_um*self.scale))
+        if key not in self.cache:
+            self.move_to(z_um)
+            z_reached = self.z_reached(z_um)
+            if self.averaging is None:
+                frame = self.acquire_frame()
+                self.sink(frame, z_reached)
+                self.cache[key] = (z_reached, self.score_frame(frame), None)
+            else:
+                scores, errors, n = self.averaging.measure(lambda: self.score_frame(self.acquire_frame()),
+                                                           *self.score_range())
+                self.cache[key] = (z_reached, scores, errors)
+        return self.cache[key][1]
+
+    def evaluate_from_below(self, z_um):
+        """
+        evaluate, with z_um reached moving up: with backlash, a position below the stage
+        is approached from backlash_um under it. Used by the bracketing methods, whose
+        steps after a reversal can be shorter than the backlash and would otherwise land
+        several commanded positions on the same carriage position.
+        """
+        if self.backlash_um != 0 and z_um < self.z and int(round(z_um*self.scale)) not in self.cache:
+            self.move_to(z_um - abs(self.backlash_um), settle = False)
+        return self.evaluate(z_um)
+
+    def score_range(self):
+        """
+        Lowest and highest scores measured so far for each ROI, None before the first position.
+        """
+        if not self.cache:
+            return None, None
+        scores = [item[1] for item in self.cache.values()]
+        return np.min(scores, axis = 0), np.max(scores, axis = 0)
+
+    def measured(self):
+        """
+        Positions visited so far (sorted) and the respective scores, shape (n_positions, n_rois).
+        """
+        items = sorted(self.cache.values(), key = lambda item: item[0])
+        positions = np.array([item[0] for item in items])
+        scores = np.array([item[1] for item in items])
+        return positions, scores
+
+    def measured_errors(self):
+        """
+        Standard error of the scores returned by measured (nan without averaging).
+        """
+        items = sorted(self.cache.values(), key = lambda item: item[0])
+        return np.array([np.full(len(self.rois), np.nan) if item[2] is None else item[2] for item in items])
+
+    def best(self, roi_index, low=-np.inf, high=np.inf):
+        """
+        Visited position with the highest score for roi_index inside [low, high].
+        """
+        positions, scores = self.measured()
+        inside = (positions >= low) & (positions <= high)
+        return positions[inside][np.argmax(scores[inside, roi_index])]
+
+    def _best_reached(self, roi_index, low, high):
+        """
+        best for commanded bounds [low, high]: the positions reached inside them can be
+        shifted by up to backlash_um.
+        """
+        return self.best(roi_index, low - abs(self.backlash_um), high + abs(self.backlash_um))
+
+    def finish(self, focus, return_to_start=True, focus_ci=None):
+        if self.binning is not None:
+            self.binning.set(1)
+            self._settle_geometry()
+        if return_to_start:
+            t_start = time.perf_counter()
+            self.stage.move_to(self.init_position, scale = False)
+            self.stage.wait_move()
+            self._add_time('motion', t_start)
+            self.n_moves += 1
+            self.travel_um += abs(self.z - self.z_start)
+            self.z = self.z_start
+
+        positions, scores = self.measured()
+        focus = np.array(focus, dtype=float)
+        if focus_ci is None:
+            focus_ci = np.stack([focus, focus], axis = -1)
+        result = {'focus': focus,
+                'focus_ci': focus_ci,
+                'focus_hole': focus[0],
+                'focus_patch': focus[1],
+                'depth': abs(focus[0] - focus[1]),
+                'depths': np.abs(focus[0:len(focus)//2*2:2] - focus[1:len(focus)//2*2:2]),
+                'positions': positions,
+                'scores': scores,
+                'score_errors': self.measured_errors(),
+                'n_moves': self.n_moves,
+                'n_frames': self.n_frames,
+                'travel_um': self.travel_um,
+                'end_um': self.z,
+                'settle_times': np.array(self.settle_times),
+                'timings': dict(self.timings),
+                'wall_time': time.perf_counter() - self.t_start}
+        if self.tracker is not None:
+            result['roi_offsets'] = np.array(self.tracker.offsets)
+        if self.coarse is not None:
+            result['coarse_positions'], result['coarse_scores'] = self.coarse
+        return result
+
+    def bracketed(self, contrast=2.0, drop=0.5):
+        """
+        True when the maximum of every ROI is bracketed by the positions visited so far:
+        the best score is at least contrast times the lowest one (not a bump of the noise
+        floor) and on both sides of it the scores fall by more than drop of its height
+        above the lowest score.
+        """
+        positions, scores = self.measured()
+        if len(positions) < 3:
+            return False
+        low = scores.min(axis = 0)
+        for i in range(scores.shape[1]):
+            j = int(np.argmax(scores[:, i]))
+            if j == 0 or j == len(positions) - 1 or scores[j, i] < contrast*low[i]:
+                return False
+            threshold = scores[j, i] - drop*(scores[j, i] - low[i])
+            if scores[:j, i].min() > threshold or scores[j + 1:, i].min() > threshold:
+                return False
+        return True
+
+    def _coarse(self, start_um, depth_um, coarse_step, reverse=False, refine=True, early_stop=False):
+        """
+        Coarse pass, with coarse_binning. Before a refinement the binned scores are
+        moved to self.coarse, since they are not comparable with full resolution ones.
+        With early_stop the pass ends as soon as the maxima of all the ROIs are bracketed.
+        """
+        self.bounds = (start_um, depth_um)
+        if self.binning is not None:
+            self.binning.set(self.coarse_binning)
+            self._settle_geometry()
+        positions = np.arange(start_um, depth_um, coarse_step)
+        positions = positions[::-1] if reverse else positions
+        if self.pipeline is None or self.averaging is not None:
+            for z in positions:
+                if early_stop and self.bracketed():
+                    break
+                self.evaluate(z)
+        else:
+            self._pipelined(positions, self.bracketed if early_stop else None)
+        self.coarse_peaks = [self.best(i) for i in range(len(self.rois))]
+        if refine and self.coarse_binning > 1:
+            self.binning.set(1)
+            self._settle_geometry()
+            self.coarse = self.measured()
+            self.cache = {}
+
+    def _pipelined(self, positions, until=None):
+        """
+        Measures positions with the pipeline: frame k is scored while the stage
+        moves to position k + 1 and grabs frame k + 1. The remaining positions are
+        skipped once until() is True, checked on the frames scored so far.
+        """
+        keys = [int(round(z*self.scale)) for z in positions]
+        todo = [(key, z) for key, z in zip(keys, positions) if key not in self.cache]
+
+        def acquire(item):
+            key, z = item
+            # The ROIs are taken now, the tracker may move them before the frame is scored
+            frame = self.acquire_frame()
+            self.sink(frame, self.z_reached(z))
+            return key, self.z_reached(z), frame, self.scoring_rois()
+
+        def score(payload):
+            key, z_reached, frame, rois = payload
+            return key, z_reached, self.score_frame(frame, rois)
+
+        def scored(results):
+            for key, z_reached, scores in results:
+                self.cache[key] = (z_reached, scores, None)
+            return until()
+
+        results = self.pipeline.run(todo, lambda item: self.move_to(item[1]), acquire, score,
+                                    None if until is None else scored)
+        for key, z_reached, scores in results:
+            self.cache[key] = (z_reached, scores, None)
+
+    def _bracket(self, peak, step):
+        return max(peak - step, self.bounds[0]), min(peak + step, self.bounds[1])
+
+    def _nearest_first(self):
+        """
+        ROI indexes ordered so that the peak closest to the current position is refined first.
+        """
+        return sorted(range(len(self.rois)), key = lambda i: abs(self.coarse_peaks[i] - self.z))
+
+    def sweep(self, depth_um, um_step,
+              return_to_start=True, reverse=False, origin=None, start_um=0.0):
+        """
+        Fixed step sweep from start_um to depth_um (from depth_um to start_um if reverse).
+        With a peak_method the focus positions are fitted between samples and come with
+        a confidence interval (focus_ci).
+        """
+        assert um_step < depth_um - start_um
+        self.reset(origin)
+        self._coarse(start_um, depth_um, um_step, reverse, refine = False)
+        if self.peak_method is None:
+            return self.finish([self.best(i) for i in range(len(self.rois))], return_to_start)
+        with tracer.span('peak_fit', method = self.peak_method):
+            focus, focus_ci = locate_peaks(*self.measured(), method = self.peak_method)
+        return self.finish(focus, return_to_start, focus_ci)
+
+    def coarse_to_fine(self, depth_um, precision_um=2.0, coarse_step=60, shrink=3, early_stop=True,
+                       return_to_start=True, reverse=False, origin=None, start_um=0.0):
+        """
+        Coarse sweep with coarse_step (stopped once every peak is bracketed if early_stop),
+        then around each peak sweeps [peak - step, peak + step] with a step shrink times
+        smaller until the step reaches precision_um.
+        """
+        assert precision_um < coarse_step < depth_um - start_um
+        self.reset(origin)
+        self._coarse(start_um, depth_um, coarse_step, reverse, early_stop = early_stop)
+
+        focus = list(self.coarse_peaks)
+        for i in self._nearest_first():
+            step = coarse_step
+            while step > precision_um:
+                low, high = self._bracket(focus[i], step)
+                step = max(step/shrink, precision_um)
+                grid = np.arange(low, high + step/2, step)
+                # Sweep in the direction that starts closest to the stage
+                if abs(grid[-1] - self.z) < abs(grid[0] - self.z):
+                    grid = grid[::-1]
+                for z in grid:
+                    self.evaluate(z)
+                focus[i] = self._best_reached(i, low, high)
+        return self.finish(focus, return_to_start)
+
+    def golden_section(self, depth_um, precision_um=1.0, coarse_step=50, early_stop=True,
+                       return_to_start=True, reverse=False, origin=None, start_um=0.0):
+        """
+        Coarse sweep to bracket each peak (stopped once every peak is bracketed if
+        early_stop), followed by a golden-section search until the bracket is narrower
+        than precision_um.
+        """
+        assert precision_um < coarse_step < depth_um - start_um
+        self.reset(origin)
+        self._coarse(start_um, depth_um, coarse_step, reverse, early_stop = early_stop)
+
+        invphi = (np.sqrt(5) - 1)/2
+        focus = [None]*len(self.rois)
+        for i in self._nearest_first():
+            a, b = self._bracket(self.coarse_peaks[i], coarse_step)
+            c = b - invphi*(b - a)
+            d = a + invphi*(b - a)
+            low, high = a, b
+            while b - a > precision_um:
+                if self.evaluate_from_below(c)[i] > self.evaluate_from_below(d)[i]:
+                    b = d
+                else:
+                    a = c
+                c = b - invphi*(b - a)
+                d = a + invphi*(b - a)
+            focus[i] = self._best_reached(i, low, high)
+        return self.finish(focus, return_to_start)
+
+    def brent(self, depth_um, precision_um=1.0, coarse_step=50, early_stop=True,
+              return_to_start=True, reverse=False, origin=None, start_um=0.0):
+        """
+        Coarse sweep to bracket each peak (stopped once every peak is bracketed if
+        early_stop), followed by Brent's bounded method (scipy.optimize.minimize_scalar)
+        with an absolute tolerance of precision_um. It minimizes -log(score): the log of a
+        sharp focus curve is close to a parabola, which Brent's parabolic steps then fit.
+        """
+        assert precision_um < coarse_step < depth_um - start_um
+        self.reset(origin)
+        self._coarse(start_um, depth_um, coarse_step, reverse, early_stop = early_stop)
+
+        focus = [None]*len(self.rois)
+        for i in self._nearest_first():
+            low, high = self._bracket(self.coarse_peaks[i], coarse_step)
+            minimize_scalar(lambda z: -np.log(self.evaluate_from_below(z)[i]), bounds = (low, high), method = 'bounded',
+                            options = {'xatol': precision_um/2})
+            focus[i] = self._best_reached(i, low, high)
+        return self.finish(focus, return_to_start)
+
+    def search(self, strategy, depth_um, **kwargs):
+        """
+        Runs one of the strategies by name: 'sweep', 'coarse_to_fine', 'golden_section' or 'brent'.
+        All of them accept return_to_start, reverse (coarse pass from depth_um down to start_um),
+        origin and start_um (the search covers [start_um, depth_um], 0 by default).
+        The camera readout is cropped to the ROIs during the search if readout_margin is set.
+        """
+        strategies = {'sweep': self.sweep,
+                      'coarse_to_fine': self.coarse_to_fine,
+                      'golden_section': self.golden_section,
+                      'brent': self.brent}
+        if self.readout_margin is None:
+            with tracer.span('search', strategy = strategy):
+                return strategies[strategy](depth_um, **kwargs)
+
+        rois = self.initial_rois
+        with tracer.span('search', strategy = strategy), ReadoutWindow(self.camera, rois, self.readout_margin) as window:
+            self.initial_rois = window.rois
+            self._readout_offset = window.offset
+            self._settle_geometry()
+            try:
+                result = strategies[strategy](depth_um, **kwargs)
+            finally:
+                self.initial_rois = rois
+                self._readout_offset = (0, 0)
+                self._settle_geometry()
+        result['readout_window'] = window.window
+        return result
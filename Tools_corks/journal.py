@@ -0,0 +1,143 @@
+# journal.py
+
+"""
+Description: Durable journal of the measurements of a run (one json line per cork, with the raw
+focus curves), so that an interrupted run can be resumed without measuring the corks again.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import json
+import os
+
+
+def to_json(value):
+    """
+    Converts numpy values, arrays and tuples (recursively) to json types. Objects without
+    a json representation (e.g. the settle detector of the focus options) become their
+    class name.
+    """
+    if isinstance(value, dict):
+        return {str(key): to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [to_json(item) for item in value]
+    if isinstance(value, np.generic):
+        return to_json(value.item())
+    if isinstance(value, float) and not np.isfinite(value):
+        return str(value)
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return type(value).__name__
+
+
+def config_key(config):
+    """
+    Canonical json string of a configuration (to_json, sorted keys), used as the key of
+    its results in the history files of benchmark and autotune.
+    """
+    return json.dumps(to_json(config), sort_keys = True)
+
+
+def write_json(path, data):
+    """
+    Writes data to path atomically: the file either keeps its previous content or has
+    the new one complete, even if the process dies while writing.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(to_json(data), file, indent = 1)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+class Journal():
+    """
+    Append only journal (json lines) of a measurement run.
+
+    The first line holds the configuration of the run, then comes the z origin of the
+    batch (stage internal units, see set_origin) and every other line is the result of
+    one cork. Each line is written with a single write and flushed to disk (fsync)
+    before append returns. A line cut by a crash can only be the last one: it is
+    dropped (and truncated from the file) when the journal is opened again.
+
+    -> path: journal file, created if it does not exist;
+    -> config: configuration of the run, written when the journal is created. When
+    resuming with a different configuration a warning is printed.
+    """
+
+    def __init__(self, path, config=None):
+        self.path = path
+        self.config = None
+        self.origin = None
+        self.records = []
+        if os.path.exists(path):
+            self._load()
+            if config is not None and self.config != to_json(config):
+                print("WARNING: the journal " + path + " was written with a different configuration.")
+        else:
+            self.config = to_json(config)
+            self._write({'type': 'config', 'config': self.config})
+
+    def _load(self):
+        valid_size = 0
+        with open(self.path, 'rb') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                valid_size += len(line)
+                if entry['type'] == 'config':
+                    self.config = entry['config']
+                elif entry['type'] == 'origin':
+                    self.origin = entry['origin']
+                else:
+                    self.records.append(entry)
+        if valid_size < os.path.getsize(self.path):
+            print("WARNING: incomplete last record of " + self.path + " dropped.")
+            with open(self.path, 'r+b') as file:
+                file.truncate(valid_size)
+
+    def _write(self, entry):
+        line = json.dumps(to_json(entry)) + '\n'
+        with open(self.path, 'a') as file:
+            file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def set_origin(self, origin):
+        """
+        Records the stage position (internal units) of z = 0 of the run, which the focus
+        positions of the results are relative to. A resumed run must use the same one.
+        """
+        self._write({'type': 'origin', 'origin': origin})
+        self.origin = to_json(origin)
+
+    def append(self, cork_id, result, **extra):
+        """
+        Records the result (FocusSearch/CorkMeter dictionary, raw curves included) of a cork.
+        """
+        entry = {'type': 'cork', 'id': cork_id, 'result': to_json(result)}
+        entry.update(to_json(extra))
+        self._write(entry)
+        self.records.append(entry)
+
+    def completed(self):
+        return {record['id'] for record in self.records}
+
+    def results(self):
+        """
+        Dictionary id: result of the corks recorded, the curves as arrays.
+        """
+        results = {}
+        for record in self.records:
+            result = dict(record['result'])
+            for key in ('positions', 'scores', 'score_errors', 'focus', 'focus_ci'):
+                if key in result:
+                    result[key] = np.array(result[key], dtype=float)
+            results[record['id']] = result
+        return results
@@ -0,0 +1,109 @@
+# nshots_study.py
+
+"""
+Description: Depth as a function of the number of averaged shots (N shots) from a single sweep.
+The frames of every step are captured once at N_max and the averages for every N are computed
+from prefix sums of the stack.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import cv2
+
+from focus_search import crop
+from peak_fit import fit_peak, interpolate_peak
+
+
+def capture_stack(search, depth_um, um_step, n_max, return_to_start=True):
+    """
+    Sweeps from 0 to depth_um with the stage, camera and ROIs of a FocusSearch and
+    keeps n_max single frames per step (the camera should average a single frame).
+    Returns the positions and, for each ROI, a uint8 stack (n_steps, n_max, h, w).
+    """
+    search.reset()
+    positions = np.arange(0, depth_um, um_step)
+    stacks = [np.empty((len(positions), n_max, roi[1] - roi[0], roi[3] - roi[2]), dtype=np.uint8)
+              for roi in search.rois]
+    for i, z in enumerate(positions):
+        search.move_to(z)
+        for n in range(n_max):
+            image = search.acquire_frame()
+            for stack, roi in zip(stacks, search.rois):
+                stack[i, n] = crop(image, roi)
+    search.finish([0.0]*len(search.rois), return_to_start)
+    return positions, stacks
+
+
+def laplacian_variance(images):
+    """
+    Variance of the Laplacian of each image of a batch (..., h, w), vectorized.
+    Same result as cv2.Laplacian(image, cv2.CV_64F).var() (3x3 kernel, reflect 101 border).
+    """
+    padded = np.pad(np.asarray(images, dtype=np.float64),
+                    [(0, 0)]*(np.ndim(images) - 2) + [(1, 1), (1, 1)], mode = 'reflect')
+    laplacian = (padded[..., :-2, 1:-1] + padded[..., 2:, 1:-1] +
+                 padded[..., 1:-1, :-2] + padded[..., 1:-1, 2:] - 4*padded[..., 1:-1, 1:-1])
+    return laplacian.var(axis = (-2, -1))
+
+
+def batch_focus_scores(images, blur):
+    """
+    calculate_focus_score of every image of a batch (..., h, w) in the 0-255 range.
+    The images are converted to uint8 as in the sweeps before the median blur.
+    """
+    images = np.asarray(images)
+    flat = images.reshape((-1,) + images.shape[-2:]).astype(np.uint8)
+    filtered = np.stack([cv2.medianBlur(image, blur) for image in flat])
+    return laplacian_variance(filtered).reshape(images.shape[:-2])
+
+
+def _peak_positions(positions, curves, peak_method, window_size, n_points):
+    if peak_method == 'interpolate':
+        return interpolate_peak(positions, curves, window_size, n_points)
+    return fit_peak(positions, curves, peak_method)['position']
+
+
+def depth_vs_nshots(positions, stacks, blur=5, peak_method='interpolate', window_size=5, n_points=500):
+    """
+    Depth for every N from 1 to N_max from one captured stack (see capture_stack).
+
+    The average of the first N frames of each step comes from the prefix sums of the
+    stack. The spread of the depth for each N is estimated from the disjoint blocks of
+    N frames available in the N_max frames (depth_std is nan when there is a single block).
+
+    peak_method: 'interpolate' for the notebooks' moving average + interpolation + argmax,
+    or any peak_fit method.
+    """
+    n_max = stacks[0].shape[1]
+    n_shots = np.arange(1, n_max + 1)
+
+    # Block b of size N averages frames b*N to (b + 1)*N - 1
+    blocks = [(N, b) for N in n_shots for b in range(n_max//N)]
+    ends = np.array([(b + 1)*N for N, b in blocks])
+    starts = np.array([b*N for N, b in blocks])
+    sizes = np.array([N for N, b in blocks], dtype=np.float32)
+
+    focus = []
+    for stack in stacks:
+        # One step at a time keeps the block averages of a single step in memory
+        scores = np.empty((len(blocks), len(positions)))
+        for i in range(len(positions)):
+            cumsum = np.cumsum(stack[i], axis = 0, dtype = np.float32)
+            cumsum = np.concatenate([np.zeros_like(cumsum[:1]), cumsum], axis = 0)
+            means = (cumsum[ends] - cumsum[starts])/sizes[:, None, None]
+            scores[:, i] = batch_focus_scores(means, blur)
+        focus.append(_peak_positions(positions, scores, peak_method, window_size, n_points))
+
+    block_depths = np.abs(focus[0] - focus[1])
+    block_n = np.array([N for N, b in blocks])
+    first = np.array([b == 0 for N, b in blocks])
+
+    depth_std = np.array([np.std(block_depths[block_n == N], ddof = 1) if n_max//N > 1 else np.nan
+                          for N in n_shots])
+    return {'n_shots': n_shots,
+            'depth': block_depths[first],
+            'focus_hole': focus[0][first],
+            'focus_patch': focus[1][first],
+            'depth_std': depth_std,
+            'n_blocks': n_max//n_shots}
@@ -0,0 +1,232 @@
+# peak_fit.py
+
+"""
+Description: Sub-step localization of the maximum of focus curves, with confidence intervals.
+All the fits are vectorized: y can be one curve (n_points,) or many curves (n_curves, n_points)
+sharing the same positions x.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+from scipy.interpolate import interp1d
+from scipy.signal import savgol_filter, savgol_coeffs
+from scipy.stats import t as student_t
+
+from tracing import tracer
+
+
+def moving_average(y, window_size):
+    """
+    Rolling window average along the last axis, only where the window fits
+    (the output has window_size - 1 points less).
+    """
+    y = np.asarray(y, dtype=float)
+    cumsum = np.cumsum(np.insert(y, 0, 0, axis = -1), axis = -1)
+    return (cumsum[..., window_size:] - cumsum[..., :-window_size])/window_size
+
+
+def interpolate_peak(x, y, window_size=5, n_points=500):
+    """
+    Peak position as computed in the depth notebooks: rolling window average,
+    linear interpolation to n_points and argmax. Precision is limited by the
+    interpolation grid and there is no uncertainty estimate.
+    """
+    x = np.asarray(x, dtype=float)
+    with tracer.span('smoothing'):
+        smoothed = moving_average(y, window_size)
+    adjusted_x = x[(window_size - 1)//2 : len(x) - window_size//2]
+    new_x = np.linspace(adjusted_x.min(), adjusted_x.max(), n_points)
+    with tracer.span('interpolation'):
+        new_y = interp1d(adjusted_x, smoothed, axis = -1)(new_x)
+    return new_x[np.argmax(new_y, axis = -1)]
+
+
+def _as_curves(x, y):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    return x, np.atleast_2d(y), y.ndim == 1
+
+
+def _peak_region(y, fraction, min_half_width=2):
+    """
+    Boolean mask (n_curves, n_points) of the contiguous region around the maximum
+    of each curve where y - min(y) stays above fraction of its peak height, widened
+    to at least min_half_width points on each side: on sharp curves the region above
+    fraction can hold only 3 points, which leave no degree of freedom for the noise.
+    """
+    n_points = y.shape[1]
+    idx = np.arange(n_points)
+    peak = np.argmax(y, axis = 1)[:, None]
+    base = y.min(axis = 1, keepdims = True)
+    height = y.max(axis = 1, keepdims = True) - base
+    below = (y - base) < fraction*height
+    left = np.max(np.where(below & (idx < peak), idx, -1), axis = 1, keepdims = True) + 1
+    right = np.min(np.where(below & (idx > peak), idx, n_points), axis = 1, keepdims = True) - 1
+    left = np.minimum(left, np.maximum(peak - min_half_width, 0))
+    right = np.maximum(right, np.minimum(peak + min_half_width, n_points - 1))
+    return (idx >= left) & (idx <= right)
+
+
+def _weighted_vertex(x, v, w, confidence):
+    """
+    Weighted least squares fit of v = a*u**2 + b*u + c for every curve (u = x - x_ref)
+    and the vertex -b/(2a) with its standard error (delta method) and confidence interval.
+    Points with zero weight are ignored.
+    """
+    x_ref = np.sum(w*x, axis = 1)/np.sum(w, axis = 1)
+    u = x[None, :] - x_ref[:, None]
+    X = np.stack([u**2, u, np.ones_like(u)], axis = -1)
+    XtW = X.transpose(0, 2, 1)*w[:, None, :]
+    A = XtW @ X
+    # Tiny ridge so that degenerate windows give a (rejected) fit instead of an error
+    A = A + 1E-12*np.trace(A, axis1 = 1, axis2 = 2)[:, None, None]*np.eye(3)
+    coefs = np.linalg.solve(A, (XtW @ v[..., None]))[..., 0]
+    a, b = coefs[:, 0], coefs[:, 1]
+
+    n_used = np.sum(w > 0, axis = 1)
+    dof = np.maximum(n_used - 3, 1)
+    residuals = v - np.einsum('nmk,nk->nm', X, coefs)
+    # With 3 points the parabola is exact and there is no estimate of the noise
+    sigma2 = np.where(n_used > 3, np.sum(w*residuals**2, axis = 1)/dof, np.inf)
+    A_inv = np.linalg.inv(A)
+
+    vertex = -b/(2*a)
+    grad = np.stack([b/(2*a**2), -1/(2*a), np.zeros_like(a)], axis = -1)
+    sigma = np.sqrt(sigma2*np.einsum('ni,nij,nj->n', grad, A_inv, grad))
+    half_width = student_t.ppf(0.5 + confidence/2, dof)*sigma
+    return vertex + x_ref, a, sigma, half_width
+
+
+def _result(position, sigma, half_width, squeeze):
+    result = {'position': position,
+              'sigma': sigma,
+              'ci_low': position - half_width,
+              'ci_high': position + half_width}
+    if squeeze:
+        result = {key: value[0] for key, value in result.items()}
+    return result
+
+
+def _checked(x, y, position, sigma, half_width, valid):
+    """
+    Falls back to the sampled maximum (with an infinite uncertainty) where the fit
+    has no maximum or the vertex lies outside the sampled range.
+    """
+    valid = valid & np.isfinite(position) & (position >= x.min()) & (position <= x.max())
+    fallback = x[np.argmax(y, axis = 1)]
+    position = np.where(valid, position, fallback)
+    sigma = np.where(valid, sigma, np.inf)
+    half_width = np.where(valid, half_width, np.inf)
+    return position, sigma, half_width
+
+
+def fit_parabola(x, y, half_width=2, confidence=0.95):
+    """
+    Parabola through the 2*half_width + 1 points around the sampled maximum.
+    """
+    x, y, squeeze = _as_curves(x, y)
+    idx = np.arange(y.shape[1])
+    peak = np.clip(np.argmax(y, axis = 1), half_width, y.shape[1] - 1 - half_width)[:, None]
+    w = (np.abs(idx - peak) <= half_width).astype(float)
+    position, a, sigma, hw = _weighted_vertex(x, y, w, confidence)
+    position, sigma, hw = _checked(x, y, position, sigma, hw, a < 0)
+    return _result(position, sigma, hw, squeeze)
+
+
+def fit_gaussian(x, y, fraction=0.3, confidence=0.95):
+    """
+    Gaussian peak on a constant background. The logarithm of the background
+    subtracted curve is a parabola, fitted over the region above fraction of the
+    peak height (at least 5 points) with weights y**2 (the variance of log(y) goes
+    as 1/y**2). Focus curves have heavier tails than a gaussian: when the step is
+    wider than the peak, the points of the tails pull the vertex towards the sampled
+    maximum (about 3 um rms at a 15 um step on the simulated curves, 0.4 um with
+    fit_lorentzian).
+    """
+    x, y, squeeze = _as_curves(x, y)
+    base = y.min(axis = 1, keepdims = True)
+    height = y.max(axis = 1, keepdims = True) - base
+    signal = np.maximum(y - base, 1E-3*height + 1E-300)
+    w = _peak_region(y, fraction)*np.clip(signal/height, 0.1, 1)**2
+    position, a, sigma, hw = _weighted_vertex(x, np.log(signal), w, confidence)
+    position, sigma, hw = _checked(x, y, position, sigma, hw, a < 0)
+    return _result(position, sigma, hw, squeeze)
+
+
+def fit_lorentzian(x, y, fraction=0.3, confidence=0.95):
+    """
+    Lorentzian peak on a constant background. The inverse of the background
+    subtracted curve is a parabola, fitted over the region above fraction of the
+    peak height (at least 5 points) with weights y**4 (the variance of 1/y goes as
+    1/y**4).
+    """
+    x, y, squeeze = _as_curves(x, y)
+    base = y.min(axis = 1, keepdims = True)
+    height = y.max(axis = 1, keepdims = True) - base
+    signal = np.maximum(y - base, 1E-3*height + 1E-300)
+    w = _peak_region(y, fraction)*np.clip(signal/height, 0.1, 1)**4
+    position, a, sigma, hw = _weighted_vertex(x, height/signal, w, confidence)
+    position, sigma, hw = _checked(x, y, position, sigma, hw, a > 0)
+    return _result(position, sigma, hw, squeeze)
+
+
+def fit_savgol(x, y, window_length=7, polyorder=2, confidence=0.95):
+    """
+    Zero crossing of the Savitzky-Golay derivative next to the maximum of the
+    smoothed curve, linearly interpolated between samples. The uncertainty is the
+    derivative noise (from the smoothing residuals) divided by the derivative slope.
+    The filter needs uniformly spaced positions: other positions are first resampled
+    (linear interpolation) to as many uniformly spaced ones.
+    """
+    x, y, squeeze = _as_curves(x, y)
+    order = np.argsort(x)
+    x, y = x[order], y[:, order]
+    dx = (x[-1] - x[0])/(len(x) - 1)
+    if np.ptp(np.diff(x)) > 1E-6*abs(dx):
+        uniform = np.linspace(x[0], x[-1], len(x))
+        y = interp1d(x, y, axis = -1)(uniform)
+        x = uniform
+    smoothed = savgol_filter(y, window_length, polyorder, axis = -1)
+    derivative = savgol_filter(y, window_length, polyorder, deriv = 1, delta = dx, axis = -1)
+
+    n_curves, n_points = y.shape
+    rows = np.arange(n_curves)
+    peak = np.clip(np.argmax(smoothed, axis = 1), 1, n_points - 2)
+    # The crossing is either between peak - 1 and peak or between peak and peak + 1
+    j = np.where(derivative[rows, peak] > 0, peak, peak - 1)
+    d0, d1 = derivative[rows, j], derivative[rows, j + 1]
+    slope = (d1 - d0)/dx
+    position = x[j] + d0/(d0 - d1)*dx
+
+    noise = np.std(y - smoothed, axis = 1)*np.sqrt(window_length/max(window_length - polyorder - 1, 1))
+    derivative_noise = noise*np.sqrt(np.sum(savgol_coeffs(window_length, polyorder, deriv = 1, delta = dx)**2))
+    sigma = derivative_noise/np.abs(slope)
+    half_width = student_t.ppf(0.5 + confidence/2, n_points - polyorder - 1)*sigma
+    position, sigma, half_width = _checked(x, y, position, sigma, half_width, (d0 > 0) & (d1 <= 0))
+    return _result(position, sigma, half_width, squeeze)
+
+
+FIT_METHODS = {'parabola': fit_parabola,
+               'gaussian': fit_gaussian,
+               'lorentzian': fit_lorentzian,
+               'savgol': fit_savgol}
+
+
+def fit_peak(x, y, method='lorentzian', **kwargs):
+    """
+    Peak position of one or many focus curves with method 'parabola', 'gaussian',
+    'lorentzian' (the default, the closest to the shape of focus curves) or 'savgol'.
+    Returns a dictionary with position, sigma (standard error), ci_low and ci_high,
+    each with one value per curve.
+    """
+    return FIT_METHODS[method](x, y, **kwargs)
+
+
+def locate_peaks(positions, scores, method='lorentzian', **kwargs):
+    """
+    Fits the peak of every column of scores (n_positions, n_rois), as returned by the
+    focus searches. Returns the focus positions and their (ci_low, ci_high) intervals.
+    """
+    fit = fit_peak(positions, np.asarray(scores).T, method, **kwargs)
+    return fit['position'], np.stack([fit['ci_low'], fit['ci_high']], axis = -1)
@@ -0,0 +1,97 @@
+# pipeline.py
+
+"""
+Description: Pipelined execution of fixed step sweeps: the stage moves to the next position and
+grabs the next frame while the previous frames are scored on worker threads.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ScoringPipeline():
+    """
+    Three stage pipeline for a list of positions:
+    -> motion: move (and settle) to position k + 1, in the calling thread;
+    -> acquisition: grab frame k + 1, in the calling thread (the stage must be still);
+    -> scoring: score frame k on one of n_workers threads (cv2 releases the GIL).
+
+    The results come back in the order of the positions. The busy time of each stage
+    is accumulated over the runs, report gives the utilization of each one (busy time
+    over wall time, per worker for scoring) and the bottleneck.
+    """
+
+    def __init__(self, n_workers=1):
+        self.n_workers = n_workers
+        self.executor = ThreadPoolExecutor(n_workers)
+        self.reset()
+
+    def reset(self):
+        self.busy = {'motion': 0.0, 'acquisition': 0.0, 'scoring': 0.0}
+        self.wall_time = 0.0
+        self.n_items = 0
+
+    def _timed_score(self, score, payload):
+        t_start = time.perf_counter()
+        result = score(payload)
+        return result, time.perf_counter() - t_start
+
+    def run(self, positions, move, acquire, score, until=None):
+        """
+        For every position calls move(position), then payload = acquire(position) and
+        submits score(payload) to the workers. Returns the list of score results.
+        until(results): called before each move with the results scored so far (in the
+        order of the positions, all but the last n_workers frames are waited for), the
+        remaining positions are skipped once it is True.
+        """
+        t_start = time.perf_counter()
+        futures = []
+        results = []
+        for position in positions:
+            if until is not None:
+                while len(results) < len(futures) - self.n_workers or (len(results) < len(futures)
+                                                                       and futures[len(results)].done()):
+                    results.append(self._collect(futures[len(results)]))
+                if until(results):
+                    break
+            t = time.perf_counter()
+            move(position)
+            self.busy['motion'] += time.perf_counter() - t
+
+            t = time.perf_counter()
+            payload = acquire(position)
+            self.busy['acquisition'] += time.perf_counter() - t
+
+            futures.append(self.executor.submit(self._timed_score, score, payload))
+
+        for future in futures[len(results):]:
+            results.append(self._collect(future))
+        self.wall_time += time.perf_counter() - t_start
+        self.n_items += len(futures)
+        return results
+
+    def _collect(self, future):
+        result, busy = future.result()
+        self.busy['scoring'] += busy
+        return result
+
+    def report(self):
+        """
+        Busy time and utilization of each stage since the last reset.
+        """
+        wall_time = max(self.wall_time, 1E-12)
+        utilization = {'motion': self.busy['motion']/wall_time,
+                       'acquisition': self.busy['acquisition']/wall_time,
+                       'scoring': self.busy['scoring']/(wall_time*self.n_workers)}
+        stages = list(utilization)
+        return {'n_items': self.n_items,
+                'wall_time': self.wall_time,
+                'busy': dict(self.busy),
+                'utilization': utilization,
+                'bottleneck': stages[int(np.argmax([utilization[stage] for stage in stages]))]}
+
+    def close(self):
+        self.executor.shutdown()
@@ -0,0 +1,73 @@
+# readout.py
+
+"""
+Description: Reduction of the camera readout to the part of the sensor covered by the ROIs, with
+the ROIs remapped to the cropped frames.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+
+def union_window(rois, margin=0):
+    """
+    Bounding box (x0, y0, width, height) of (y0, y1, x0, x1) ROIs, enlarged by margin
+    pixels on every side (not below 0).
+    """
+    y0 = max(min(roi[0] for roi in rois) - margin, 0)
+    y1 = max(roi[1] for roi in rois) + margin
+    x0 = max(min(roi[2] for roi in rois) - margin, 0)
+    x1 = max(roi[3] for roi in rois) + margin
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+class ReadoutWindow():
+    """
+    Context manager that sets the hardware readout window of the camera (ThorCam ROI,
+    XIMEA image_width/height and offsets, IDS AOI) to the union of the ROIs plus margin,
+    and restores the previous window on exit.
+
+    The ROIs are given in the coordinates of the frames returned before entering and
+    rois holds them in the coordinates of the cropped frames. The sensor increments can
+    make the window set larger than the requested one; the remapping uses the window
+    actually set, whose origin relative to the previous one is kept in offset (x, y).
+    Cameras without a readout window are left untouched (full frames): this is probed on
+    the camera itself, since CameraController has the methods even when the camera it
+    wraps does not (OBS) and then raises AttributeError.
+
+        with ReadoutWindow(camera, rois, margin=64) as window:
+            ... crop(camera.get_image()*255, window.rois[0]) ...
+    """
+
+    def __init__(self, camera, rois, margin=0):
+        self.camera = camera
+        self.original_rois = [tuple(roi) for roi in rois]
+        self.margin = margin
+        self.rois = list(self.original_rois)
+        self.previous = None
+        self.window = None
+        self.offset = (0, 0)
+
+    def __enter__(self):
+        try:
+            previous = self.camera.get_readout_window()
+        except AttributeError:
+            return self
+        px, py = previous[:2]
+        x0, y0, width, height = union_window(self.original_rois, self.margin)
+        # Keep the window inside the current readout (the ROIs are relative to it)
+        width = min(width, previous[2] - x0)
+        height = min(height, previous[3] - y0)
+        try:
+            self.window = self.camera.set_readout_window(px + x0, py + y0, width, height)
+        except AttributeError:
+            return self
+        self.previous = previous
+        dx, dy = self.window[0] - px, self.window[1] - py
+        self.offset = (dx, dy)
+        self.rois = [(y0 - dy, y1 - dy, x0 - dx, x1 - dx) for y0, y1, x0, x1 in self.original_rois]
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.previous is not None:
+            self.camera.set_readout_window(*self.previous)
+        return False
@@ -0,0 +1,271 @@
+# reanalysis.py
+
+"""
+Description: Archive of the frames of sweeps (memory-mapped stacks) and offline re-analysis of the
+archived corks with other scoring and peak fitting parameters, in parallel over a process pool.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import os
+import json
+import hashlib
+import itertools
+import cv2
+from concurrent.futures import ProcessPoolExecutor
+from numpy.lib.format import open_memmap
+
+from focus_search import square_roi
+from binning import bin_roi
+from peak_fit import locate_peaks, interpolate_peak
+from journal import write_json
+
+
+METRICS = ('laplacian', 'tenengrad')
+
+DEFAULT_PARAMS = {'blur': 5,
+                  'metric': 'laplacian',
+                  'hole_size': 50,
+                  'patch_size': 200,
+                  'patch_offset': 300,
+                  'peak_method': 'lorentzian',
+                  'window_size': 5,
+                  'n_points': 500}
+
+
+class StackWriter():
+    """
+    Frame sink (see FocusSearch frame_sink) writing the frames of a sweep to
+    folder/frames.npy as they arrive, a memory-mapped (capacity, h, w) uint8 array
+    created with the first frame; close writes folder/sweep.json with the positions.
+    """
+
+    def __init__(self, folder, capacity):
+        self.folder = folder
+        self.capacity = capacity
+        os.makedirs(folder, exist_ok = True)
+        self.frames = None
+        self.positions = []
+
+    def add(self, frame, z_um):
+        if self.frames is None:
+            self.frames = open_memmap(os.path.join(self.folder, 'frames.npy'), mode = 'w+',
+                                      dtype = np.uint8, shape = (self.capacity,) + frame.shape)
+        if len(self.positions) == self.capacity or frame.shape != self.frames.shape[1:]:
+            print("WARNING: frame not archived (stack full or frame of a different size).")
+            return
+        self.frames[len(self.positions)] = frame
+        self.positions.append(z_um)
+
+    def close(self, **meta):
+        if self.frames is not None:
+            self.frames.flush()
+        meta.update({'positions': self.positions, 'n_frames': len(self.positions)})
+        write_json(os.path.join(self.folder, 'sweep.json'), meta)
+
+
+def record_sweep(search, folder, depth_um, um_step, meta=None, **kwargs):
+    """
+    Fixed step sweep of a FocusSearch (search.sweep, same keyword arguments) that also
+    archives its frames in folder. meta (e.g. the hole center and, for synthetic corks,
+    the true depth) is stored with the positions, the ROIs and the depth measured.
+    Returns the dictionary of the sweep.
+    """
+    start_um = kwargs.get('start_um', 0.0)
+    writer = StackWriter(folder, len(np.arange(start_um, depth_um, um_step)))
+    frame_sink = search.frame_sink
+    search.frame_sink = writer.add
+    try:
+        result = search.sweep(depth_um, um_step, **kwargs)
+    finally:
+        search.frame_sink = frame_sink
+    meta = {} if meta is None else dict(meta)
+    meta.update({'rois': search.initial_rois, 'blur': search.blur, 'depth': result['depth'],
+                 'binning': search.coarse_binning})
+    writer.close(**meta)
+    return result
+
+
+def load_stack(folder):
+    """
+    Memory-mapped frames (n_frames, h, w), positions and metadata of an archived sweep.
+    """
+    with open(os.path.join(folder, 'sweep.json')) as file:
+        meta = json.load(file)
+    frames = np.load(os.path.join(folder, 'frames.npy'), mmap_mode = 'r')[:meta['n_frames']]
+    return frames, np.array(meta['positions'], dtype=float), meta
+
+
+def filtered_frame(frame, blur, metric):
+    """
+    Map whose statistics over a ROI give the focus score: the Laplacian of the median
+    filtered frame (int16, exact) for 'laplacian' (score: variance), the squared Sobel
+    gradient (float32) for 'tenengrad' (score: mean).
+    """
+    assert metric in METRICS
+    filtered = cv2.medianBlur(np.ascontiguousarray(frame), blur)
+    if metric == 'laplacian':
+        return cv2.Laplacian(filtered, cv2.CV_16S)
+    gx = cv2.Sobel(filtered, cv2.CV_32F, 1, 0)
+    gy = cv2.Sobel(filtered, cv2.CV_32F, 0, 1)
+    return gx*gx + gy*gy
+
+
+def cache_name(folder, blur, metric):
+    """
+    Name of the cached filtered stack of an archive: its folder name, a hash of its full
+    path and of the size and modification time of its frames (archives with the same
+    folder name, or recorded again, do not share caches), the metric and the blur.
+    """
+    folder = os.path.abspath(os.path.normpath(folder))
+    info = os.stat(os.path.join(folder, 'frames.npy'))
+    key = folder + '|' + str(info.st_size) + '|' + str(info.st_mtime_ns)
+    digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+    return os.path.basename(folder) + '_' + digest + '_' + metric + '_blur' + str(blur) + '.npy'
+
+
+def filtered_stack(folder, frames, blur, metric, cache_dir=None):
+    """
+    filtered_frame of every frame, read from (or written to) the cache when cache_dir is
+    set: cache_dir/cache_name(folder, blur, metric), memory-mapped.
+    """
+    dtype = np.int16 if metric == 'laplacian' else np.float32
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, cache_name(folder, blur, metric))
+        if os.path.exists(path):
+            return np.load(path, mmap_mode = 'r')
+        os.makedirs(cache_dir, exist_ok = True)
+        stack = open_memmap(path + '.tmp', mode = 'w+', dtype = dtype, shape = frames.shape)
+    else:
+        stack = np.empty(frames.shape, dtype)
+    for k, frame in enumerate(frames):
+        stack[k] = filtered_frame(frame, blur, metric)
+    if path is not None:
+        stack.flush()
+        del stack
+        # Complete caches only: an interrupted write leaves a .tmp file
+        os.replace(path + '.tmp', path)
+        return np.load(path, mmap_mode = 'r')
+    return stack
+
+
+def stack_scores(stack, rois, metric):
+    """
+    Focus curves (n_frames, n_rois) of the ROIs from a filtered stack.
+    """
+    scores = np.empty((len(stack), len(rois)))
+    for i, (y0, y1, x0, x1) in enumerate(rois):
+        window = np.asarray(stack[:, y0:y1, x0:x1], dtype=np.float64).reshape(len(stack), -1)
+        scores[:, i] = window.var(axis = 1) if metric == 'laplacian' else window.mean(axis = 1)
+    return scores
+
+
+def params_rois(params, meta, shape):
+    """
+    ROIs of a parameter set: params['rois'] if given, otherwise hole and patch squares of
+    hole_size and patch_size around meta['hole_center'] (the archived ROIs if absent),
+    all in full resolution coordinates, binned by meta['binning'] (the binning of the
+    archived frames) and clipped to the frame.
+    """
+    if 'rois' in params:
+        rois = params['rois']
+    elif 'hole_center' in meta:
+        cx, cy = meta['hole_center']
+        rois = [square_roi(cx, cy, params['hole_size']),
+                square_roi(cx, cy, params['patch_size'], offset = params['patch_offset'])]
+    else:
+        rois = meta['rois']
+    rois = [bin_roi(roi, meta.get('binning', 1)) for roi in rois]
+    return [(max(y0, 0), min(y1, shape[0]), max(x0, 0), min(x1, shape[1])) for y0, y1, x0, x1 in rois]
+
+
+def analyze_stack(folder, params_list, cache_dir=None):
+    """
+    Re-analysis of one archived sweep with every parameter set of params_list
+    (DEFAULT_PARAMS updated). The sets are grouped by (blur, metric) so that the filtered
+    stack is computed (or loaded from the cache) once per group. Returns one dictionary
+    per parameter set with focus, depth, error (against meta['true_depth'] if archived),
+    cork_id (meta['cork_id'], the same for repeated sweeps of a cork, the folder if
+    absent) and the curves.
+    """
+    frames, positions, meta = load_stack(folder)
+    params_list = [dict(DEFAULT_PARAMS, **params) for params in params_list]
+    results = [None]*len(params_list)
+    key = lambda index: (params_list[index]['blur'], params_list[index]['metric'])
+    for (blur, metric), indexes in itertools.groupby(sorted(range(len(params_list)), key = key), key = key):
+        stack = filtered_stack(folder, frames, blur, metric, cache_dir)
+        for index in indexes:
+            params = params_list[index]
+            scores = stack_scores(stack, params_rois(params, meta, frames.shape[1:]), metric)
+            if params['peak_method'] == 'interpolate':
+                focus = interpolate_peak(positions, scores.T, params['window_size'], params['n_points'])
+            elif params['peak_method'] is None:
+                focus = positions[np.argmax(scores, axis = 0)]
+            else:
+                focus, focus_ci = locate_peaks(positions, scores, method = params['peak_method'])
+            depth = float(abs(focus[0] - focus[1]))
+            results[index] = {'folder': folder,
+                              'cork_id': meta.get('cork_id', folder),
+                              'focus': focus,
+                              'depth': depth,
+                              'error': depth - meta['true_depth'] if 'true_depth' in meta else np.nan,
+                              'archived_depth': meta.get('depth', np.nan),
+                              'positions': positions,
+                              'scores': scores}
+    return results
+
+
+def _analyze(arguments):
+    return analyze_stack(*arguments)
+
+
+class ReanalysisEngine():
+    """
+    Re-analyzes many archived sweeps (folders written by record_sweep) with many
+    parameter sets on a pool of n_workers processes (all the cores if None), one task
+    per cork, so each worker reuses the filtered stacks of its cork across the
+    parameter sets. With cache_dir the filtered stacks are also kept on disk for the
+    next runs (about 2 bytes per pixel per frame for the Laplacian).
+    """
+
+    def __init__(self, folders, n_workers=None, cache_dir=None):
+        self.folders = list(folders)
+        self.n_workers = n_workers
+        self.cache_dir = cache_dir
+
+    def run(self, params_list):
+        """
+        Returns, for each parameter set, the results of all the corks (analyze_stack) and
+        their summary: depth bias, rms and max error when the true depths are archived,
+        and the mean absolute difference to the archived (measured) depths.
+        """
+        params_list = list(params_list)
+        tasks = [(folder, params_list, self.cache_dir) for folder in self.folders]
+        if self.n_workers == 1:
+            per_cork = [_analyze(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(self.n_workers) as executor:
+                per_cork = list(executor.map(_analyze, tasks))
+
+        runs = []
+        for i, params in enumerate(params_list):
+            results = [cork[i] for cork in per_cork]
+            errors = np.array([result['error'] for result in results])
+            changes = np.array([result['depth'] - result['archived_depth'] for result in results])
+            summary = {'n_corks': len(results),
+                       'change_um': float(np.nanmean(np.abs(changes)))}
+            if np.all(np.isfinite(errors)):
+                summary.update({'bias_um': float(errors.mean()),
+                                'rms_um': float(np.sqrt(np.mean(errors**2))),
+                                'max_um': float(np.abs(errors).max())})
+            runs.append({'params': dict(DEFAULT_PARAMS, **params), 'summary': summary, 'results': results})
+        return runs
+
+    def save(self, path, runs):
+        """
+        Writes the parameters and summaries of runs (without the curves) to a json file.
+        """
+        write_json(path, [{'params': run['params'], 'summary': run['summary'],
+                           'depths': [result['depth'] for result in run['results']]} for run in runs])
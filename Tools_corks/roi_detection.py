@@ -0,0 +1,213 @@
+# roi_detection.py
+
+"""
+Description: Automatic placement of the hole and patch windows of a cork, with a confidence score
+and a manual (click) fallback for the images where the detection is not reliable.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import time
+import cv2
+
+from focus_search import square_roi
+
+
+def _ring_separability(image, cx, cy, radius):
+    """
+    Separability of the pixels inside the circle and in the ring around it (radius to
+    1.5*radius): between class variance over total variance, 0 for no contrast and 1
+    for a clean step.
+    """
+    h, w = image.shape
+    y0, y1 = max(int(cy - 1.5*radius), 0), min(int(cy + 1.5*radius) + 1, h)
+    x0, x1 = max(int(cx - 1.5*radius), 0), min(int(cx + 1.5*radius) + 1, w)
+    window = image[y0:y1, x0:x1].astype(np.float64)
+    yy, xx = np.mgrid[y0:y1, x0:x1]
+    r2 = (xx - cx)**2 + (yy - cy)**2
+    inside = window[r2 <= radius**2]
+    ring = window[(r2 > radius**2) & (r2 <= (1.5*radius)**2)]
+    if len(inside) < 4 or len(ring) < 4:
+        return 0.0
+    both = np.concatenate([inside, ring])
+    w_in = len(inside)/len(both)
+    between = w_in*(1 - w_in)*(inside.mean() - ring.mean())**2
+    return float(between/max(both.var(), 1E-12))
+
+
+class HoleDetector():
+    """
+    Finds the hole of a cork on a downsampled frame and places the hole and patch
+    windows around it.
+
+    -> method: 'blob' (cv2.SimpleBlobDetector, dark blobs), 'hough' (cv2.HoughCircles)
+    or 'template' (normalized cross correlation with template, a dark disc of
+    expected_radius by default);
+    -> downsample: the frame is reduced by this factor before the detection;
+    -> min_radius, max_radius, expected_radius: hole radius, in full resolution pixels;
+    -> hole_size: side of the hole window, 1.2 times the detected radius if None
+    (the window stays inside the hole);
+    -> patch_size, gap: side of the patch window and distance between the hole edge
+    and the patch window. The patch goes above the hole as in the notebooks (below,
+    left or right when it does not fit in the frame);
+    -> min_confidence: detections below it are rejected (see detect_rois).
+
+    The confidence is the separability of the gray levels inside the detected circle
+    and in the ring around it, the same for all the methods.
+    """
+
+    def __init__(self, method='blob', downsample=4, min_radius=20, max_radius=200,
+                 expected_radius=60, hole_size=None, patch_size=200, gap=20,
+                 min_confidence=0.4, template=None):
+        assert method in ('hough', 'blob', 'template')
+        self.method = method
+        self.downsample = downsample
+        self.min_radius = min_radius
+        self.max_radius = max_radius
+        self.expected_radius = expected_radius
+        self.hole_size = hole_size
+        self.patch_size = patch_size
+        self.gap = gap
+        self.min_confidence = min_confidence
+        self.template = template
+
+    def _prepare(self, image):
+        image = np.asarray(image)
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        image = image.astype(np.uint8)
+        if self.downsample > 1:
+            size = (image.shape[1]//self.downsample, image.shape[0]//self.downsample)
+            image = cv2.resize(image, size, interpolation = cv2.INTER_AREA)
+        return cv2.GaussianBlur(image, (5, 5), 0)
+
+    def _hough(self, small):
+        # The median removes the texture edges that otherwise flood the accumulator
+        small = cv2.medianBlur(small, 7)
+        circles = cv2.HoughCircles(small, cv2.HOUGH_GRADIENT, dp = 1,
+                                   minDist = max(small.shape),
+                                   param1 = 60, param2 = 15,
+                                   minRadius = max(self.min_radius//self.downsample, 1),
+                                   maxRadius = self.max_radius//self.downsample)
+        if circles is None:
+            return []
+        return [tuple(circle[:3]) for circle in circles[0]]
+
+    def _blob(self, small):
+        params = cv2.SimpleBlobDetector_Params()
+        params.filterByColor = True
+        params.blobColor = 0
+        params.filterByArea = True
+        params.minArea = np.pi*(self.min_radius/self.downsample)**2
+        params.maxArea = np.pi*(self.max_radius/self.downsample)**2
+        params.filterByCircularity = True
+        params.minCircularity = 0.6
+        params.filterByInertia = False
+        params.filterByConvexity = False
+        keypoints = cv2.SimpleBlobDetector_create(params).detect(small)
+        return [(kp.pt[0], kp.pt[1], kp.size/2) for kp in keypoints]
+
+    def _template(self, small):
+        if self.template is None:
+            r = max(self.expected_radius//self.downsample, 2)
+            template = np.full((4*r + 1, 4*r + 1), 255, dtype=np.uint8)
+            cv2.circle(template, (2*r, 2*r), r, 0, -1)
+        else:
+            template = self._prepare(self.template)
+            r = min(template.shape)/4
+        match = cv2.matchTemplate(small, template, cv2.TM_CCOEFF_NORMED)
+        _, _, _, (x, y) = cv2.minMaxLoc(match)
+        return [(x + template.shape[1]/2, y + template.shape[0]/2, r)]
+
+    def patch_roi(self, cx, cy, radius, shape):
+        """
+        Patch window next to the hole, at gap from its edge, inside the frame.
+        """
+        half = self.patch_size//2
+        offset = int(round(radius)) + self.gap + half
+        h, w = shape[:2]
+        for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0)):
+            x, y = cx + dx*offset, cy + dy*offset
+            if half <= x <= w - half and half <= y <= h - half:
+                return square_roi(x, y, self.patch_size)
+        return None
+
+    def hole_roi(self, cx, cy, radius):
+        size = self.hole_size if self.hole_size is not None else max(int(1.2*radius), 4)
+        return square_roi(cx, cy, size)
+
+    def detect(self, image):
+        """
+        Detects the hole in a frame (0-255). Returns a dictionary with the center
+        (x, y) and radius in full resolution pixels, the confidence, the hole and patch
+        windows (rois, None when nothing was found or the patch window does not fit in
+        the frame) and the detection time.
+        """
+        t_start = time.perf_counter()
+        small = self._prepare(image)
+        candidates = {'hough': self._hough, 'blob': self._blob, 'template': self._template}[self.method](small)
+
+        best = None
+        for x, y, r in candidates:
+            confidence = _ring_separability(small, x, y, r)
+            if best is None or confidence > best[3]:
+                best = (x, y, r, confidence)
+
+        result = {'method': self.method, 'center': None, 'radius': None, 'confidence': 0.0, 'rois': None}
+        if best is not None:
+            x, y, r, confidence = best
+            cx, cy = int(round(x*self.downsample)), int(round(y*self.downsample))
+            radius = r*self.downsample
+            patch = self.patch_roi(cx, cy, radius, np.shape(image))
+            result.update({'center': (cx, cy), 'radius': radius, 'confidence': confidence,
+                           'rois': None if patch is None else [self.hole_roi(cx, cy, radius), patch]})
+        result['time'] = time.perf_counter() - t_start
+        return result
+
+
+def pick_center(image):
+    """
+    Manual fallback: shows the frame and waits for a click on the hole.
+    Returns the (x, y) of the click.
+    """
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+    ax.imshow(image, cmap = 'gray')
+    ax.set_title('Click on the hole')
+    (x, y), = plt.ginput(1, timeout = 0)
+    plt.close(fig)
+    return int(x), int(y)
+
+
+def detect_rois(camera, detector=None, manual=pick_center):
+    """
+    Hole and patch windows of the cork under the camera. Falls back to manual (a
+    callable taking the frame and returning the hole center) when the detection
+    confidence is below detector.min_confidence; with manual=None the low
+    confidence detection is returned as it is. Without detector the center comes
+    straight from manual (windows with the default HoleDetector geometry).
+    Raises ValueError when there are no windows to return: nothing detected and no
+    manual, or no room in the frame for the patch window next to the hole.
+    """
+    image = (camera.get_image()*255).astype(np.uint8)
+    if detector is None:
+        assert manual is not None, "detect_rois needs a detector or a manual fallback."
+        geometry = HoleDetector()
+        result = {'method': None, 'center': None, 'radius': None, 'confidence': 0.0, 'rois': None, 'time': 0.0}
+    else:
+        geometry = detector
+        result = detector.detect(image)
+    result['manual'] = False
+    if (detector is None or result['rois'] is None or result['confidence'] < detector.min_confidence) \
+            and manual is not None:
+        cx, cy = manual(image)
+        radius = result['radius'] if result['radius'] is not None else geometry.expected_radius
+        patch = geometry.patch_roi(cx, cy, radius, image.shape)
+        if patch is None:
+            raise ValueError("No room for the patch window next to the hole at " + str((cx, cy)) + ".")
+        result.update({'center': (cx, cy), 'radius': radius, 'manual': True,
+                       'rois': [geometry.hole_roi(cx, cy, radius), patch]})
+    if result['rois'] is None:
+        raise ValueError("No hole detected (or no room for the patch window next to it).")
+    return result
@@ -0,0 +1,84 @@
+# roi_tracking.py
+
+"""
+Description: Tracking of the lateral drift of the cork image during a focus search, so that the
+ROIs follow the hole and can be made just as large as the hole.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import cv2
+
+
+class RoiTracker():
+    """
+    Follows a feature (the hole by default) with FFT phase correlation between the
+    frames of consecutive positions and shifts all the ROIs by the accumulated drift.
+
+    The template is a template_size square centered on the ROI roi_index; each new
+    frame is correlated with the template taken from the previous frame at the
+    tracked position, so the slow change of the image with focus does not matter.
+
+    -> min_response: phase correlation peaks below this value are ignored (the
+    ROIs stay where they were);
+    -> max_shift: shifts (pixels) larger than this between two positions are ignored.
+    """
+
+    def __init__(self, template_size=128, roi_index=0, min_response=0.05, max_shift=None):
+        self.template_size = template_size
+        self.roi_index = roi_index
+        self.min_response = min_response
+        self.max_shift = template_size/4 if max_shift is None else max_shift
+        self.reset()
+
+    def reset(self):
+        self.rois = None
+        self.reference = None
+        self.offset = np.zeros(2)
+        self.offsets = []
+        self.responses = []
+
+    def _window(self, image, offset):
+        """
+        Template window around the tracked ROI center, moved by offset and kept inside the image.
+        """
+        y0, y1, x0, x1 = self.rois[self.roi_index]
+        half = self.template_size//2
+        h, w = image.shape[:2]
+        cx = int(np.clip(round((x0 + x1)/2 + offset[0]), half, w - half))
+        cy = int(np.clip(round((y0 + y1)/2 + offset[1]), half, h - half))
+        return np.asarray(image[cy - half : cy + half, cx - half : cx + half], dtype=np.float32)
+
+    def _shifted(self, shape):
+        dx, dy = np.round(self.offset).astype(int)
+        h, w = shape[:2]
+        rois = []
+        for y0, y1, x0, x1 in self.rois:
+            dy_roi = int(np.clip(dy, -y0, h - y1))
+            dx_roi = int(np.clip(dx, -x0, w - x1))
+            rois.append((y0 + dy_roi, y1 + dy_roi, x0 + dx_roi, x1 + dx_roi))
+        return rois
+
+    def start(self, image, rois):
+        """
+        Takes the template from the first frame of a search. rois: (y0, y1, x0, x1) windows.
+        """
+        self.reset()
+        self.rois = list(rois)
+        self.reference = self._window(image, self.offset)
+        self.window = cv2.createHanningWindow((self.template_size, self.template_size), cv2.CV_32F)
+        return list(self.rois)
+
+    def update(self, image):
+        """
+        Measures the drift from the previous frame and returns the shifted ROIs.
+        """
+        current = self._window(image, self.offset)
+        (dx, dy), response = cv2.phaseCorrelate(self.reference, current, self.window)
+        self.responses.append(response)
+        if response >= self.min_response and np.hypot(dx, dy) <= self.max_shift:
+            self.offset += (dx, dy)
+        self.reference = self._window(image, self.offset)
+        self.offsets.append(self.offset.copy())
+        return self._shifted(np.shape(image))
@@ -0,0 +1,153 @@
+# settle.py
+
+"""
+Description: Detection of the end of the stage settling after a move, used instead of a fixed sleep.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import time
+import cv2
+
+
+class SettleDetector():
+    """
+    Waits for the stage motion-complete status and then compares consecutive
+    low resolution frames until the image stops changing.
+
+    -> roi: (y0, y1, x0, x1) window used for the comparison, the full frame if None,
+    in full frame coordinates (see set_geometry for cropped or binned readouts);
+    -> downsample: the window is reduced by this factor before comparing;
+    -> method: 'difference' (mean absolute difference between frames) or
+    'phase' (shift given by phase correlation, in full resolution pixels);
+    -> threshold_factor: the image is stable when the change is below
+    threshold_factor times the change measured between frames at rest (see calibrate);
+    -> max_wait: maximum time (s) waited for the image to stabilize;
+    -> clock: time source (perf_counter) of the settle times, the one of the stage and
+    camera (the time module for the hardware).
+
+    Every call to wait appends the settle time to settle_times, so vibration
+    problems show up as long or unusually spread settle times.
+    """
+
+    def __init__(self, camera, roi=None, downsample=4, method='difference',
+                 threshold_factor=3.0, max_wait=2.0, noise=None, clock=time):
+        assert method in ('difference', 'phase')
+        self.camera = camera
+        self.roi = roi
+        self.downsample = downsample
+        self.method = method
+        self.threshold_factor = threshold_factor
+        self.max_wait = max_wait
+        self.noise = noise
+        self.clock = clock
+        self.settle_times = []
+        self.n_frames = 0
+        self.offset = (0, 0)
+        self.binning = 1
+
+    def set_geometry(self, offset=(0, 0), binning=1):
+        """
+        Readout window origin (x, y), in the coordinates of roi, and hardware binning of
+        the frames the camera returns from now on (see FocusSearch.search). roi is mapped
+        into them.
+        """
+        self.offset = tuple(offset)
+        self.binning = binning
+
+    def frame_roi(self, shape):
+        """
+        roi in the coordinates of frames of shape, clipped to them.
+        """
+        y0, y1, x0, x1 = self.roi
+        dx, dy = self.offset
+        b = self.binning
+        roi = (max((y0 - dy)//b, 0), min((y1 - dy)//b, shape[0]),
+               max((x0 - dx)//b, 0), min((x1 - dx)//b, shape[1]))
+        assert roi[0] < roi[1] and roi[2] < roi[3], "The settle roi is outside the readout window."
+        return roi
+
+    def _low_res(self, image):
+        if self.roi is not None:
+            y0, y1, x0, x1 = self.frame_roi(image.shape)
+            image = image[y0:y1, x0:x1]
+        image = np.asarray(image, dtype=np.float32)
+        if self.downsample > 1:
+            size = (max(image.shape[1]//self.downsample, 1), max(image.shape[0]//self.downsample, 1))
+            image = cv2.resize(image, size, interpolation = cv2.INTER_AREA)
+        return image
+
+    def _grab(self):
+        image = self.camera.get_image()
+        self.n_frames += 1
+        return image, self._low_res(image)
+
+    def change(self, previous, current):
+        """
+        Change between two low resolution frames.
+        """
+        if self.method == 'difference':
+            return float(np.mean(np.abs(current - previous)))
+        window = cv2.createHanningWindow(current.shape[::-1], cv2.CV_32F)
+        (dx, dy), _ = cv2.phaseCorrelate(previous, current, window)
+        return float(np.hypot(dx, dy))*self.downsample
+
+    def calibrate(self, n_frames=5):
+        """
+        Measures the frame to frame change with the stage at rest. The median
+        of the changes is the noise level used for the threshold.
+        """
+        _, previous = self._grab()
+        changes = []
+        for i in range(n_frames):
+            _, current = self._grab()
+            changes.append(self.change(previous, current))
+            previous = current
+        self.noise = float(np.median(changes))
+        return self.noise
+
+    @property
+    def threshold(self):
+        if self.noise is None:
+            self.calibrate()
+        return self.threshold_factor*max(self.noise, 1E-6)
+
+    def wait(self, stage):
+        """
+        Blocks until the stage reports the end of the motion and two consecutive
+        frames differ by less than the threshold. Returns the last frame, which
+        is already stable and can be used as the measurement. Without noise level the
+        first call calibrates once the motion has ended, so that motion blur does not
+        enter the noise floor.
+        """
+        t_start = self.clock.perf_counter()
+        stage.wait_move()
+        threshold = self.threshold
+
+        image, previous = self._grab()
+        while True:
+            image, current = self._grab()
+            if self.change(previous, current) <= threshold:
+                break
+            if self.clock.perf_counter() - t_start > self.max_wait:
+                print("WARNING: the image did not stabilize in " + str(self.max_wait) + "s.")
+                break
+            previous = current
+
+        self.settle_times.append(self.clock.perf_counter() - t_start)
+        return image
+
+    def report(self):
+        """
+        Statistics of the settle times recorded so far, in seconds.
+        """
+        settle_times = np.array(self.settle_times)
+        if len(settle_times) == 0:
+            return {'n_steps': 0}
+        return {'n_steps': len(settle_times),
+                'mean': float(settle_times.mean()),
+                'std': float(settle_times.std()),
+                'median': float(np.median(settle_times)),
+                'max': float(settle_times.max()),
+                'total': float(settle_times.sum())}
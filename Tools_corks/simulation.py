@@ -0,0 +1,359 @@
+# simulation.py
+
+"""
+Description: Simulated stage and camera used to test the focus and depth measurements without hardware.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import time
+import threading
+import cv2
+from collections import namedtuple
+
+
+STAGE_SCALE = 409600E-3 # Converts micrometers to the stage internal units (NRT150).
+
+TVelocityParams = namedtuple("TVelocityParams", ["min_velocity", "acceleration", "max_velocity"])
+
+
+class SimulatedStage():
+    """
+    Stand-in for Thorlabs.KinesisMotor. Positions and velocities are in the
+    stage internal units (encoder counts, STAGE_SCALE per micrometer), the scale
+    argument of the methods is accepted for compatibility and ignored.
+
+    move_by/move_to return immediately, as in pylablib; is_moving and wait_move
+    report the motion state. The motion follows the controller:
+    -> trapezoidal velocity profile with acceleration and max_velocity (a triangular
+    one for short moves); a new command during a move starts from the current
+    position and velocity, decelerating first when it reverses the direction;
+    -> the commanded positions are whole encoder counts and get_position reads the
+    encoder, quantized to counts;
+    -> backlash: the carriage (what the camera sees, actual_position) follows the
+    motor with a dead band of backlash counts, so it lags by backlash after a reversal;
+    -> settle ringing: once the profile ends (is_moving False) the carriage oscillates
+    at resonance_hz, decaying with ringing_time (s), with the amplitude of a spring
+    loaded by the deceleration times ringing (0 to disable).
+    """
+
+    def __init__(self, position=0, max_velocity=409600, acceleration=4096000, backlash=0.0,
+                 resonance_hz=60.0, ringing=1.0, ringing_time=0.015, clock=time):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.velocity_params = TVelocityParams(0, acceleration, max_velocity)
+        self.backlash = backlash
+        self.resonance_hz = resonance_hz
+        self.ringing = ringing
+        self.ringing_time = ringing_time
+        self._target = float(round(position))
+        self._segments = [(clock.perf_counter(), self._target, 0.0, 0.0, 0.0, self._target)]
+        self._ring = (0.0, self._segments[0][0])
+
+    def _segment_state(self, segment, t):
+        t0, p0, v0, a, duration, load0 = segment
+        dt = min(max(t - t0, 0.0), duration)
+        motor = p0 + v0*dt + a*dt*dt/2
+        # Dead band: the carriage only moves when the motor pushes it
+        load = min(max(load0, motor - self.backlash/2), motor + self.backlash/2)
+        return motor, v0 + a*dt, load
+
+    def _state_at(self, t, ringing=True):
+        """
+        Motor position, motor velocity and carriage position at t.
+        """
+        segment = self._segments[-1]
+        for candidate in self._segments:
+            if t < candidate[0] + candidate[4]:
+                segment = candidate
+                break
+        motor, velocity, load = self._segment_state(segment, t)
+        t_end = self._segments[-1][0] + self._segments[-1][4]
+        amplitude, t_ring = self._ring
+        if ringing and t >= t_end and amplitude != 0:
+            dt = t - t_ring
+            load += amplitude*np.exp(-dt/self.ringing_time)*np.sin(2*np.pi*self.resonance_hz*dt)
+        return motor, velocity, load
+
+    def _plan(self, t, target):
+        """
+        Segments (t0, p0, v0, a, duration, load0) from the current state to target.
+        """
+        a_max, v_max = self.velocity_params.acceleration, self.velocity_params.max_velocity
+        # A new move damps the ringing of the previous one
+        p, v, load = self._state_at(t, ringing = False)
+        segments = []
+
+        def add(a, duration):
+            nonlocal t, p, v, load
+            segment = (t, p, v, a, duration, load)
+            segments.append(segment)
+            p, v, load = self._segment_state(segment, t + duration)
+            t += duration
+
+        distance = target - p
+        # Reversal, or too fast to stop before the target: stop first
+        if v != 0 and (np.sign(v) != np.sign(distance) or v*v/(2*a_max) > abs(distance)):
+            add(-np.sign(v)*a_max, abs(v)/a_max)
+            distance = target - p
+        direction = np.sign(distance)
+        speed = abs(v)
+        remaining = abs(distance)
+        if remaining > 0:
+            peak = np.sqrt((2*a_max*remaining + speed*speed)/2)
+            if peak <= v_max:
+                add(direction*a_max, (peak - speed)/a_max)
+                add(-direction*a_max, peak/a_max)
+            else:
+                add(np.sign(v_max - speed)*direction*a_max, abs(v_max - speed)/a_max)
+                cruise = remaining - abs(v_max*v_max - speed*speed)/(2*a_max) - v_max*v_max/(2*a_max)
+                add(0.0, cruise/v_max)
+                add(-direction*a_max, v_max/a_max)
+        # Exact arrival, free of the rounding of the durations
+        add(0.0, 0.0)
+        t0, _, _, _, _, load0 = segments[-1]
+        segments[-1] = (t0, float(target), 0.0, 0.0, 0.0, min(max(load0, target - self.backlash/2), target + self.backlash/2))
+        return segments
+
+    def _start_move(self, target):
+        with self.lock:
+            t = self.clock.perf_counter()
+            self._target = float(round(target))
+            self._segments = self._plan(t, self._target)
+            decelerating = [segment for segment in self._segments if segment[3] != 0]
+            amplitude = 0.0
+            if self.ringing > 0 and decelerating:
+                amplitude = self.ringing*abs(decelerating[-1][3])/(2*np.pi*self.resonance_hz)**2
+            self._ring = (amplitude, self._segments[-1][0])
+
+    def get_position(self, channel=None, scale=True):
+        """
+        Encoder reading (whole counts).
+        """
+        with self.lock:
+            return float(round(self._state_at(self.clock.perf_counter())[0]))
+
+    def actual_position(self):
+        """
+        Position of the carriage (backlash and ringing included), in counts.
+        """
+        with self.lock:
+            return self._state_at(self.clock.perf_counter())[2]
+
+    def move_by(self, distance, channel=None, scale=True):
+        self._start_move(self._target + distance)
+
+    def move_to(self, position, channel=None, scale=True):
+        self._start_move(position)
+
+    def is_moving(self, channel=None):
+        with self.lock:
+            segment = self._segments[-1]
+            return self.clock.perf_counter() < segment[0] + segment[4]
+
+    def wait_move(self, channel=None, timeout=None):
+        t_end = None if timeout is None else self.clock.perf_counter() + timeout
+        while self.is_moving():
+            if t_end is not None and self.clock.perf_counter() > t_end:
+                raise TimeoutError("Simulated stage did not stop moving in time")
+            self.clock.sleep(0.001)
+
+    def jog(self, direction, channel=None, kind="continuous"):
+        """
+        Continuous jog: moves towards a far target until stop is called.
+        """
+        sign = 1 if direction in ("+", 1, True) else -1
+        self._start_move(self.get_position() + sign*1E12)
+
+    def stop(self, immediate=False, sync=True, channel=None):
+        """
+        Profiled stop (decelerating with acceleration) or immediate stop.
+        """
+        with self.lock:
+            t = self.clock.perf_counter()
+            p, v, load = self._state_at(t)
+        if immediate or v == 0:
+            with self.lock:
+                self._target = float(round(p))
+                self._segments = [(t, self._target, 0.0, 0.0, 0.0, load)]
+                self._ring = (0.0, t)
+        else:
+            self._start_move(p + np.sign(v)*v*v/(2*self.velocity_params.acceleration))
+        if sync:
+            self.wait_move()
+
+    def setup_velocity(self, min_velocity=None, acceleration=None, max_velocity=None, channel=None, scale=True):
+        with self.lock:
+            self.velocity_params = TVelocityParams(
+                self.velocity_params.min_velocity if min_velocity is None else min_velocity,
+                self.velocity_params.acceleration if acceleration is None else acceleration,
+                self.velocity_params.max_velocity if max_velocity is None else max_velocity)
+        # The move in progress continues with the new parameters
+        if self.is_moving():
+            self._start_move(self._target)
+        return self.velocity_params
+
+    def get_velocity_parameters(self, channel=None, scale=True):
+        return self.velocity_params
+
+    def close(self):
+        pass
+
+
+class SimulatedCamera():
+    """
+    Synthetic cork seen from above: a textured surface with a circular hole whose
+    bottom is hole_depth_um deeper than the surface. Each region is blurred
+    according to its distance to focus, computed from the position of the stage
+    at the middle of the exposure, plus gaussian noise.
+
+    Implements the same methods as the camera objects of camera_controllers, so
+    it can be passed wherever a CameraController is used. get_image returns the
+    average of n_frames frames in the 0-1 range.
+
+    -> surface_focus_um: stage position (um) where the surface is in focus;
+    -> hole_center: (x, y) of the hole, or a list of centers for a cork with several holes;
+    -> hole_depth_um: depth of the hole, the bottom is in focus at surface_focus_um + hole_depth_um
+    (a list with the depth of each hole with several holes);
+    -> blur_per_um: gaussian blur sigma (pixels) added per micrometer of defocus;
+    -> drift_px_per_um: (x, y) lateral shift of the image per micrometer of stage travel
+    (an optical axis not parallel to the stage);
+    -> exposure: exposure time in us, the call blocks for this long per frame;
+    -> readout_rate: pixels read per second, the readout of the window set with
+    set_readout_window blocks for its size over readout_rate (no readout time if None);
+    -> max_binning: largest factor accepted by set_binning (1 for a camera without binning).
+
+    cpu_time and render_time accumulate the CPU time (time.process_time) and the wall
+    time spent synthesizing the frames (rendering, noise, binning), which a real camera
+    does not cost the host, so benchmarks can subtract them.
+    """
+
+    def __init__(self, stage, shape=(1200, 1600), hole_center=None, hole_radius=60,
+                 surface_focus_um=150, hole_depth_um=250, blur_per_um=0.05, noise=0.01,
+                 drift_px_per_um=(0.0, 0.0), exposure=8000, readout_rate=None,
+                 max_binning=4, n_frames=1, scale=STAGE_SCALE, seed=0, clock=time):
+        self.stage = stage
+        self.shape = shape
+        self.hole_center = (shape[1]//2, shape[0]//2) if hole_center is None else hole_center
+        centers = [self.hole_center] if np.ndim(self.hole_center) == 1 else self.hole_center
+        depths = np.broadcast_to(hole_depth_um, len(centers))
+        self.hole_radius = hole_radius
+        self.surface_focus_um = surface_focus_um
+        self.hole_depth_um = hole_depth_um
+        self.blur_per_um = blur_per_um
+        self.drift_px_per_um = drift_px_per_um
+        self.noise = noise
+        self.scale = scale
+        self.clock = clock
+        self.rng = np.random.default_rng(seed)
+        self.readout_rate = readout_rate
+        self.current_params = {"exposure": exposure, "n_frames": n_frames}
+        self.window = (0, 0, shape[1], shape[0])
+        self.max_binning = max_binning
+        self.binning = 1
+        self.ready = False
+        self.cpu_time = 0.0
+        self.render_time = 0.0
+
+        texture = self.rng.random((shape[0]//4 + 1, shape[1]//4 + 1))
+        texture = cv2.resize(texture, (shape[1], shape[0]), interpolation = cv2.INTER_NEAREST)
+        self.texture = (0.25 + 0.5*texture).astype(np.float32)
+
+        yy, xx = np.mgrid[0:shape[0], 0:shape[1]]
+        self.hole_mask = np.zeros(shape, np.float32)
+        # One mask per distinct depth, so that each depth is blurred once per frame
+        self.hole_masks = {}
+        for (cx, cy), depth in zip(centers, depths):
+            mask = ((xx - cx)**2 + (yy - cy)**2 <= hole_radius**2).astype(np.float32)
+            self.hole_masks[float(depth)] = self.hole_masks.get(float(depth), 0) + mask
+            self.hole_mask += mask
+
+    def _blurred(self, image, defocus_um):
+        sigma = 0.3 + abs(defocus_um)*self.blur_per_um
+        return cv2.GaussianBlur(image, (0, 0), sigma)
+
+    def render(self, z_um):
+        """
+        Noise free image for the stage at z_um.
+        """
+        surface = self._blurred(self.texture, z_um - self.surface_focus_um)
+        image = surface*(1 - self.hole_mask)
+        for depth, mask in self.hole_masks.items():
+            image += 0.6*self._blurred(self.texture, z_um - self.surface_focus_um - depth)*mask
+        if any(self.drift_px_per_um):
+            shift = np.float32([[1, 0, self.drift_px_per_um[0]*z_um], [0, 1, self.drift_px_per_um[1]*z_um]])
+            image = cv2.warpAffine(image, shift, image.shape[::-1], borderMode = cv2.BORDER_REFLECT)
+        return image
+
+    def get_frame(self):
+        exposure_s = self.current_params["exposure"]*1E-6
+        self.clock.sleep(exposure_s/2)
+        position = self.stage.actual_position() if hasattr(self.stage, 'actual_position') else self.stage.get_position()
+        z_um = position/self.scale
+        self.clock.sleep(exposure_s/2)
+        x0, y0, width, height = self.window
+        b = self.binning
+        if self.readout_rate is not None:
+            self.clock.sleep(width*height/b**2/self.readout_rate)
+        cpu_start, t_start = time.process_time(), time.perf_counter()
+        frame = self.render(z_um)[y0:y0 + height, x0:x0 + width]
+        frame = frame + self.rng.normal(0, self.noise, frame.shape)
+        if b > 1:
+            frame = frame[:height//b*b, :width//b*b].reshape(height//b, b, width//b, b).mean(axis = (1, 3))
+        frame = np.clip(frame, 0, 1)
+        self.cpu_time += time.process_time() - cpu_start
+        self.render_time += time.perf_counter() - t_start
+        return frame
+
+    def get_readout_window(self):
+        return self.window
+
+    def set_readout_window(self, x0, y0, width, height):
+        # Same increments as the XIMEA cameras (16 pixels in x, 2 in y)
+        x = max(x0//16*16, 0)
+        y = max(y0//2*2, 0)
+        width = min(-(-(width + x0 - x)//16)*16, self.shape[1] - x)
+        height = min(-(-(height + y0 - y)//2)*2, self.shape[0] - y)
+        self.window = (x, y, width, height)
+        return self.window
+
+    def get_binning(self):
+        return self.binning
+
+    def set_binning(self, factor):
+        self.binning = min(factor, self.max_binning)
+        return self.binning
+
+    def get_camera_ready(self):
+        self.ready = True
+
+    def get_image(self):
+        frames = [self.get_frame() for i in range(self.current_params["n_frames"])]
+        cpu_start, t_start = time.process_time(), time.perf_counter()
+        image = np.mean(frames, axis=0)
+        self.cpu_time += time.process_time() - cpu_start
+        self.render_time += time.perf_counter() - t_start
+        return image
+
+    def set_properties(self, properties):
+        for key in self.current_params:
+            if key in properties:
+                self.current_params[key] = properties[key]
+
+    def get_camera_properties(self, ret=False):
+        print(self.current_params)
+        if ret:
+            return self.current_params
+
+    def get_properties(self, ret=False):
+        return self.get_camera_properties(ret=ret)
+
+    def save_properties(self, folder_path):
+        print("Method not implemented for the simulated camera!")
+
+    def stop_camera(self):
+        self.ready = False
+
+    def close(self):
+        pass
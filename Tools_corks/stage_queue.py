@@ -0,0 +1,246 @@
+# stage_queue.py
+
+"""
+Description: Non-blocking access to a stage: a worker thread owns the (serial) stage connection,
+executes queued commands, coalesces redundant ones and keeps the position cached.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+
+class StageCommand():
+    def __init__(self, kind, value=None):
+        self.kind = kind
+        self.value = value
+        self.futures = []
+        self.target = None
+
+
+class StageController():
+    """
+    Wraps a KinesisMotor like stage so that no caller waits on its serial connection.
+
+    move_to, move_by, jog and stop only queue a command and return a
+    concurrent.futures.Future (asyncio.wrap_future gives an awaitable), completed with
+    the position (internal units) at the end of the move; jog completes when it is
+    sent, with the position read from the stage then, and stop (together with the move
+    it interrupts) once the stage has halted, with the position where it stopped.
+    A dedicated thread sends the commands in order, one move at a time,
+    and polls the position and the motion status every poll_interval seconds, so
+    get_position and is_moving answer from the cache.
+
+    Commands still waiting in the queue are coalesced with the new ones:
+    -> consecutive move_by add up, a move_by after a move_to shifts its target;
+    -> a move_to replaces the moves waiting before it;
+    -> a jog replaces a waiting jog (the same jog twice is sent once);
+    -> stop drops every waiting command (their futures are cancelled) and goes first.
+    The futures of coalesced commands complete together with the command they joined.
+
+    With wait_move and the same method names as the stage, it can replace the stage
+    in FocusSearch, CorkMeter and FlySweep (positions in internal units, scale = False;
+    setup_velocity and get_velocity_parameters are passed through to the stage once the
+    queued moves are complete).
+    A move is complete when the stage stops within tolerance (internal units) of the
+    target, or after idle_polls polls stopped elsewhere (e.g. after a stop).
+    """
+
+    def __init__(self, stage, poll_interval=0.01, tolerance=1, idle_polls=3):
+        self.stage = stage
+        self.poll_interval = poll_interval
+        self.tolerance = tolerance
+        self.idle_polls = idle_polls
+        self.pending = deque()
+        self.active = None
+        self.n_submitted = 0
+        self.n_sent = 0
+        self.n_coalesced = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._n_idle = 0
+        self._position = stage.get_position(scale = False)
+        self._moving = stage.is_moving()
+        self._t_poll = time.perf_counter()
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+
+    def _submit(self, kind, value=None):
+        future = Future()
+        with self._condition:
+            assert not self._closed
+            self.n_submitted += 1
+            last = self.pending[-1] if self.pending else None
+            if kind == 'stop':
+                for command in self.pending:
+                    for waiting in command.futures:
+                        waiting.cancel()
+                self.pending.clear()
+                command = StageCommand(kind)
+                self.pending.appendleft(command)
+            elif last is not None and kind == 'move_by' and last.kind in ('move_by', 'move_to'):
+                last.value += value
+                command = last
+            elif last is not None and kind == 'move_to' and last.kind in ('move_by', 'move_to'):
+                last.kind, last.value = kind, value
+                command = last
+            elif last is not None and kind == 'jog' and last.kind == 'jog':
+                last.value = value
+                command = last
+            else:
+                command = StageCommand(kind, value)
+                self.pending.append(command)
+            if command.futures:
+                self.n_coalesced += 1
+            command.futures.append(future)
+            self._condition.notify_all()
+        return future
+
+    def move_to(self, position, scale=False):
+        assert not scale, "StageController works in the stage internal units (scale = False)"
+        return self._submit('move_to', position)
+
+    def move_by(self, distance, scale=False):
+        assert not scale, "StageController works in the stage internal units (scale = False)"
+        return self._submit('move_by', distance)
+
+    def jog(self, direction, kind="continuous"):
+        return self._submit('jog', direction)
+
+    def stop(self, immediate=False):
+        return self._submit('stop', immediate)
+
+    def setup_velocity(self, *args, **kwargs):
+        self.wait_move()
+        return self.stage.setup_velocity(*args, **kwargs)
+
+    def get_velocity_parameters(self, *args, **kwargs):
+        return self.stage.get_velocity_parameters(*args, **kwargs)
+
+    def get_position(self, scale=False):
+        """
+        Position at the last poll (internal units), without talking to the stage.
+        """
+        assert not scale, "StageController works in the stage internal units (scale = False)"
+        return self._position
+
+    def position_age(self):
+        return time.perf_counter() - self._t_poll
+
+    def is_moving(self):
+        """
+        True while a move is queued or running, or the stage moved at the last poll.
+        """
+        with self._condition:
+            return bool(self.pending) or self.active is not None or self._moving
+
+    def wait_move(self, timeout=None):
+        """
+        Blocks until every queued move is complete. Returns False on timeout.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not any(command.kind in ('move_to', 'move_by')
+                                                            for command in self.pending)
+                                            and self.active is None, timeout)
+
+    def _send(self, command):
+        """
+        Sends command. A move or stop is already active (set with its target by _run under
+        the lock), so wait_move and is_moving see it during the serial call.
+        """
+        try:
+            if command.kind == 'move_to':
+                self.stage.move_to(command.value, scale = False)
+            elif command.kind == 'move_by':
+                self.stage.move_by(command.value, scale = False)
+            elif command.kind == 'jog':
+                self.stage.jog(command.value)
+            else:
+                self.stage.stop(immediate = command.value)
+        except Exception as error:
+            with self._condition:
+                if self.active is command:
+                    self.active = None
+                    self._condition.notify_all()
+            for future in command.futures:
+                future.set_exception(error)
+            return
+        self.n_sent += 1
+        if command.kind == 'jog':
+            try:
+                position = self.stage.get_position(scale = False)
+            except Exception as error:
+                for future in command.futures:
+                    future.set_exception(error)
+                return
+            for future in command.futures:
+                future.set_result(position)
+
+    def _poll(self):
+        try:
+            position = self.stage.get_position(scale = False)
+            moving = self.stage.is_moving()
+        except Exception as error:
+            print("WARNING: stage poll failed: " + str(error))
+            return
+        with self._condition:
+            self._position, self._moving, self._t_poll = position, moving, time.perf_counter()
+            command = self.active
+            if command is None or moving:
+                return
+            self._n_idle += 1
+            off_target = command.target is not None and abs(position - command.target) > self.tolerance
+            if off_target and self._n_idle < self.idle_polls:
+                return
+            self.active = None
+            self._condition.notify_all()
+        for future in command.futures:
+            future.set_result(position)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # A move waits for the previous one, jog and stop go out at once
+                ready = lambda: bool(self.pending) and (self.active is None or self.pending[0].kind in ('jog', 'stop'))
+                if not ready() and not self._closed:
+                    self._condition.wait(self.poll_interval)
+                if self._closed:
+                    break
+                command = self.pending.popleft() if ready() else None
+                if command is not None:
+                    if command.kind == 'move_to':
+                        command.target = command.value
+                    elif command.kind == 'move_by':
+                        command.target = self._position + command.value
+                    if command.kind == 'stop' and self.active is not None:
+                        # The interrupted move completes with the stop, where the stage halts
+                        command.futures = self.active.futures + command.futures
+                    if command.kind != 'jog':
+                        self._n_idle = 0
+                        self.active = command
+            if command is not None:
+                self._send(command)
+            self._poll()
+
+    def report(self):
+        return {'n_submitted': self.n_submitted,
+                'n_sent': self.n_sent,
+                'n_coalesced': self.n_coalesced,
+                'position': self._position,
+                'position_age': self.position_age()}
+
+    def close(self):
+        """
+        Stops the worker thread (queued commands are cancelled).
+        """
+        with self._condition:
+            self._closed = True
+            for command in self.pending:
+                for future in command.futures:
+                    future.cancel()
+            self.pending.clear()
+            self._condition.notify_all()
+        self._thread.join()
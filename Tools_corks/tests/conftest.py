@@ -0,0 +1,56 @@
+# conftest.py
+
+"""
+Description: Shared helpers of the tests: the modules of Tools_corks on the path and a virtual
+clock, so the simulated stage and camera run without waiting for their motion and exposures.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from simulation import SimulatedStage, SimulatedCamera, STAGE_SCALE
+from focus_search import square_roi
+
+
+class VirtualClock():
+    """
+    perf_counter and sleep of the time module, where sleep only advances the clock.
+    """
+
+    def __init__(self):
+        self.t = 0.0
+
+    def perf_counter(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.t += max(seconds, 0.0)
+
+
+HOLE_CENTER = (400, 400)
+
+
+def simulated_cork(backlash_um=0.0, hole_depth_um=250, surface_focus_um=150, position_um=0.0, **camera_options):
+    """
+    SimulatedStage and SimulatedCamera (600 x 800 frames, virtual clock) of a cork with
+    the hole at HOLE_CENTER, and its hole and patch ROIs.
+    """
+    clock = VirtualClock()
+    stage = SimulatedStage(position = position_um*STAGE_SCALE, backlash = backlash_um*STAGE_SCALE,
+                           ringing = 0.0, clock = clock)
+    camera = SimulatedCamera(stage, shape = (600, 800), hole_center = HOLE_CENTER, hole_depth_um = hole_depth_um,
+                             surface_focus_um = surface_focus_um, seed = 1, clock = clock, **camera_options)
+    cx, cy = HOLE_CENTER
+    rois = [square_roi(cx, cy, 50), square_roi(cx, cy, 100, offset = 130)]
+    return stage, camera, rois
+
+
+@pytest.fixture
+def cork():
+    return simulated_cork()
@@ -0,0 +1,51 @@
+# test_adaptive_averaging.py
+
+"""
+Description: Sequential frame averaging of a sweep on the simulated stage and camera: the frames
+go to the focus peaks, which reach the requested precision.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+
+from adaptive_averaging import AdaptiveAveraging, RunningStats
+from focus_search import FocusSearch
+from conftest import simulated_cork
+
+# Hole bottom and surface of the simulated cork
+TRUTH = np.array([400, 150])
+
+
+def test_running_stats():
+    x = np.random.default_rng(0).normal(3, 2, (10, 4))
+    stats = RunningStats()
+    for k, row in enumerate(x):
+        stats.update(row)
+        if k == 0:
+            # No variance from a single frame
+            assert np.all(np.isinf(stats.variance))
+    assert np.allclose(stats.mean, x.mean(axis = 0))
+    assert np.allclose(stats.variance, x.var(axis = 0, ddof = 1))
+    assert np.allclose(stats.std_error, x.std(axis = 0, ddof = 1)/np.sqrt(len(x)))
+
+
+def test_frames_go_to_the_peaks():
+    stage, camera, rois = simulated_cork(noise = 0.05)
+    averaging = AdaptiveAveraging(target_se = 0.01)
+    search = FocusSearch(stage, camera, rois, settle_time = 0, averaging = averaging, peak_method = 'lorentzian')
+    result = search.sweep(450, 10)
+    positions = result['positions']
+    n_frames = np.array(averaging.frames_per_step)
+    assert result['n_frames'] == n_frames.sum()
+    assert np.all(np.abs(result['focus'] - TRUTH) < 1)
+
+    # The noise floor away from the peaks only gets min_frames
+    far = np.min(np.abs(positions[:, None] - TRUTH), axis = 1) > 30
+    assert np.all(n_frames[far] == averaging.min_frames)
+    assert n_frames[~far].sum() > averaging.min_frames*np.sum(~far)
+    # At the peaks the scores are precise, or max_frames were taken
+    for i, z in enumerate(TRUTH):
+        k = np.argmin(np.abs(positions - z))
+        precise = result['score_errors'][k, i] <= averaging.target_se*result['scores'][k, i]
+        assert precise or n_frames[k] == averaging.max_frames
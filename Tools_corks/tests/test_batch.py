@@ -0,0 +1,117 @@
+# test_batch.py
+
+"""
+Description: Ordering of the corks of a tray, and resume of an interrupted batch from its journal,
+on the simulated stage and camera.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import itertools
+import json
+import pytest
+
+from batch import BatchScheduler, plan_order, move_times, path_cost
+from cork_meter import CorkMeter
+from simulation import SimulatedStage, STAGE_SCALE
+from conftest import simulated_cork
+
+POSITIONS = [[0, 0], [1000, 0], [0, 1000], [1000, 1000]]
+
+
+class Interruption(Exception):
+    pass
+
+
+def scheduler(stage, camera, rois, journal_path=None, n_measures=None, positions=POSITIONS, optimize=False):
+    """
+    BatchScheduler of positions whose meter is interrupted after n_measures corks.
+    """
+    meter = CorkMeter(stage, camera, depth_um = 450, search_options = {'um_step': 15}, settle_time = 0)
+    if n_measures is not None:
+        measure = meter.measure
+
+        def interrupted(rois=None):
+            if len(meter.results) == n_measures:
+                raise Interruption()
+            return measure(rois)
+        meter.measure = interrupted
+    return BatchScheduler(meter, SimulatedStage(clock = stage.clock), SimulatedStage(clock = stage.clock),
+                          positions, rois = [rois]*len(positions), optimize = optimize,
+                          journal_path = journal_path)
+
+
+def test_plan_order_close_to_the_shortest_path():
+    ratios = []
+    for seed in range(10):
+        rng = np.random.default_rng(seed)
+        points, start = rng.uniform(0, 10000, (7, 2)), rng.uniform(0, 10000, 2)
+        # The y axis four times slower
+        velocities = [1000, 250]
+        costs = move_times(np.vstack([points, start]), velocities)
+        order = plan_order(points, start, velocities)
+        assert sorted(order) == list(range(len(points)))
+        shortest = min(path_cost(costs, (7,) + path) for path in itertools.permutations(range(7)))
+        ratios.append(path_cost(costs, [7] + list(order))/shortest)
+    assert np.mean(ratios) < 1.02 and max(ratios) < 1.1
+
+
+def test_plan_order_of_a_grid():
+    pitch = 1000
+    grid = np.array([[x, y] for x in range(4) for y in range(3)], dtype=float)*pitch
+    points = grid[np.random.default_rng(0).permutation(len(grid))]
+    order = plan_order(points, start = (0, 0))
+    costs = move_times(np.vstack([points, [0, 0]]), [1, 1])
+    # One pitch between consecutive corks, from the corner
+    assert path_cost(costs, [len(points)] + list(order)) == (len(points) - 1)*pitch
+    assert np.array_equal(points[order[0]], [0, 0])
+
+
+def test_optimized_batch_travel():
+    positions = np.array(POSITIONS + [[500, 500], [0, 500], [1000, 500]])[[0, 3, 4, 1, 6, 2, 5]]
+    travel = []
+    for optimize in (False, True):
+        stage, camera, rois = simulated_cork()
+        batch = scheduler(stage, camera, rois, positions = positions, optimize = optimize)
+        records = batch.run()
+        assert sorted(record['id'] for record in records) == list(range(len(positions)))
+        assert [record['id'] for record in records] == list(batch.order)
+        for record in records:
+            assert abs(record['depth'] - 250) < 15
+        travel.append(batch.report()['xy_travel_um'])
+    assert travel[1] < 0.7*travel[0]
+
+
+def test_resume_keeps_origin(tmp_path):
+    journal_path = str(tmp_path/'journal.jsonl')
+    stage, camera, rois = simulated_cork()
+    origin = stage.get_position(scale = False)
+    with pytest.raises(Interruption):
+        scheduler(stage, camera, rois, journal_path, n_measures = 2).run()
+    # The interruption leaves the stage anywhere in z
+    stage.move_to(120*STAGE_SCALE, scale = False)
+    stage.wait_move()
+
+    batch = scheduler(stage, camera, rois, journal_path)
+    records = batch.run()
+    assert batch.n_resumed == 2
+    assert batch.meter.origin == origin
+    assert [record['id'] for record in records] == [2, 3]
+    for record in records:
+        assert abs(record['focus_patch'] - 150) < 15
+        assert abs(record['depth'] - 250) < 15
+
+
+def test_resume_without_origin(tmp_path):
+    journal_path = str(tmp_path/'journal.jsonl')
+    stage, camera, rois = simulated_cork()
+    with pytest.raises(Interruption):
+        scheduler(stage, camera, rois, journal_path, n_measures = 1).run()
+    with open(journal_path) as file:
+        lines = [line for line in file if json.loads(line)['type'] != 'origin']
+    with open(journal_path, 'w') as file:
+        file.writelines(lines)
+
+    with pytest.raises(ValueError):
+        scheduler(stage, camera, rois, journal_path).run()
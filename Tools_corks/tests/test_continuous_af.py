@@ -0,0 +1,73 @@
+# test_continuous_af.py
+
+"""
+Description: Convergence of the continuous autofocus on the simulated stage and camera.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import pytest
+
+from continuous_af import ContinuousAutofocus
+from conftest import simulated_cork
+
+
+@pytest.mark.parametrize('method', ['dither', 'hill_climb'])
+@pytest.mark.parametrize('start_um', [0, 100, 200])
+def test_default_configuration_locks(method, start_um):
+    stage, camera, rois = simulated_cork(position_um = start_um)
+    autofocus = ContinuousAutofocus(stage, camera, rois[1], method = method,
+                                    lock_um = 1.0 if method == 'dither' else 2.0)
+    for _ in range(60):
+        autofocus.step()
+    centers = np.array(autofocus.centers)[-20:]
+    # The patch (surface) is in focus at 150 um, the origin is the start position
+    assert autofocus.locked()
+    assert abs(start_um + autofocus.center - 150) < 3
+    assert centers.std() < 2
+
+
+@pytest.mark.parametrize('method', ['dither', 'hill_climb'])
+def test_follows_a_focus_change(method):
+    stage, camera, rois = simulated_cork(position_um = 100)
+    autofocus = ContinuousAutofocus(stage, camera, rois[1], method = method,
+                                    lock_um = 1.0 if method == 'dither' else 2.0)
+    for _ in range(60):
+        autofocus.step()
+    report = autofocus.report()
+    assert report['locked'] and report['n_iterations'] == 60
+    # Three frames per iteration with the dither, one with the hill climb
+    assert report['n_frames'] == (3 if method == 'dither' else 1)*60
+    assert report['relative_score'] > 0.8
+
+    # The surface comes 20 um closer, e.g. a tilted tray
+    camera.surface_focus_um = 170
+    for _ in range(60):
+        autofocus.step()
+    assert autofocus.locked()
+    assert abs(100 + autofocus.center - 170) < 3
+
+
+@pytest.mark.parametrize('method', ['dither', 'hill_climb'])
+def test_limits(method):
+    # The focus is 50 um from the start, past the upper limit
+    stage, camera, rois = simulated_cork(position_um = 100)
+    autofocus = ContinuousAutofocus(stage, camera, rois[1], method = method, limits_um = (-10, 30))
+    for _ in range(40):
+        autofocus.step()
+    assert all(-10 <= center <= 30 for center in autofocus.centers)
+    assert autofocus.center >= 29
+
+
+def test_background_loop():
+    stage, camera, rois = simulated_cork(position_um = 100)
+    autofocus = ContinuousAutofocus(stage, camera, rois[1], method = 'hill_climb', loop_rate = 200, lock_um = 2.0)
+    autofocus.start()
+    assert autofocus.wait_lock(timeout = 30)
+    autofocus.stop()
+    assert autofocus._thread is None
+    report = autofocus.report()
+    assert abs(100 + autofocus.center - 150) < 3
+    assert 0 < report['loop_rate'] < 1.1*200
+    assert report['latency_max'] >= report['latency_p95'] >= 0
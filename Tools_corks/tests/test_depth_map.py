@@ -0,0 +1,75 @@
+# test_depth_map.py
+
+"""
+Description: Height map and all-in-focus image of the simulated cork streamed from sweeps, against
+the surface and the hole bottom of the simulation.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import pytest
+
+from depth_map import DepthFromFocus, depth_map
+from focus_search import FocusSearch
+from pipeline import ScoringPipeline
+from conftest import simulated_cork, HOLE_CENTER
+
+
+def distance_to_hole(shape, tile=1):
+    """
+    Distance (pixels of the frames) of the center of each tile to the hole center.
+    """
+    yy, xx = np.mgrid[0:shape[0], 0:shape[1]]*tile + tile//2
+    return np.hypot(xx - HOLE_CENTER[0], yy - HOLE_CENTER[1])
+
+
+def sweep(um_step, tile=8, pipeline=None):
+    stage, camera, rois = simulated_cork()
+    search = FocusSearch(stage, camera, rois, settle_time = 0, pipeline = pipeline)
+    engine = DepthFromFocus(tile = tile)
+    result = depth_map(search, 550, um_step, engine = engine)
+    assert search.frame_sink is None
+    return result, engine, camera
+
+
+@pytest.mark.parametrize('tile', [1, 8])
+def test_height_map(tile):
+    result, engine, camera = sweep(10, tile)
+    height = result['height']
+    assert height.shape == (600//tile, 800//tile)
+    distance = distance_to_hole(height.shape, tile)
+    # Sub-step heights of the hole bottom (surface focus + hole depth) and of the surface
+    hole, surface = height[distance < 45], height[distance > 80]
+    assert np.percentile(np.abs(hole - 400), 99) < 1.5
+    assert np.percentile(np.abs(surface - 150), 99) < 1.5
+    assert result['depth'] == pytest.approx(250, abs = 0.5)
+
+
+def test_all_in_focus_image():
+    result, engine, camera = sweep(10)
+    image = result['all_in_focus']/255
+    assert result['all_in_focus'].dtype == np.uint8
+    distance = distance_to_hole(image.shape)
+    hole, surface = distance < 45, distance > 80
+    # Each region comes from the frames where it is in focus
+    for region, z_focus, z_other in ((hole, 400, 150), (surface, 150, 400)):
+        in_focus = np.abs(image - camera.render(z_focus))[region].mean()
+        assert in_focus < 0.02
+        assert in_focus < 0.2*np.abs(image - camera.render(z_other))[region].mean()
+
+
+def test_memory_independent_of_the_sweep_length():
+    coarse, coarse_engine, camera = sweep(10)
+    fine, fine_engine, camera = sweep(5)
+    assert fine['n_frames'] == 2*coarse['n_frames']
+    assert fine_engine.nbytes() == coarse_engine.nbytes()
+
+
+def test_pipelined_sweep():
+    pipeline = ScoringPipeline(n_workers = 2)
+    pipelined, engine, camera = sweep(10, pipeline = pipeline)
+    pipeline.close()
+    sequential, engine, camera = sweep(10)
+    assert np.array_equal(pipelined['height'], sequential['height'])
+    assert np.array_equal(pipelined['all_in_focus'], sequential['all_in_focus'])
@@ -0,0 +1,84 @@
+# test_dfd.py
+
+"""
+Description: Depth from defocus calibrated on sweeps of a simulated lot: accuracy of the confident
+estimates, with frames around the peaks and with frames too sparse to tell the flanks apart.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import pytest
+
+from dfd import DefocusModel, defocus_depth, accuracy_vs_sweeps
+from focus_search import FocusSearch
+from simulation import SimulatedCamera
+from conftest import simulated_cork, HOLE_CENTER
+
+# Frames around the expected peaks, and frames about one per peak
+DENSE_UM = [120, 150, 180, 370, 400, 430]
+SPARSE_UM = [100, 250, 400]
+
+
+def lot(n_corks, seed):
+    """
+    (surface focus, hole depth) of corks within 40 um of the nominal ones.
+    """
+    rng = np.random.default_rng(seed)
+    return [(150 + rng.uniform(-40, 40), 250 + rng.uniform(-40, 40)) for _ in range(n_corks)]
+
+
+def cork_camera(stage, surface_focus_um, hole_depth_um, seed):
+    return SimulatedCamera(stage, shape = (600, 800), hole_center = HOLE_CENTER, hole_depth_um = hole_depth_um,
+                           surface_focus_um = surface_focus_um, seed = seed, clock = stage.clock)
+
+
+@pytest.fixture(scope = 'module')
+def calibration():
+    stage, camera, rois = simulated_cork()
+    sweeps = []
+    for seed, (surface_focus_um, hole_depth_um) in enumerate(lot(8, 0)):
+        search = FocusSearch(stage, cork_camera(stage, surface_focus_um, hole_depth_um, seed), rois,
+                             settle_time = 0, peak_method = 'lorentzian')
+        sweeps.append(search.sweep(550, 5))
+    return stage, rois, sweeps
+
+
+def estimates(calibration, z_um):
+    stage, rois, sweeps = calibration
+    model = DefocusModel.calibrate(sweeps)
+    for seed, (surface_focus_um, hole_depth_um) in enumerate(lot(12, 1)):
+        search = FocusSearch(stage, cork_camera(stage, surface_focus_um, hole_depth_um, 100 + seed), rois,
+                             settle_time = 0)
+        result = defocus_depth(search, model, z_um, origin = 0)
+        yield result, np.abs(result['focus'] - [surface_focus_um + hole_depth_um, surface_focus_um])
+
+
+def test_frames_around_the_peaks(calibration):
+    n_confident = 0
+    for result, errors in estimates(calibration, DENSE_UM):
+        assert np.all(errors < 3)
+        n_confident += result['confident']
+    # A focus next to a frame may leave its flank ambiguous: a few corks are swept
+    assert n_confident >= 8
+
+
+def test_sparse_frames_are_confident_only_when_right(calibration):
+    n_confident = 0
+    for result, errors in estimates(calibration, SPARSE_UM):
+        # With one frame on a peak, the wrong flank fits about as well
+        if result['confident']:
+            assert np.all(errors < 5)
+            n_confident += 1
+        assert result['confident'] or np.any(result['flank_residual'] - result['residual'] < 0.005)
+    assert 0 < n_confident < 12
+
+
+def test_leave_one_out(calibration):
+    stage, rois, sweeps = calibration
+    dense = accuracy_vs_sweeps(sweeps, DENSE_UM)
+    assert dense['max'] < 3 and np.mean(dense['confident']) >= 0.5
+    sparse = accuracy_vs_sweeps(sweeps, SPARSE_UM)
+    assert sparse['max'] > 10
+    assert np.sum(sparse['confident']) < np.sum(dense['confident'])
+    assert np.isnan(sparse['max_confident']) or sparse['max_confident'] < 5
@@ -0,0 +1,29 @@
+# test_fly_sweep.py
+
+"""
+Description: Fly-through sweep on the simulated stage and camera sharing a virtual clock.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import pytest
+
+from fly_sweep import FlySweep
+from conftest import simulated_cork
+
+HOLE_DEPTH_UM = 250
+SURFACE_FOCUS_UM = 150
+
+
+@pytest.mark.parametrize('velocity_um_s', [250, 500])
+def test_fly_sweep_depth(velocity_um_s):
+    stage, camera, rois = simulated_cork(hole_depth_um = HOLE_DEPTH_UM, surface_focus_um = SURFACE_FOCUS_UM)
+    sweep = FlySweep(stage, camera, rois, peak_method = 'gaussian', clock = stage.clock)
+    result = sweep.run(500, velocity_um_s)
+    # One frame per exposure (8 ms) while the stage travels
+    assert abs(result['z_per_frame_um'] - velocity_um_s*0.008) < 0.5
+    assert abs(result['focus_patch'] - SURFACE_FOCUS_UM) < 2
+    assert abs(result['focus_hole'] - SURFACE_FOCUS_UM - HOLE_DEPTH_UM) < 2
+    assert abs(result['depth'] - HOLE_DEPTH_UM) < 2
+    assert stage.get_position() == 0
@@ -0,0 +1,54 @@
+# test_focus_search.py
+
+"""
+Description: Depth recovered by every focus search strategy on the simulated stage and camera,
+with and without backlash and in both sweep directions.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import pytest
+
+from focus_search import FocusSearch
+from pipeline import ScoringPipeline
+from conftest import simulated_cork
+
+HOLE_DEPTH_UM = 250
+SURFACE_FOCUS_UM = 150
+OPTIONS = {'sweep': {'um_step': 10},
+           'coarse_to_fine': {},
+           'golden_section': {},
+           'brent': {}}
+
+
+@pytest.mark.parametrize('strategy', list(OPTIONS))
+@pytest.mark.parametrize('backlash_um', [0, 8])
+@pytest.mark.parametrize('reverse', [False, True])
+def test_strategy_depth(strategy, backlash_um, reverse):
+    stage, camera, rois = simulated_cork(backlash_um = backlash_um, hole_depth_um = HOLE_DEPTH_UM,
+                                         surface_focus_um = SURFACE_FOCUS_UM)
+    # calibrate_backlash measures down - up focus, -backlash_um for a lagging carriage
+    search = FocusSearch(stage, camera, rois, settle_time = 0, peak_method = 'gaussian',
+                         backlash_um = -backlash_um)
+    result = search.search(strategy, 500, reverse = reverse, **OPTIONS[strategy])
+    # Positions are the ones of the motor moving up, the carriage lags by half the backlash
+    surface = SURFACE_FOCUS_UM + backlash_um/2
+    assert abs(result['focus'][1] - surface) < 2
+    assert abs(result['focus'][0] - surface - HOLE_DEPTH_UM) < 2
+    assert abs(result['depth'] - HOLE_DEPTH_UM) < 2
+
+
+@pytest.mark.parametrize('pipelined', [False, True])
+def test_coarse_pass_stops_once_bracketed(pipelined):
+    moves, last = {}, {}
+    for early_stop in (False, True):
+        stage, camera, rois = simulated_cork(hole_depth_um = HOLE_DEPTH_UM, surface_focus_um = SURFACE_FOCUS_UM)
+        pipeline = ScoringPipeline() if pipelined else None
+        search = FocusSearch(stage, camera, rois, settle_time = 0, pipeline = pipeline)
+        result = search.search('coarse_to_fine', 700, coarse_step = 60, early_stop = early_stop)
+        moves[early_stop], last[early_stop] = result['n_moves'], result['positions'].max()
+        assert abs(result['depth'] - HOLE_DEPTH_UM) < 2
+    # Both peaks are bracketed by the sample at 480 um (one frame later when pipelined),
+    # the full pass goes on to 660 um
+    assert last[False] == 660 and last[True] < 600
+    assert moves[True] < moves[False]
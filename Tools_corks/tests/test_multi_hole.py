@@ -0,0 +1,67 @@
+# test_multi_hole.py
+
+"""
+Description: Depths of several holes measured in a single sweep on the simulated stage and camera,
+and the clustering of their windows for the focus scores.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+
+from cork_meter import CorkMeter, LotEstimate
+from focus_search import FocusSearch, calculate_focus_score, calculate_focus_scores, crop, roi_clusters, square_roi
+from simulation import SimulatedStage, SimulatedCamera
+from conftest import VirtualClock
+
+CENTERS = [(200, 400), (600, 400)]
+DEPTHS = [250, 350]
+SURFACE_FOCUS_UM = 150
+
+
+def multi_hole_cork():
+    clock = VirtualClock()
+    stage = SimulatedStage(ringing = 0.0, clock = clock)
+    camera = SimulatedCamera(stage, shape = (600, 800), hole_center = CENTERS, hole_depth_um = DEPTHS,
+                             surface_focus_um = SURFACE_FOCUS_UM, seed = 1, clock = clock)
+    rois = []
+    for cx, cy in CENTERS:
+        rois += [square_roi(cx, cy, 50), square_roi(cx, cy, 100, offset = 130)]
+    return stage, camera, rois
+
+
+def test_depths_in_one_sweep():
+    stage, camera, rois = multi_hole_cork()
+    search = FocusSearch(stage, camera, rois, settle_time = 0, peak_method = 'gaussian')
+    result = search.search('sweep', 600, um_step = 10)
+    assert np.all(np.abs(result['depths'] - DEPTHS) < 2)
+    # One frame per position, whatever the number of holes
+    assert result['n_frames'] == len(result['positions'])
+
+
+def test_far_apart_holes_are_scored_apart():
+    stage, camera, rois = multi_hole_cork()
+    # The hole and patch of each cork are filtered together, the two holes apart
+    assert roi_clusters(rois) == ((0, 1), (2, 3))
+    image = (camera.get_image()*255).astype(np.uint8)
+    scores = calculate_focus_scores(image, rois, 5)
+    # Windows filtered alone give the score of their crop
+    single = [square_roi(400, 100, 50), square_roi(100, 500, 50)]
+    assert roi_clusters(single) == ((0,), (1,))
+    assert np.allclose(calculate_focus_scores(image, single, 5),
+                       [calculate_focus_score(crop(image, roi), 5) for roi in single])
+    assert np.all(scores > 0)
+
+
+def test_extra_hole_widens_the_window():
+    stage, camera, rois = multi_hole_cork()
+    warm_start = LotEstimate(min_corks = 2)
+    # Previous corks with only the first hole: the window ends about 45 um after its focus
+    for shift in (-1, 1):
+        warm_start.update({'focus': np.array([SURFACE_FOCUS_UM + DEPTHS[0], SURFACE_FOCUS_UM]) + shift})
+    meter = CorkMeter(stage, camera, depth_um = 600, search_options = {'um_step': 10},
+                      warm_start = warm_start, settle_time = 0, peak_method = 'gaussian')
+    result = meter.measure(rois)
+    assert result['n_widenings'] > 0
+    assert abs(result['focus'][2] - SURFACE_FOCUS_UM - DEPTHS[1]) < 2
+    assert np.all(np.abs(result['depths'] - DEPTHS) < 2)
@@ -0,0 +1,49 @@
+# test_nshots_study.py
+
+"""
+Description: Depth against the number of averaged shots from one stack captured on the simulated
+stage and camera.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import pytest
+
+from focus_search import FocusSearch, calculate_focus_score
+from nshots_study import capture_stack, batch_focus_scores, depth_vs_nshots, _peak_positions
+from conftest import simulated_cork
+
+N_MAX = 4
+
+
+@pytest.fixture(scope = 'module')
+def captured():
+    stage, camera, rois = simulated_cork(noise = 0.03)
+    search = FocusSearch(stage, camera, rois, settle_time = 0)
+    positions, stacks = capture_stack(search, 450, 10, N_MAX)
+    assert stage.get_position(scale = False) == search.init_position
+    return positions, stacks
+
+
+def test_batch_scores_match_the_sweep_scores(captured):
+    positions, stacks = captured
+    frames = stacks[0][:, 0]
+    expected = [calculate_focus_score(np.ascontiguousarray(frame), 5) for frame in frames]
+    assert np.allclose(batch_focus_scores(frames, 5), expected)
+
+
+@pytest.mark.parametrize('peak_method', ['interpolate', 'lorentzian'])
+def test_depth_vs_nshots(captured, peak_method):
+    positions, stacks = captured
+    study = depth_vs_nshots(positions, stacks, peak_method = peak_method)
+    assert list(study['n_shots']) == list(range(1, N_MAX + 1))
+    assert list(study['n_blocks']) == [4, 2, 1, 1]
+    assert np.all(np.isfinite(study['depth_std'][:2])) and np.all(np.isnan(study['depth_std'][2:]))
+    assert np.all(np.abs(study['depth'] - 250) < 5)
+
+    # N = N_MAX is the sweep of the averaged frames
+    for stack, focus in zip(stacks, (study['focus_hole'], study['focus_patch'])):
+        mean = stack.astype(np.float32).mean(axis = 1)
+        curve = batch_focus_scores(mean, 5)
+        assert np.isclose(focus[-1], _peak_positions(positions, curve, peak_method, 5, 500))
@@ -0,0 +1,82 @@
+# test_peak_fit.py
+
+"""
+Description: Sub-step peak localization on focus curves measured on the simulated stage and camera,
+sampled with a step wider than the focus peak.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import pytest
+
+from focus_search import FocusSearch
+from peak_fit import FIT_METHODS, fit_peak, locate_peaks
+from conftest import simulated_cork
+
+STEP_UM = 15
+# Hole bottom and surface of the simulated cork
+TRUTH = np.array([400, 150])
+
+
+@pytest.fixture(scope = 'module')
+def sweeps():
+    """
+    Focus curves sampled every STEP_UM with the samples at 5 offsets from the peaks.
+    """
+    stage, camera, rois = simulated_cork()
+    search = FocusSearch(stage, camera, rois, settle_time = 0)
+    curves = []
+    for start_um in range(0, STEP_UM, 3):
+        result = search.sweep(500, STEP_UM, start_um = start_um)
+        curves.append((result['positions'], result['scores']))
+    return curves
+
+
+def test_default_fit_between_samples(sweeps):
+    errors = np.array([locate_peaks(positions, scores)[0] - TRUTH for positions, scores in sweeps])
+    # The sampled maximum alone is off by up to half a step
+    assert np.sqrt(np.mean(errors**2)) < 1
+    assert np.abs(errors).max() < 1.5
+
+
+@pytest.mark.parametrize('method', sorted(FIT_METHODS))
+def test_confidence_intervals(sweeps, method):
+    for positions, scores in sweeps:
+        focus, focus_ci = locate_peaks(positions, scores, method = method)
+        assert np.all(np.isfinite(focus_ci))
+        assert np.all(np.abs(focus - TRUTH) < STEP_UM/2)
+        # The intervals hold the true focus, up to the error of the peak model
+        assert np.all(focus_ci[:, 0] - 1 < TRUTH) and np.all(TRUTH < focus_ci[:, 1] + 1)
+
+
+def test_vectorized_fits(sweeps):
+    positions, scores = sweeps[0]
+    for method in FIT_METHODS:
+        together = fit_peak(positions, scores.T, method)
+        for i, curve in enumerate(scores.T):
+            alone = fit_peak(positions, curve, method)
+            assert np.isclose(together['position'][i], alone['position'])
+            assert np.isclose(together['ci_high'][i], alone['ci_high'])
+
+
+def test_savgol_resamples_irregular_positions(sweeps):
+    positions, scores = sweeps[0]
+    jittered = positions + np.random.default_rng(0).uniform(-3, 3, len(positions))
+    stage, camera, rois = simulated_cork()
+    search = FocusSearch(stage, camera, rois, settle_time = 0)
+    search.reset()
+    for z in jittered:
+        search.evaluate(z)
+    focus, _ = locate_peaks(*search.measured(), method = 'savgol')
+    assert np.all(np.abs(focus - TRUTH) < 3)
+
+
+def test_edge_peak_falls_back_to_the_sampled_maximum(sweeps):
+    positions, scores = sweeps[0]
+    # Rising flank of the hole curve, cut before its peak
+    kept = (positions > 250) & (positions < 390)
+    for method in FIT_METHODS:
+        fit = fit_peak(positions[kept], scores[kept, 0], method)
+        assert fit['position'] == positions[kept][np.argmax(scores[kept, 0])]
+        assert np.isinf(fit['sigma'])
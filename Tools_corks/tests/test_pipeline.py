@@ -0,0 +1,68 @@
+# test_pipeline.py
+
+"""
+Description: Pipelined sweeps: same measurement as the sequential sweeps on the simulated stage and
+camera, with the scoring overlapped with the motion and acquisition.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import time
+
+from focus_search import FocusSearch
+from pipeline import ScoringPipeline
+from conftest import simulated_cork
+
+
+def test_pipelined_sweep_matches_the_sequential_one():
+    results = []
+    pipeline = ScoringPipeline(n_workers = 2)
+    for pipelined in (False, True):
+        stage, camera, rois = simulated_cork()
+        search = FocusSearch(stage, camera, rois, settle_time = 0, peak_method = 'lorentzian',
+                             pipeline = pipeline if pipelined else None)
+        results.append(search.sweep(450, 10))
+        assert stage.get_position(scale = False) == search.init_position
+    pipeline.close()
+    sequential, pipelined = results
+    # Same frames (the noise is drawn in the order of the frames) and same scores
+    assert np.array_equal(sequential['positions'], pipelined['positions'])
+    assert np.allclose(sequential['scores'], pipelined['scores'])
+    assert np.allclose(sequential['focus'], pipelined['focus'])
+    assert pipelined['n_frames'] == sequential['n_frames'] == 45
+    assert pipeline.report()['n_items'] == 45
+
+
+def test_scoring_overlaps_motion():
+    delay = 0.01
+    pipeline = ScoringPipeline(n_workers = 2)
+    positions = list(range(20))
+    # Scoring times out of order: the results still follow the positions
+    durations = np.random.default_rng(0).uniform(0.5, 1.5, len(positions))*delay
+
+    def score(position):
+        time.sleep(durations[position])
+        return position
+
+    t_start = time.perf_counter()
+    results = pipeline.run(positions, lambda position: time.sleep(delay), lambda position: position, score)
+    wall_time = time.perf_counter() - t_start
+    pipeline.close()
+    assert results == positions
+    # Sequential steps would take the motion plus the scoring time
+    assert wall_time < 0.8*(delay*len(positions) + durations.sum())
+    report = pipeline.report()
+    assert report['bottleneck'] == 'motion'
+    assert report['utilization']['motion'] > 0.8
+
+
+def test_until_skips_the_remaining_positions():
+    pipeline = ScoringPipeline(n_workers = 1)
+    moved = []
+    results = pipeline.run(range(10), moved.append, lambda position: position, lambda payload: payload,
+                           until = lambda results: len(results) >= 4)
+    pipeline.close()
+    # The frame in the workers is waited for before stopping
+    assert results == moved == list(range(len(moved)))
+    assert 4 <= len(moved) <= 5
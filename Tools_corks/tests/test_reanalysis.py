@@ -0,0 +1,35 @@
+# test_reanalysis.py
+
+"""
+Description: Re-analysis of sweeps archived on the simulated stage and camera, with full resolution
+and binned frames.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import pytest
+
+from focus_search import FocusSearch
+from reanalysis import record_sweep, analyze_stack, load_stack
+from conftest import simulated_cork
+
+
+@pytest.mark.parametrize('binning', [1, 2])
+def test_reanalysis_of_an_archived_sweep(tmp_path, binning):
+    folder = str(tmp_path/'cork')
+    stage, camera, rois = simulated_cork()
+    search = FocusSearch(stage, camera, rois, settle_time = 0, coarse_binning = binning)
+    result = record_sweep(search, folder, 450, 10, meta = {'true_depth': 250})
+    frames, positions, meta = load_stack(folder)
+    assert frames.shape == (len(positions), 600//binning, 800//binning)
+    assert meta['binning'] == binning
+
+    # The ROIs, archived or given, are in full resolution coordinates
+    analyses = analyze_stack(folder, [{'peak_method': None}, {'peak_method': None, 'rois': rois},
+                                      {'peak_method': 'gaussian'}])
+    for analysis in analyses[:2]:
+        assert np.allclose(analysis['focus'], result['focus'])
+        # Same curves up to the borders of the filtered windows
+        assert np.allclose(analysis['scores'].max(axis = 0), result['scores'].max(axis = 0), rtol = 0.2)
+    assert abs(analyses[2]['error']) < 5
@@ -0,0 +1,43 @@
+# test_roi_tracking.py
+
+"""
+Description: ROIs following the lateral drift of the image during a sweep on the simulated stage and
+camera.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+
+from focus_search import FocusSearch
+from roi_tracking import RoiTracker
+from conftest import simulated_cork
+
+DRIFT_PX_PER_UM = (0.1, -0.06)
+
+
+def sweep(drift_px_per_um, tracker):
+    stage, camera, rois = simulated_cork(drift_px_per_um = drift_px_per_um)
+    search = FocusSearch(stage, camera, rois, settle_time = 0, tracker = tracker, peak_method = 'lorentzian')
+    return search.sweep(450, 10)
+
+
+def test_rois_follow_the_drift():
+    result = sweep(DRIFT_PX_PER_UM, RoiTracker())
+    # One offset per position after the first, which gives the template
+    positions, offsets = result['positions'], result['roi_offsets']
+    assert len(offsets) == len(positions) - 1
+    expected = np.outer(positions[1:], DRIFT_PX_PER_UM)
+    assert np.all(np.abs(offsets - expected) <= 0.1*np.abs(expected) + 1)
+    assert abs(result['depth'] - 250) < 0.5
+
+    # The hole drifts out of the fixed windows
+    fixed = sweep(DRIFT_PX_PER_UM, None)
+    assert abs(fixed['depth'] - 250) > 2*abs(result['depth'] - 250)
+    assert fixed['scores'][:, 0].max() < result['scores'][:, 0].max()
+
+
+def test_no_drift_keeps_the_rois():
+    result = sweep((0.0, 0.0), RoiTracker())
+    assert np.all(np.abs(result['roi_offsets']) < 1)
+    assert abs(result['depth'] - 250) < 0.5
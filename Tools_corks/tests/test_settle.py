@@ -0,0 +1,55 @@
+# test_settle.py
+
+"""
+Description: Noise calibration and settle detection of SettleDetector on the simulated stage and
+camera, with the carriage ringing after each move.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+from focus_search import square_roi
+from settle import SettleDetector
+from simulation import SimulatedStage, SimulatedCamera, STAGE_SCALE
+from conftest import VirtualClock, HOLE_CENTER
+
+SURFACE_FOCUS_UM = 150
+
+
+def settle_setup(position_um, ringing=1.0):
+    clock = VirtualClock()
+    stage = SimulatedStage(position = position_um*STAGE_SCALE, ringing = ringing, clock = clock)
+    camera = SimulatedCamera(stage, shape = (600, 800), hole_center = HOLE_CENTER,
+                             surface_focus_um = SURFACE_FOCUS_UM, seed = 1, clock = clock)
+    cx, cy = HOLE_CENTER
+    detector = SettleDetector(camera, roi = square_roi(cx, cy, 100, offset = 130), clock = clock)
+    return stage, detector
+
+
+def test_first_wait_calibrates_at_rest():
+    stage, detector = settle_setup(200)
+    noise = detector.calibrate()
+    # Through the focus of the surface, where the image changes the most while moving
+    stage, detector = settle_setup(120)
+    stage.move_by(60*STAGE_SCALE)
+    detector.wait(stage)
+    assert abs(detector.noise/noise - 1) < 0.1
+
+    stage, detector = settle_setup(120)
+    stage.move_by(60*STAGE_SCALE)
+    # Calibrated during the motion the noise floor includes the motion blur
+    assert detector.calibrate() > 1.2*noise
+
+
+def test_wait_outlasts_the_ringing():
+    stage, detector = settle_setup(140, ringing = 1000)
+    detector.calibrate()
+    stage.move_by(10*STAGE_SCALE)
+    stage.wait_move()
+    amplitude = abs(stage.actual_position()/STAGE_SCALE - SURFACE_FOCUS_UM)
+    n_frames = detector.n_frames
+    detector.wait(stage)
+    assert abs(stage.actual_position()/STAGE_SCALE - SURFACE_FOCUS_UM) < amplitude/5
+    # More frames than the two of a still image, timed on the stage clock
+    assert detector.n_frames - n_frames > 2
+    assert 0 < detector.settle_times[-1] < detector.max_wait
+    assert detector.report()['n_steps'] == 1
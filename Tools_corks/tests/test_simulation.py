@@ -0,0 +1,137 @@
+# test_simulation.py
+
+"""
+Description: Motion of the simulated stage against the closed forms of the controller profile:
+timing, quantization, backlash, settle ringing, reversals and stops, and the camera seeing the
+carriage.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import pytest
+
+from simulation import SimulatedStage, SimulatedCamera, STAGE_SCALE
+from conftest import VirtualClock, HOLE_CENTER
+
+ACCELERATION = 4096000
+MAX_VELOCITY = 409600
+# Polling period of wait_move on the virtual clock
+POLL = 0.001
+
+
+def stage_at_rest(**options):
+    clock = VirtualClock()
+    return SimulatedStage(acceleration = ACCELERATION, max_velocity = MAX_VELOCITY, clock = clock, **options), clock
+
+
+@pytest.mark.parametrize('distance', [4096, 40960, 409600])
+def test_move_duration(distance):
+    stage, clock = stage_at_rest(ringing = 0.0)
+    stage.move_to(distance)
+    assert stage.is_moving()
+    stage.wait_move()
+    # Triangular profile below the max velocity, trapezoidal above
+    if distance < MAX_VELOCITY**2/ACCELERATION:
+        duration = 2*np.sqrt(distance/ACCELERATION)
+    else:
+        duration = distance/MAX_VELOCITY + MAX_VELOCITY/ACCELERATION
+    assert duration <= clock.t < duration + 2*POLL
+    assert stage.get_position() == stage.actual_position() == distance
+
+
+def test_positions_are_whole_counts():
+    stage, clock = stage_at_rest(ringing = 0.0)
+    stage.move_to(100.4)
+    clock.sleep(0.0005)
+    # The encoder reads whole counts during the move, the carriage is in between
+    assert stage.get_position() == round(stage.get_position())
+    assert stage.actual_position() != round(stage.actual_position())
+    stage.wait_move()
+    assert stage.get_position() == 100
+    stage.move_by(0.6)
+    stage.wait_move()
+    assert stage.get_position() == 101
+
+
+def test_backlash():
+    backlash = 3*STAGE_SCALE
+    stage, clock = stage_at_rest(ringing = 0.0, backlash = backlash)
+    stage.move_to(10000)
+    stage.wait_move()
+    from_below = stage.actual_position()
+    stage.move_to(20000)
+    stage.wait_move()
+    stage.move_to(10000)
+    stage.wait_move()
+    from_above = stage.actual_position()
+    # Same encoder reading, the carriage lags behind the motor on each side
+    assert stage.get_position() == 10000
+    assert from_below == pytest.approx(10000 - backlash/2)
+    assert from_above == pytest.approx(10000 + backlash/2)
+
+
+def test_settle_ringing():
+    stage, clock = stage_at_rest()
+    stage.move_to(409600)
+    stage.wait_move()
+    assert not stage.is_moving() and stage.get_position() == 409600
+    deviations = []
+    for _ in range(200):
+        deviations.append(stage.actual_position() - 409600)
+        clock.sleep(0.0005)
+    deviations = np.abs(deviations)
+    # Spring loaded by the deceleration, decaying with ringing_time
+    amplitude = ACCELERATION/(2*np.pi*stage.resonance_hz)**2
+    assert 0.5*amplitude < deviations[:40].max() <= amplitude
+    assert deviations[-20:].max() < 0.01*amplitude
+
+    # ringing = 0 disables it
+    stage, clock = stage_at_rest(ringing = 0.0)
+    stage.move_to(409600)
+    stage.wait_move()
+    assert stage.actual_position() == 409600
+
+
+def test_reversal_decelerates_first():
+    stage, clock = stage_at_rest(ringing = 0.0)
+    stage.move_to(409600)
+    clock.sleep(0.2)
+    position = stage.get_position()
+    stage.move_to(0)
+    trajectory = []
+    while stage.is_moving():
+        trajectory.append(stage.get_position())
+        clock.sleep(POLL)
+    # At max velocity after 0.2 s: stops v^2/(2a) further before coming back
+    assert max(trajectory) == pytest.approx(position + MAX_VELOCITY**2/(2*ACCELERATION), abs = 1)
+    assert stage.get_position() == 0
+
+
+def test_profiled_stop():
+    stage, clock = stage_at_rest(ringing = 0.0)
+    stage.move_to(10*409600)
+    clock.sleep(0.3)
+    position = stage.get_position()
+    stage.stop()
+    assert stage.get_position() == pytest.approx(position + MAX_VELOCITY**2/(2*ACCELERATION), abs = 1)
+
+    stage.move_to(0)
+    clock.sleep(0.3)
+    position = stage.get_position()
+    stage.stop(immediate = True)
+    assert not stage.is_moving() and stage.get_position() == position
+
+
+def test_camera_sees_the_carriage():
+    stage, clock = stage_at_rest(ringing = 0.0, backlash = 20*STAGE_SCALE)
+    camera = SimulatedCamera(stage, shape = (600, 800), hole_center = HOLE_CENTER, noise = 0.0,
+                             exposure = 8000, clock = clock)
+    stage.move_to(160*STAGE_SCALE)
+    stage.wait_move()
+    # The carriage lags backlash/2 behind the motor: the surface (150 um) is in focus, not 10 um off
+    t_start = clock.t
+    image = camera.get_image()
+    assert clock.t - t_start == pytest.approx(8000E-6)
+    assert np.allclose(image, np.clip(camera.render(stage.actual_position()/STAGE_SCALE), 0, 1))
+    assert not np.allclose(image, np.clip(camera.render(160), 0, 1))
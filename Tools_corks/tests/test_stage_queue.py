@@ -0,0 +1,97 @@
+# test_stage_queue.py
+
+"""
+Description: Threaded command queue of StageController on the simulated stage (real clock: the
+worker thread polls the stage while it moves).
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import time
+import pytest
+from concurrent.futures import CancelledError
+
+from simulation import SimulatedStage, STAGE_SCALE
+from stage_queue import StageController
+
+
+@pytest.fixture
+def controller():
+    stage = SimulatedStage(ringing = 0.0)
+    controller = StageController(stage, poll_interval = 0.002)
+    yield stage, controller
+    controller.close()
+
+
+def wait_position(controller, position, timeout=5):
+    """
+    Waits until the polled position passes position (a move has started).
+    """
+    t_end = time.perf_counter() + timeout
+    while controller.get_position() < position:
+        assert time.perf_counter() < t_end
+        time.sleep(0.001)
+
+
+def test_move_futures(controller):
+    stage, controller = controller
+    future = controller.move_to(10*STAGE_SCALE)
+    assert controller.is_moving()
+    assert abs(future.result(timeout = 5) - 10*STAGE_SCALE) <= controller.tolerance
+    assert controller.wait_move(timeout = 5)
+    assert controller.get_position() == stage.get_position()
+
+
+def test_waiting_moves_are_coalesced(controller):
+    stage, controller = controller
+    first = controller.move_to(200*STAGE_SCALE)
+    wait_position(controller, 1)
+    # Sent one after the other while the first move runs: a single move of 30 um
+    later = [controller.move_by(10*STAGE_SCALE) for _ in range(3)]
+    assert controller.wait_move(timeout = 10)
+    assert abs(first.result() - 200*STAGE_SCALE) <= controller.tolerance
+    results = [future.result() for future in later]
+    assert results == [results[0]]*3
+    assert abs(results[0] - 230*STAGE_SCALE) <= controller.tolerance
+    assert controller.n_coalesced == 2
+    assert controller.n_sent == 2
+
+
+def test_stop_completes_where_the_stage_halts(controller):
+    stage, controller = controller
+    move = controller.move_to(1000*STAGE_SCALE)
+    wait_position(controller, 1)
+    waiting = controller.move_by(10*STAGE_SCALE)
+    wait_position(controller, 100*STAGE_SCALE)
+    stop = controller.stop()
+    halted = stop.result(timeout = 5)
+    assert waiting.cancelled()
+    with pytest.raises(CancelledError):
+        waiting.result()
+    # The interrupted move completes with the stop, both where the stage stopped
+    assert move.result(timeout = 5) == halted
+    assert halted == stage.get_position()
+    assert 100*STAGE_SCALE < halted < 1000*STAGE_SCALE
+    assert not controller.is_moving()
+
+
+def test_jog_reports_the_position_when_sent(controller):
+    stage, controller = controller
+    controller.move_to(50*STAGE_SCALE).result(timeout = 5)
+    jog = controller.jog(1)
+    assert jog.result(timeout = 5) >= 50*STAGE_SCALE
+    wait_position(controller, 60*STAGE_SCALE)
+    halted = controller.stop().result(timeout = 5)
+    assert halted > jog.result() and halted == stage.get_position()
+
+
+def test_close_cancels_waiting_commands():
+    stage = SimulatedStage(ringing = 0.0)
+    controller = StageController(stage)
+    controller.move_to(1000*STAGE_SCALE)
+    waiting = controller.move_by(10*STAGE_SCALE)
+    controller.close()
+    assert waiting.cancelled()
+    assert not controller._thread.is_alive()
+    with pytest.raises(AssertionError):
+        controller.move_by(10*STAGE_SCALE)
@@ -0,0 +1,114 @@
+# test_tracing.py
+
+"""
+Description: Spans of the tracer, recorded by sweeps and batches on the simulated stage and camera,
+exported as Chrome trace json and summarized per phase.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import json
+import threading
+
+from batch import BatchScheduler
+from cork_meter import CorkMeter
+from focus_search import FocusSearch
+from pipeline import ScoringPipeline
+from simulation import SimulatedStage
+from tracing import Tracer, PhaseSummary, tracer
+from conftest import simulated_cork
+
+
+def test_spans():
+    local = Tracer(max_events = 3)
+    with local.span('outer', z_um = 10):
+        with local.span('inner'):
+            pass
+    events = local.collect()
+    assert local.collect() == []
+    # Spans are recorded when they end, the inner one first
+    (inner, t_inner, t_inner_end, ident, args), (outer, t_start, t_end, ident, outer_args) = events
+    assert (inner, outer) == ('inner', 'outer') and outer_args == {'z_um': 10}
+    assert t_start <= t_inner <= t_inner_end <= t_end
+    assert ident == threading.get_ident()
+
+    # Only the last max_events are kept
+    for k in range(5):
+        local.add(str(k), 0.0, 1.0)
+    assert [event[0] for event in local.collect()] == ['2', '3', '4']
+
+    disabled = Tracer(enabled = False)
+    with disabled.span('outer'):
+        disabled.add('interval', 0.0, 1.0)
+    assert disabled.collect() == []
+
+
+def test_sweep_phases_match_the_timings():
+    stage, camera, rois = simulated_cork()
+    search = FocusSearch(stage, camera, rois, settle_time = 0)
+    tracer.collect()
+    result = search.sweep(450, 15)
+    events = tracer.collect()
+    for phase, duration in result['timings'].items():
+        spans = [t_end - t_start for name, t_start, t_end, ident, args in events if name == phase]
+        assert np.isclose(sum(spans), duration)
+    names = [event[0] for event in events]
+    assert names.count('acquire') == names.count('compute') == result['n_frames']
+    assert names.count('motion') == result['n_frames']
+
+
+def test_pipelined_scoring_in_the_worker_threads():
+    stage, camera, rois = simulated_cork()
+    pipeline = ScoringPipeline(n_workers = 2)
+    search = FocusSearch(stage, camera, rois, settle_time = 0, pipeline = pipeline)
+    tracer.collect()
+    result = search.sweep(450, 15)
+    pipeline.close()
+    events = tracer.collect()
+    workers = {ident for name, t_start, t_end, ident, args in events if name == 'compute'}
+    assert len([event for event in events if event[0] == 'compute']) == result['n_frames']
+    assert threading.get_ident() not in workers
+    # The threads are named in the trace
+    trace = tracer.chrome_events(events)
+    named = {event['tid'] for event in trace if event['ph'] == 'M'}
+    assert workers <= named
+
+
+def test_batch_traces(tmp_path):
+    stage, camera, rois = simulated_cork()
+    meter = CorkMeter(stage, camera, depth_um = 450, search_options = {'um_step': 15}, settle_time = 0)
+    batch = BatchScheduler(meter, SimulatedStage(clock = stage.clock), SimulatedStage(clock = stage.clock),
+                           [[0, 0], [1000, 0]], rois = [rois]*2, ids = ['a', 'b'], optimize = False,
+                           trace_dir = str(tmp_path))
+    batch.run()
+    for cork_id, result in zip(['a', 'b'], meter.results):
+        with open(tmp_path/('cork_' + cork_id + '.json')) as file:
+            trace = json.load(file)
+        assert trace['otherData'] == {'id': cork_id, 'depth': str(result['depth'])}
+        spans = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+        # Each trace holds the spans of its cork only, inside its cork span (us)
+        cork, = [event for event in spans if event['name'] == 'cork']
+        assert cork['args'] == {'id': cork_id}
+        for event in spans:
+            assert cork['ts'] <= event['ts'] and event['ts'] + event['dur'] <= cork['ts'] + cork['dur'] + 1E-3
+        assert sum(event['name'] == 'acquire' for event in spans) == result['n_frames']
+
+    phases = batch.report()['phases']
+    assert phases['cork']['count'] == 2
+    assert phases['acquire']['count'] == sum(result['n_frames'] for result in meter.results)
+    # Nested spans are also counted in their parents
+    assert phases['cork']['total'] >= phases['search']['total'] >= phases['acquire']['total']
+    assert np.isclose(phases['cork']['per_trace'], phases['cork']['total']/2)
+
+
+def test_phase_summary():
+    summary = PhaseSummary()
+    summary.update([('a', 0.0, 1.0, 0, {}), ('b', 0.0, 2.5, 0, {})])
+    summary.update([('a', 0.0, 2.0, 0, {})])
+    report = summary.report()
+    # Largest total first
+    assert list(report) == ['a', 'b']
+    assert report['a'] == {'count': 2, 'total': 3.0, 'per_trace': 1.5, 'mean': 1.5,
+                           'p95': np.percentile([1.0, 2.0], 95), 'max': 2.0}
+    assert report['b']['per_trace'] == 1.25
@@ -0,0 +1,60 @@
+# test_warm_start.py
+
+"""
+Description: Warm-started sweeps of a lot of corks on the simulated stage and camera: narrow windows
+once the lot is known, widened for a cork out of the lot.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+
+from cork_meter import CorkMeter, LotEstimate
+from simulation import SimulatedCamera
+from conftest import simulated_cork, HOLE_CENTER
+
+# (surface focus, hole depth) of the corks of the lot
+LOT = [(150, 250), (155, 245), (146, 255), (152, 248), (148, 252), (151, 251)]
+
+
+def cork_camera(stage, surface_focus_um, hole_depth_um, seed):
+    return SimulatedCamera(stage, shape = (600, 800), hole_center = HOLE_CENTER, hole_depth_um = hole_depth_um,
+                           surface_focus_um = surface_focus_um, seed = seed, clock = stage.clock)
+
+
+def measure_lot(lot, warm_start):
+    stage, camera, rois = simulated_cork()
+    meter = CorkMeter(stage, camera, depth_um = 600, search_options = {'um_step': 10},
+                      warm_start = warm_start, settle_time = 0, peak_method = 'lorentzian')
+    for seed, (surface_focus_um, hole_depth_um) in enumerate(lot):
+        meter.camera = cork_camera(stage, surface_focus_um, hole_depth_um, seed)
+        result = meter.measure(rois)
+        assert abs(result['focus_patch'] - surface_focus_um) < 1
+        assert abs(result['depth'] - hole_depth_um) < 1
+    return meter
+
+
+def test_narrow_windows_once_the_lot_is_known():
+    warm_start = LotEstimate(min_corks = 3)
+    meter = measure_lot(LOT, warm_start)
+    windows = [result['window'] for result in meter.results]
+    assert all(window == (0.0, 600) for window in windows[:3])
+    for start, end in windows[3:]:
+        assert 0 < start < 146 and 405 < end < 600
+        assert end - start < 400
+    assert meter.batch_report()['n_widenings'] == 0
+
+    summary = warm_start.summary()
+    assert summary['n_corks'] == len(LOT)
+    assert abs(summary['depth'] - np.mean([depth for surface, depth in LOT])) < 1
+    assert abs(summary['depth_std'] - np.std([depth for surface, depth in LOT], ddof = 1)) < 1
+
+    n_frames = [result['n_frames'] for result in meter.results]
+    assert max(n_frames[3:]) < 0.6*min(n_frames[:3])
+
+
+def test_cork_out_of_the_lot_widens_the_window():
+    # The last hole is 120 um deeper than the others
+    meter = measure_lot(LOT[:4] + [(150, 370)], LotEstimate(min_corks = 3))
+    assert meter.results[-1]['n_widenings'] > 0
+    assert meter.results[-1]['window'][1] > 520
@@ -0,0 +1,140 @@
+# tracing.py
+
+"""
+Description: Span based tracing of the measurements (stage moves, settling, frame grabs, scoring,
+peak fitting, ...), exported as Chrome trace / Perfetto json and summarized per phase.
+Date Created: 19/10/2026
+Python Version: 3.8.13
+"""
+
+import numpy as np
+import os
+import json
+import time
+import threading
+from collections import deque
+
+
+class Span():
+    __slots__ = ('tracer', 'name', 'args', 't_start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.t_start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.add(self.name, self.t_start, time.perf_counter(), **self.args)
+
+
+class NullSpan():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer():
+    """
+    Records spans (name, start, end, thread, args) in memory.
+
+    with tracer.span('phase', key = value): ... records the time spent in the block,
+    tracer.add(name, t_start, t_end) records an interval measured elsewhere (perf_counter
+    times). A span costs a few microseconds, and almost nothing when the tracer is disabled;
+    at most max_events are kept (the oldest ones are dropped), so it can stay on in
+    production as long as someone collects the events now and then (e.g. per cork).
+    """
+
+    def __init__(self, enabled=True, max_events=100000):
+        self.enabled = enabled
+        self.events = deque(maxlen = max_events)
+        self.t0 = time.perf_counter()
+        self.pid = os.getpid()
+        self.thread_names = {}
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def add(self, name, t_start, t_end=None, **args):
+        if not self.enabled:
+            return
+        t_end = time.perf_counter() if t_end is None else t_end
+        thread = threading.current_thread()
+        self.thread_names[thread.ident] = thread.name
+        self.events.append((name, t_start, t_end, thread.ident, args))
+
+    def collect(self):
+        """
+        Returns the events recorded so far and clears them.
+        """
+        events = list(self.events)
+        self.events.clear()
+        return events
+
+    def chrome_events(self, events):
+        """
+        Events in the Chrome trace event format (complete events, times in us).
+        """
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': ident, 'args': {'name': name}}
+                 for ident, name in self.thread_names.items()]
+        for name, t_start, t_end, ident, args in events:
+            trace.append({'name': name, 'ph': 'X', 'pid': self.pid, 'tid': ident,
+                          'ts': (t_start - self.t0)*1E6, 'dur': (t_end - t_start)*1E6,
+                          'args': {key: str(value) for key, value in args.items()}})
+        return trace
+
+    def write(self, path, events=None, **metadata):
+        """
+        Writes events (the collected ones if None) as a Chrome trace json file, which
+        opens in chrome://tracing and ui.perfetto.dev. Returns the events written.
+        """
+        events = self.collect() if events is None else events
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': self.chrome_events(events),
+                       'displayTimeUnit': 'ms',
+                       'otherData': {key: str(value) for key, value in metadata.items()}}, file)
+        return events
+
+
+class PhaseSummary():
+    """
+    Time per span name accumulated over many traces (e.g. the corks of a batch).
+    Nested spans are also counted in their parents.
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self.n_traces = 0
+
+    def update(self, events):
+        for name, t_start, t_end, ident, args in events:
+            self.durations.setdefault(name, []).append(t_end - t_start)
+        self.n_traces += 1
+
+    def report(self):
+        """
+        Count, total, mean, p95 and max (s) of each phase, and total per trace.
+        """
+        report = {}
+        for name, durations in sorted(self.durations.items(), key = lambda item: -sum(item[1])):
+            durations = np.array(durations)
+            report[name] = {'count': len(durations),
+                            'total': float(durations.sum()),
+                            'per_trace': float(durations.sum())/max(self.n_traces, 1),
+                            'mean': float(durations.mean()),
+                            'p95': float(np.percentile(durations, 95)),
+                            'max': float(durations.max())}
+        return report
+
+
+tracer = Tracer()